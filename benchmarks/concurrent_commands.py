@@ -0,0 +1,74 @@
+"""
+Throughput of commands run from many threads at once
+
+Each thread runs a program which does nothing as fast as it can, with
+SubprocessBackend, PosixSpawnBackend and ForkServerBackend, and the
+commands completed per second by all threads together are reported. Run
+from the repository root:
+
+    PYTHONPATH=. python benchmarks/concurrent_commands.py [-t THREADS [THREADS ...]] [-n CALLS]
+"""
+
+import argparse
+import shutil
+import threading
+import time
+
+import pyzfscmds.backend
+import pyzfscmds.forkserver
+
+
+def throughput(backend: pyzfscmds.backend.Backend, argv: list, threads: int,
+               calls: int) -> float:
+    """
+    Commands per second with threads each running calls commands
+    """
+    start_barrier = threading.Barrier(threads + 1)
+
+    def worker():
+        start_barrier.wait()
+        for _ in range(calls):
+            backend.run(argv)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+
+    start_barrier.wait()
+    start = time.perf_counter()
+    for thread in workers:
+        thread.join()
+
+    return threads * calls / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-t", "--threads", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("-n", "--calls", type=int, default=50, help="commands per thread")
+    args = parser.parse_args()
+
+    argv = [shutil.which("true") or "/bin/true"]
+    fork_server = pyzfscmds.forkserver.ForkServerBackend()
+
+    backends = [
+        ("SubprocessBackend", pyzfscmds.backend.SubprocessBackend()),
+        ("PosixSpawnBackend", pyzfscmds.backend.PosixSpawnBackend()),
+        ("ForkServerBackend", fork_server),
+    ]
+
+    # Start the server outside the measurement
+    fork_server.run(argv)
+
+    print(f"{'backend':<20} {'threads':>8} {'commands/s':>12}")
+    try:
+        for threads in args.threads:
+            for name, backend in backends:
+                rate = throughput(backend, argv, threads, args.calls)
+                print(f"{name:<20} {threads:>8} {rate:>12.0f}")
+    finally:
+        fork_server.close()
+
+
+if __name__ == "__main__":
+    main()
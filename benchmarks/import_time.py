@@ -0,0 +1,62 @@
+"""
+Import time of pyzfscmds modules
+
+Each module is imported in a fresh interpreter with -X importtime and the
+cumulative time python reports for it is collected. Bytecode is written
+by an untimed first import, so compiling the sources is not measured even
+with PYTHONDONTWRITEBYTECODE set. Run from the repository root:
+
+    python benchmarks/import_time.py [-n RUNS] [module...]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+MODULES = ["pyzfscmds.cmd", "pyzfscmds.utility", "pyzfscmds.check",
+           "pyzfscmds.system.agnostic", "pyzfscmds.logger"]
+
+
+def _environment() -> dict:
+    """
+    Environment of the measured interpreters, which may write bytecode
+    """
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    return env
+
+
+def import_time(module: str) -> float:
+    """
+    Cumulative import time of module in microseconds, in a new interpreter
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            universal_newlines=True, check=True, env=_environment())
+
+    for line in result.stderr.splitlines():
+        fields = [f.strip() for f in line.split("|")]
+        if len(fields) == 3 and fields[2] == module:
+            return float(fields[1])
+
+    raise RuntimeError(f"No import time reported for {module}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--runs", type=int, default=20)
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    args = parser.parse_args()
+
+    print(f"{'module':<30} {'min ms':>8} {'median ms':>10}")
+    for module in args.modules:
+        # Compile and cache the bytecode of module and its imports
+        import_time(module)
+        times = [import_time(module) / 1000 for _ in range(args.runs)]
+        print(f"{module:<30} {min(times):>8.2f} {statistics.median(times):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
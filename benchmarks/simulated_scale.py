@@ -0,0 +1,104 @@
+"""
+pyzfscmds commands against a large simulated pool
+
+A pool of filesystems grouped under a hundred parents is built with
+SimulatedBackend, each filesystem gets the same number of snapshots, and
+common commands are timed end to end, from building argv to parsing the
+output. Run from the repository root:
+
+    PYTHONPATH=. python benchmarks/simulated_scale.py [-d DATASETS] [-s SNAPSHOTS] [-n RUNS]
+"""
+
+import argparse
+import resource
+import statistics
+import time
+
+import pyzfscmds.backend
+import pyzfscmds.cmd
+import pyzfscmds.simulate
+
+POOL = "bench"
+GROUPS = 100
+
+
+def build(datasets: int, snapshots: int) -> dict:
+    """
+    Create the pool with commands, returning seconds taken by each step
+    """
+    backend = pyzfscmds.simulate.SimulatedBackend()
+    backend.create_pool(POOL)
+    pyzfscmds.backend.set_backend(backend)
+
+    start = time.perf_counter()
+    for i in range(datasets):
+        if i % GROUPS == 0:
+            pyzfscmds.cmd.zfs_create_dataset(f"{POOL}/g{i // GROUPS}")
+        pyzfscmds.cmd.zfs_create_dataset(f"{POOL}/g{i // GROUPS}/d{i % GROUPS}")
+    created = time.perf_counter()
+
+    rounds = max(1, snapshots // datasets)
+    for i in range(rounds):
+        pyzfscmds.cmd.zfs_snapshot(POOL, f"s{i}", recursive=True)
+    snapshotted = time.perf_counter()
+
+    return {"zfs create": created - start, "zfs snapshot -r": snapshotted - created,
+            "rounds": rounds}
+
+
+def cases(rounds: int) -> dict:
+    """
+    Commands to time, each leaves the pool as it found it
+    """
+    dataset = f"{POOL}/g0/d0"
+    kept = [f"s{i}" for i in range(0, rounds, 2)]
+
+    def destroy_snapshots():
+        pyzfscmds.cmd.zfs_destroy_snapshots(dataset, kept, dry_run=True)
+
+    def clone():
+        pyzfscmds.cmd.zfs_clone(f"{dataset}@s0", f"{POOL}/clone")
+        pyzfscmds.cmd.zfs_destroy(f"{POOL}/clone")
+
+    return {
+        "zfs list dataset": lambda: pyzfscmds.cmd.zfs_list(dataset),
+        "zfs get used": lambda: pyzfscmds.cmd.zfs_get(dataset, properties=["used"]),
+        "zfs list -t snapshot": lambda: pyzfscmds.cmd.zfs_list(dataset,
+                                                               zfs_types=["snapshot"]),
+        "zfs list -r": lambda: pyzfscmds.cmd.zfs_list(POOL, recursive=True),
+        "zfs list -r -t all": lambda: sum(1 for _ in pyzfscmds.cmd.zfs_list_iter(
+            POOL, recursive=True, zfs_types=["all"], columns=["name"])),
+        "zfs get -r mountpoint": lambda: pyzfscmds.cmd.zfs_get(
+            POOL, recursive=True, properties=["mountpoint"], zfs_types=["filesystem"]),
+        "zfs destroy -n snapshots": destroy_snapshots,
+        "zfs clone and destroy": clone,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-d", "--datasets", type=int, default=100000)
+    parser.add_argument("-s", "--snapshots", type=int, default=1000000)
+    parser.add_argument("-n", "--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    built = build(args.datasets, args.snapshots)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    print(f"{args.datasets} filesystems, {built['rounds']} snapshots each, "
+          f"max RSS {rss:.0f} MiB")
+    print(f"{'zfs create':<26} {built['zfs create']:>10.2f} s total")
+    print(f"{'zfs snapshot -r':<26} {built['zfs snapshot -r']:>10.2f} s total")
+
+    print(f"\n{'command':<26} {'min ms':>10} {'median ms':>10}")
+    for name, case in cases(built["rounds"]).items():
+        times = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            case()
+            times.append((time.perf_counter() - start) * 1000)
+        print(f"{name:<26} {min(times):>10.2f} {statistics.median(times):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Latency of starting a command against the resident size of the parent
+
+The process grows by touching ballast memory, then times running a
+program which does nothing with SubprocessBackend and PosixSpawnBackend,
+and a bare fork and exit for comparison, at each size. The cost of a fork
+grows with the page tables it copies, vfork and posix_spawn do not copy
+them. Run from the repository root:
+
+    PYTHONPATH=. python benchmarks/spawn_rss.py [-m MIB [MIB ...]] [-n CALLS]
+"""
+
+import argparse
+import os
+import resource
+import shutil
+import statistics
+import time
+
+import pyzfscmds.backend
+
+PAGE = 4096
+
+
+def grow(ballast: list, mib: int):
+    """
+    Add ballast until mib MiB have been allocated, touching every page
+    """
+    allocated = sum(len(b) for b in ballast) // (1 << 20)
+    while allocated < mib:
+        chunk = bytearray(min(256, mib - allocated) << 20)
+        chunk[::PAGE] = b"\x01" * len(range(0, len(chunk), PAGE))
+        ballast.append(chunk)
+        allocated += len(chunk) >> 20
+
+
+def fork():
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0)
+    os.waitpid(pid, 0)
+
+
+def timed(function, calls: int) -> list:
+    times = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-m", "--mib", type=int, nargs="+", default=[0, 512, 1024, 2048],
+                        help="ballast sizes in MiB, ascending")
+    parser.add_argument("-n", "--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    stub = shutil.which("true") or "/bin/true"
+    subprocess_backend = pyzfscmds.backend.SubprocessBackend()
+    spawn_backend = pyzfscmds.backend.PosixSpawnBackend()
+
+    cases = [
+        ("fork and exit", fork),
+        ("SubprocessBackend", lambda: subprocess_backend.run([stub])),
+        ("PosixSpawnBackend", lambda: spawn_backend.run([stub])),
+    ]
+
+    print(f"{'ballast MiB':>11} {'RSS MiB':>8}  {'case':<20} {'min ms':>8} {'median ms':>10}")
+
+    ballast = []
+    for mib in sorted(args.mib):
+        grow(ballast, mib)
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+        for name, case in cases:
+            times = timed(case, args.calls)
+            print(f"{mib:>11} {rss:>8.0f}  {name:<20} {min(times):>8.3f} "
+                  f"{statistics.median(times):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+"""
+Benchmark suite saving its results as JSON
+
+Measures the fixed cost of running a command, parsing throughput of zfs
+list and zfs get output, utility lookups against a simulated pool and
+Linux mount table lookups. None of it needs ZFS. Run from the repository
+root:
+
+    PYTHONPATH=. python benchmarks/suite.py [-o FILE] [--quick] [--compare FILE] [group...]
+
+Results of two runs, e.g. of two versions, are compared with --compare,
+which prints the change in median time of every benchmark in both.
+"""
+
+import argparse
+import collections
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import timeit
+
+import pyzfscmds
+import pyzfscmds.backend
+import pyzfscmds.cmd
+import pyzfscmds.simulate
+import pyzfscmds.system.linux
+import pyzfscmds.utility
+
+GROUPS = collections.OrderedDict()
+
+
+def group(name: str):
+    """
+    Register a benchmark group, a function of (quick) returning results
+    """
+    def register(function):
+        GROUPS[name] = function
+        return function
+
+    return register
+
+
+def measure(benchmark: str, name: str, function, runs: int = 5, number: int = None,
+            **params) -> dict:
+    """
+    Time function, returning seconds per call. Fast functions are called
+    number times per run, by default enough for a run to take 0.2 s.
+    """
+    timer = timeit.Timer(function)
+    if number is None:
+        number, _ = timer.autorange()
+
+    times = [t / number for t in timer.repeat(repeat=runs, number=number)]
+
+    result = collections.OrderedDict([
+        ("benchmark", benchmark),
+        ("name", name),
+        ("params", params),
+        ("runs", runs),
+        ("number", number),
+        ("min", min(times)),
+        ("median", statistics.median(times)),
+        ("mean", statistics.mean(times)),
+    ])
+
+    if "rows" in params:
+        result["rows_per_second"] = params["rows"] / result["median"]
+
+    return result
+
+
+class FixedBackend(pyzfscmds.backend.Backend):
+    """
+    Answers every command with the same output, without running anything
+    """
+
+    def __init__(self, stdout: str):
+        self.stdout = stdout
+
+    def run(self, argv, env=None):
+        return subprocess.CompletedProcess(argv, 0, self.stdout, "")
+
+
+@group("command")
+def command_overhead(quick: bool) -> list:
+    """
+    Fixed cost of running a command which does nothing
+    """
+    stub = shutil.which("true") or "/bin/true"
+    runs = 3 if quick else 5
+
+    def command(env=None):
+        return pyzfscmds.cmd._Command("", [], main_command=stub, env_variables_override=env)
+
+    prepared = command({"ZFS_COLOR": "0"})
+    discarded = command()
+    discarded.output = pyzfscmds.backend.OUTPUT_DISCARD
+
+    return [
+        measure("command", "subprocess.run", lambda: subprocess.run([stub]), runs),
+        measure("command", "_Command.run", lambda: command().run(), runs),
+        measure("command", "_Command.run output discarded", discarded.run, runs),
+        measure("command", "_Command.run env override",
+                lambda: command({"ZFS_COLOR": "0"}).run(), runs),
+        measure("command", "_Command._prepare_env", prepared._prepare_env, runs),
+        measure("command", "_Command._prepare_call", prepared._prepare_call, runs),
+    ]
+
+
+def _list_output(rows: int) -> str:
+    return "".join(f"pool/ds{i}\t{i * 4096}\t{1 << 40}\t{i * 1024}\t/pool/ds{i}\n"
+                   for i in range(rows))
+
+
+def _get_output(rows: int) -> str:
+    properties = ["used", "available", "referenced", "mountpoint"]
+    return "".join(
+        f"pool/ds{i // 4}\t{properties[i % 4]}\t"
+        f"{f'/pool/ds{i // 4}' if i % 4 == 3 else i * 1024}\t-\n"
+        for i in range(rows))
+
+
+@group("parse")
+def parse_throughput(quick: bool) -> list:
+    """
+    zfs list and zfs get output of 10k, 100k and 1M rows through pyzfscmds.cmd
+    """
+    columns = ["name", "used", "available", "referenced", "mountpoint"]
+    properties = ["used", "available", "referenced", "mountpoint"]
+    results = []
+
+    previous = pyzfscmds.backend.get_backend()
+    try:
+        for rows in [10000, 100000] + ([] if quick else [1000000]):
+            runs = 3 if rows < 1000000 else 1
+
+            pyzfscmds.backend.set_backend(FixedBackend(_list_output(rows)))
+            cases = [
+                ("zfs_list parsed", lambda: pyzfscmds.cmd.zfs_list(
+                    "pool", recursive=True, columns=columns, parsable=True, parsed=True)),
+                ("zfs_list columnar", lambda: pyzfscmds.cmd.zfs_list(
+                    "pool", recursive=True, columns=columns, parsable=True, columnar=True)),
+                ("zfs_list_iter", lambda: sum(1 for _ in pyzfscmds.cmd.zfs_list_iter(
+                    "pool", recursive=True, columns=columns, parsable=True))),
+            ]
+            results.extend(measure("parse", name, function, runs, number=1, rows=rows)
+                           for name, function in cases)
+
+            pyzfscmds.backend.set_backend(FixedBackend(_get_output(rows)))
+            cases = [
+                ("zfs_get parsed", lambda: pyzfscmds.cmd.zfs_get(
+                    "pool", recursive=True, properties=properties, parsable=True,
+                    parsed=True)),
+                ("zfs_get columnar", lambda: pyzfscmds.cmd.zfs_get(
+                    "pool", recursive=True, properties=properties, parsable=True,
+                    columnar=True)),
+            ]
+            results.extend(measure("parse", name, function, runs, number=1, rows=rows)
+                           for name, function in cases)
+    finally:
+        pyzfscmds.backend.set_backend(previous)
+
+    return results
+
+
+@group("utility")
+def utility_lookups(quick: bool) -> list:
+    """
+    pyzfscmds.utility against a simulated pool of 1000 filesystems, the
+    cost pyzfscmds adds to each lookup without the process
+    """
+    backend = pyzfscmds.simulate.SimulatedBackend()
+    backend.create_pool("pool")
+
+    previous = pyzfscmds.backend.set_backend(backend)
+    try:
+        for i in range(10):
+            pyzfscmds.cmd.zfs_create_dataset(f"pool/g{i}")
+            for j in range(99):
+                pyzfscmds.cmd.zfs_create_dataset(f"pool/g{i}/d{j}")
+        pyzfscmds.cmd.zfs_snapshot("pool", "snap", recursive=True)
+        pyzfscmds.cmd.zfs_clone("pool/g0/d0@snap", "pool/clone")
+
+        names = [f"pool/g{i}/d{j}" for i in range(10) for j in range(99)]
+        runs = 3 if quick else 5
+
+        return [
+            measure("utility", "dataset_exists", lambda: pyzfscmds.utility.dataset_exists(
+                "pool/g5/d50"), runs),
+            measure("utility", "dataset_exists missing",
+                    lambda: pyzfscmds.utility.dataset_exists("pool/missing"), runs),
+            measure("utility", "is_snapshot",
+                    lambda: pyzfscmds.utility.is_snapshot("pool/g5/d50@snap"), runs),
+            measure("utility", "is_clone", lambda: pyzfscmds.utility.is_clone("pool/clone"),
+                    runs),
+            measure("utility", "dataset_parent",
+                    lambda: pyzfscmds.utility.dataset_parent("pool/g5/d50"), runs),
+            measure("utility", "dataset_child_name",
+                    lambda: pyzfscmds.utility.dataset_child_name("pool/g5/d50"), runs),
+            measure("utility", "snapshot_parent_dataset",
+                    lambda: pyzfscmds.utility.snapshot_parent_dataset("pool/g5/d50@snap"),
+                    runs),
+            measure("utility", "datasets_exist", lambda: pyzfscmds.utility.datasets_exist(
+                names), runs, names=len(names)),
+        ]
+    finally:
+        pyzfscmds.backend.set_backend(previous)
+
+
+def _mounts(count: int) -> str:
+    """
+    A mount table of count zfs filesystems among some other mounts
+    """
+    lines = ["proc /proc proc rw,nosuid,nodev,noexec,relatime 0 0",
+             "/dev/sda1 /boot ext4 rw,relatime 0 0"]
+    lines.extend(f"pool/ds{i} /pool/ds\\040{i} zfs rw,xattr,noacl 0 0" for i in range(count))
+    return "\n".join(lines) + "\n"
+
+
+@group("mounts")
+def mount_lookups(quick: bool) -> list:
+    """
+    pyzfscmds.system.linux mount table parsing and lookups at 1k and 10k mounts
+    """
+    results = []
+    runs = 3 if quick else 5
+
+    with tempfile.TemporaryDirectory() as directory:
+        for count in (1000, 10000):
+            path = os.path.join(directory, f"mounts{count}")
+            with open(path, "w") as f:
+                f.write(_mounts(count))
+
+            with open(path) as f:
+                lines = f.read().splitlines()
+
+            table = pyzfscmds.system.linux.MountTable(path)
+            table.refresh()
+            datasets = [f"pool/ds{i}" for i in range(count)]
+            last = f"pool/ds{count - 1}"
+
+            results.extend([
+                measure("mounts", "parse_mounts",
+                        lambda: pyzfscmds.system.linux.parse_mounts(lines), runs, mounts=count),
+                measure("mounts", "MountTable.refresh", table.refresh, runs, mounts=count),
+                measure("mounts", "dataset_mountpoint", lambda: table.dataset_mountpoint(last),
+                        runs, mounts=count),
+                measure("mounts", "mountpoint_dataset",
+                        lambda: table.mountpoint_dataset(f"/pool/ds {count - 1}"), runs,
+                        mounts=count),
+                measure("mounts", "dataset_mountpoints",
+                        lambda: table.dataset_mountpoints(datasets), runs, mounts=count),
+            ])
+
+    return results
+
+
+def environment() -> dict:
+    return collections.OrderedDict([
+        ("pyzfscmds", pyzfscmds.__version__),
+        ("python", platform.python_version()),
+        ("implementation", platform.python_implementation()),
+        ("platform", platform.platform()),
+        ("machine", platform.machine()),
+        ("cpus", os.cpu_count()),
+        ("time", time.strftime("%Y-%m-%dT%H:%M:%S%z")),
+    ])
+
+
+def _key(result: dict) -> tuple:
+    return result["benchmark"], result["name"], tuple(sorted(result["params"].items()))
+
+
+def _label(result: dict) -> str:
+    params = " ".join(f"{k}={v}" for k, v in sorted(result["params"].items()))
+    return f"{result['benchmark']}: {result['name']}" + (f" {params}" if params else "")
+
+
+def compare(baseline: dict, current: dict) -> str:
+    """
+    Median times of benchmarks in both runs and how they changed
+    """
+    old = {_key(r): r for r in baseline["results"]}
+
+    lines = [f"{'benchmark':<56} {'old':>12} {'new':>12} {'change':>8}"]
+    for result in current["results"]:
+        previous = old.get(_key(result))
+        if previous is None:
+            continue
+
+        change = result["median"] / previous["median"] - 1
+        lines.append(f"{_label(result):<56} {previous['median'] * 1e6:>10.1f}us "
+                     f"{result['median'] * 1e6:>10.1f}us {change:>+8.1%}")
+
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-o", "--output", help="write results to this JSON file")
+    parser.add_argument("--quick", action="store_true",
+                        help="fewer runs, and no 1M row parsing")
+    parser.add_argument("--compare", metavar="FILE", help="JSON results to compare against")
+    parser.add_argument("groups", nargs="*", metavar="group",
+                        help=f"groups to run, all by default: {', '.join(GROUPS)}")
+    args = parser.parse_args()
+
+    for name in args.groups:
+        if name not in GROUPS:
+            parser.error(f"unknown group '{name}'")
+
+    document = environment()
+    document["results"] = []
+
+    for name in args.groups or GROUPS:
+        for result in GROUPS[name](args.quick):
+            document["results"].append(result)
+            print(f"{_label(result):<56} {result['median'] * 1e6:>12.1f}us")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=1)
+
+    if args.compare:
+        with open(args.compare) as f:
+            print()
+            print(compare(json.load(f), document), end="")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,573 @@
+"""
+asyncio versions of the pyzfscmds.cmd wrappers
+
+Commands are built exactly as in pyzfscmds.cmd and run with
+asyncio.create_subprocess_exec, so many commands can be in flight without
+blocking the event loop. Cancelling a call kills the child process.
+"""
+
+import asyncio
+import functools
+import subprocess
+
+from typing import AsyncIterator, Iterable, List, Tuple, Union
+
+import pyzfscmds.backend
+import pyzfscmds.capabilities
+import pyzfscmds.cmd
+import pyzfscmds.parse
+
+_Command = pyzfscmds.cmd._Command
+
+
+async def _detect() -> pyzfscmds.capabilities.Capabilities:
+    """
+    pyzfscmds.capabilities.detect without blocking the event loop, the first
+    detection in a process probes zfs from a worker thread
+    """
+    capabilities = pyzfscmds.capabilities.detected()
+    if capabilities is not None:
+        return capabilities
+
+    return await asyncio.get_event_loop().run_in_executor(
+        None, pyzfscmds.capabilities.detect)
+
+
+async def _json_supported(json_output: bool) -> bool:
+    return json_output and (await _detect()).json
+
+
+async def _run_command(command: _Command) -> str:
+    """
+    Async equivalent of _Command.run, raises subprocess.CalledProcessError
+    """
+    zfs_call = command._prepare_call()
+
+    output = command._cache_get(zfs_call)
+    if output is not None:
+        return output
+
+    generation = command._cache_generation()
+    backend = command._get_backend()
+    measurement = pyzfscmds.cmd._measure(zfs_call)
+    try:
+        if command.output == pyzfscmds.backend.OUTPUT_TEXT:
+            result = await backend.run_async(zfs_call, command._prepare_env())
+        else:
+            result = await backend.run_output_async(zfs_call, command._prepare_env(),
+                                                    command.output)
+    except BaseException as e:
+        if measurement is not None:
+            measurement.fail(e)
+        raise
+    finally:
+        command._invalidate_cache()
+
+    if measurement is not None:
+        measurement.finish(result)
+
+    # Discarded output reads as empty
+    output = result.stdout if result.stdout is not None else ""
+
+    if result.returncode != 0:
+        raise subprocess.CalledProcessError(result.returncode, zfs_call,
+                                            output=output, stderr=result.stderr)
+
+    command._cache_put(zfs_call, output, generation)
+
+    return output
+
+
+async def _run(command: _Command) -> str:
+    try:
+        return await _run_command(command)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"{command.failure}\n{e.output}\n")
+
+
+async def _run_chunks(command: _Command, size: int = 65536) -> AsyncIterator[str]:
+    """
+    Async equivalent of _Command.run_chunks, raises RuntimeError
+    """
+    zfs_call = command._prepare_call()
+
+    output = command._cache_get(zfs_call)
+    if output is not None:
+        yield output
+        return
+
+    measurement = pyzfscmds.cmd._measure(zfs_call)
+    exhausted = False
+    error = None
+
+    chunks = command._get_backend().stream_async(zfs_call, command._prepare_env(), size)
+    try:
+        async for chunk in chunks:
+            yield chunk
+        exhausted = True
+    except subprocess.CalledProcessError as e:
+        error = e
+        raise RuntimeError(f"{command.failure}\n{e.stderr}\n")
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        # Kills the child if iteration stopped early
+        await chunks.aclose()
+
+        if measurement is not None and error is not None:
+            measurement.fail(error)
+        elif measurement is not None:
+            measurement.finish_stream(exhausted)
+
+
+async def _run_iter(command: _Command) -> AsyncIterator[List[str]]:
+    """
+    Async equivalent of _Command.run_iter, raises RuntimeError
+    """
+    partial = ""
+
+    async for chunk in _run_chunks(command):
+        lines = (partial + chunk).split("\n")
+        partial = lines.pop()
+        for line in lines:
+            yield line.split("\t")
+
+    if partial:
+        yield partial.split("\t")
+
+
+async def _json_rows(command: _Command, collection: str, convert) -> AsyncIterator[List[str]]:
+    """
+    Async equivalent of pyzfscmds.parse.json_rows over the command output
+    """
+    parser = pyzfscmds.parse.JSONCollectionParser(collection)
+
+    async for chunk in _run_chunks(command):
+        for name, entry in parser.feed(chunk):
+            for row in convert(name, entry):
+                yield row
+
+    for name, entry in parser.close():
+        for row in convert(name, entry):
+            yield row
+
+
+def _coroutine(function, builder):
+    """
+    Create a coroutine function with the signature and documentation of a
+    pyzfscmds.cmd wrapper, running the command built by builder.
+    """
+
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        return await _run(builder(*args, **kwargs))
+
+    wrapper.__module__ = __name__
+    return wrapper
+
+
+"""
+zpool Commands
+"""
+
+zpool_set = _coroutine(pyzfscmds.cmd.zpool_set, pyzfscmds.cmd._zpool_set_command)
+
+
+async def zpool_get(pool: str = None,
+                    scripting: bool = True,
+                    properties: list = None,
+                    columns: list = None,
+                    parsable: bool = False,
+                    parsed: bool = False,
+                    json_output: bool = False) -> Union[str, list]:
+    """
+    Coroutine version of pyzfscmds.cmd.zpool_get
+    """
+    if parsed or json_output:
+        return [row async for row in zpool_get_iter(pool=pool,
+                                                    properties=properties,
+                                                    columns=columns,
+                                                    parsable=parsable,
+                                                    parsed=True,
+                                                    json_output=json_output)]
+
+    return await _run(pyzfscmds.cmd._zpool_get_command(pool=pool,
+                                                       scripting=scripting,
+                                                       properties=properties,
+                                                       columns=columns,
+                                                       parsable=parsable))
+
+
+async def zpool_get_iter(pool: str = None,
+                         properties: list = None,
+                         columns: list = None,
+                         parsable: bool = False,
+                         parsed: bool = False,
+                         json_output: bool = False) -> AsyncIterator[Union[List[str], tuple]]:
+    """
+    Async generator version of pyzfscmds.cmd.zpool_get_iter
+    """
+    if json_output:
+        parsable = True
+
+    if await _json_supported(json_output):
+        columns = list(pyzfscmds.parse.get_columns(columns))
+        command = pyzfscmds.cmd._zpool_get_command(pool=pool, properties=properties,
+                                                   json_output=True)
+        rows = _json_rows(command, "pools",
+                          lambda name, entry: pyzfscmds.parse.json_get_rows(name, entry, columns))
+    else:
+        command = pyzfscmds.cmd._zpool_get_command(pool=pool,
+                                                   scripting=True,
+                                                   properties=properties,
+                                                   columns=columns,
+                                                   parsable=parsable)
+        rows = _run_iter(command)
+
+    parse_row = pyzfscmds.parse.get_row_parser(columns, parsable) if parsed else None
+
+    async for row in rows:
+        yield parse_row(row) if parse_row is not None else row
+
+
+"""
+zfs Commands
+"""
+
+zfs_create_dataset = _coroutine(pyzfscmds.cmd.zfs_create_dataset,
+                                pyzfscmds.cmd._zfs_create_dataset_command)
+zfs_create_zvol = _coroutine(pyzfscmds.cmd.zfs_create_zvol,
+                             pyzfscmds.cmd._zfs_create_zvol_command)
+zfs_clone = _coroutine(pyzfscmds.cmd.zfs_clone, pyzfscmds.cmd._zfs_clone_command)
+zfs_snapshot = _coroutine(pyzfscmds.cmd.zfs_snapshot, pyzfscmds.cmd._zfs_snapshot_command)
+
+zfs_destroy = _coroutine(pyzfscmds.cmd.zfs_destroy, pyzfscmds.cmd._zfs_destroy_command)
+zfs_destroy_snapshot = _coroutine(pyzfscmds.cmd.zfs_destroy_snapshot,
+                                  pyzfscmds.cmd._zfs_destroy_snapshot_command)
+zfs_rollback = _coroutine(pyzfscmds.cmd.zfs_rollback, pyzfscmds.cmd._zfs_rollback_command)
+zfs_promote = _coroutine(pyzfscmds.cmd.zfs_promote, pyzfscmds.cmd._zfs_promote_command)
+zfs_rename = _coroutine(pyzfscmds.cmd.zfs_rename, pyzfscmds.cmd._zfs_rename_command)
+zfs_set = _coroutine(pyzfscmds.cmd.zfs_set, pyzfscmds.cmd._zfs_set_command)
+zfs_inherit = _coroutine(pyzfscmds.cmd.zfs_inherit, pyzfscmds.cmd._zfs_inherit_command)
+zfs_upgrade_list = _coroutine(pyzfscmds.cmd.zfs_upgrade_list,
+                              pyzfscmds.cmd._zfs_upgrade_list_command)
+zfs_upgrade = _coroutine(pyzfscmds.cmd.zfs_upgrade, pyzfscmds.cmd._zfs_upgrade_command)
+zfs_mount_list = _coroutine(pyzfscmds.cmd.zfs_mount_list, pyzfscmds.cmd._zfs_mount_list_command)
+zfs_mount = _coroutine(pyzfscmds.cmd.zfs_mount, pyzfscmds.cmd._zfs_mount_command)
+zfs_unmount = _coroutine(pyzfscmds.cmd.zfs_unmount, pyzfscmds.cmd._zfs_unmount_command)
+
+
+async def zfs_snapshot_multiple(targets: Iterable[Union[str, Tuple[str, str]]],
+                                snapname: str = None,
+                                recursive: bool = False,
+                                properties: list = None) -> str:
+    """
+    Coroutine version of pyzfscmds.cmd.zfs_snapshot_multiple
+    """
+    commands = pyzfscmds.cmd._zfs_snapshot_multiple_commands(
+        targets, snapname=snapname, recursive=recursive, properties=properties)
+
+    return "".join([await _run(command) for command in commands])
+
+
+async def zfs_set_multiple(targets: Iterable[str],
+                           properties: dict,
+                           diff: bool = False,
+                           multi_property: bool = None) -> str:
+    """
+    Coroutine version of pyzfscmds.cmd.zfs_set_multiple
+    """
+    targets = list(targets)
+
+    if multi_property is None:
+        multi_property = (await _detect()).multi_property_set
+
+    if not diff:
+        commands = pyzfscmds.cmd._zfs_set_multiple_commands(
+            targets, properties, multi_property=multi_property)
+        return "".join([await _run(command) for command in commands])
+
+    rows = []
+    for command in pyzfscmds.cmd._zfs_set_current_commands(targets, properties):
+        rows.extend(line.split("\t") for line in (await _run(command)).splitlines())
+
+    output = []
+    changes = pyzfscmds.cmd._zfs_set_changes(targets, properties, rows)
+    for changed, changed_targets in changes.items():
+        commands = pyzfscmds.cmd._zfs_set_multiple_commands(
+            changed_targets, dict(changed), multi_property=multi_property)
+        output.extend([await _run(command) for command in commands])
+
+    return "".join(output)
+
+
+async def _snapshot_listing(dataset: str) -> List[tuple]:
+    return await zfs_list(dataset, depth=1, parsable=True, parsed=True,
+                          columns=["name", "used"], zfs_types=["snapshot"],
+                          sort_properties_ascending=["createtxg"])
+
+
+async def zfs_destroy_snapshots(dataset: str,
+                                snapnames: Iterable[str],
+                                recursive_descendents: bool = False,
+                                recursive_clones: bool = False,
+                                dry_run: bool = False,
+                                machine_parsable: bool = False,
+                                verbose: bool = False,
+                                defer: bool = False,
+                                snapshot_order: List[str] = None) -> str:
+    """
+    Coroutine version of pyzfscmds.cmd.zfs_destroy_snapshots
+    """
+    if recursive_descendents or recursive_clones:
+        snapshot_order = None
+    else:
+        snapshot_order = pyzfscmds.cmd._checked_snapshot_order(
+            dataset, snapshot_order, await _snapshot_listing(dataset))
+
+    commands = pyzfscmds.cmd._zfs_destroy_snapshots_commands(
+        dataset, snapnames,
+        recursive_descendents=recursive_descendents,
+        recursive_clones=recursive_clones,
+        dry_run=dry_run,
+        machine_parsable=machine_parsable,
+        verbose=verbose,
+        defer=defer,
+        snapshot_order=snapshot_order)
+
+    return "".join([await _run(command) for command in commands])
+
+
+async def zfs_destroy_snapshots_estimate(dataset: str,
+                                         snapnames: Iterable[str],
+                                         recursive_descendents: bool = False,
+                                         recursive_clones: bool = False
+                                         ) -> pyzfscmds.parse.DestroyEstimate:
+    """
+    Coroutine version of pyzfscmds.cmd.zfs_destroy_snapshots_estimate
+    """
+    snapnames = pyzfscmds.cmd._snapshot_names(dataset, snapnames)
+    listing = await _snapshot_listing(dataset)
+
+    commands = pyzfscmds.cmd._zfs_destroy_snapshots_commands(
+        dataset, snapnames,
+        recursive_descendents=recursive_descendents,
+        recursive_clones=recursive_clones,
+        dry_run=True,
+        machine_parsable=True,
+        verbose=True,
+        snapshot_order=pyzfscmds.cmd._checked_snapshot_order(dataset, None, listing))
+
+    output = "".join([await _run(command) for command in commands])
+
+    estimate = pyzfscmds.parse.parse_destroy_dry_run(output)
+
+    requested = {f"{dataset}@{s}" for s in snapnames}
+    estimate.used.update((r.name, r.used) for r in listing if r.name in requested)
+
+    return estimate
+
+
+async def zfs_get(target: str,
+                  recursive: bool = False,
+                  depth: int = None,
+                  scripting: bool = True,
+                  parsable: bool = False,
+                  columns: list = None,
+                  zfs_types: list = None,
+                  source: list = None,
+                  properties: list = None,
+                  env_variables_override: dict = None,
+                  parsed: bool = False,
+                  columnar: bool = False,
+                  json_output: bool = False) -> Union[str, list, pyzfscmds.parse.Columnar]:
+    """
+    Coroutine version of pyzfscmds.cmd.zfs_get
+    """
+    if parsed and columnar:
+        raise RuntimeError("Cannot request both parsed and columnar output")
+
+    if json_output:
+        rows = [row async for row in zfs_get_iter(
+            target, recursive=recursive, depth=depth, columns=columns, zfs_types=zfs_types,
+            source=source, properties=properties,
+            env_variables_override=env_variables_override, json_output=True)]
+
+        if columnar:
+            return pyzfscmds.parse.columnar_get_rows(rows, columns=columns, parsable=True)
+
+        return list(pyzfscmds.parse.parse_get_rows(rows, columns=columns, parsable=True))
+
+    command = pyzfscmds.cmd._zfs_get_command(target,
+                                             recursive=recursive,
+                                             depth=depth,
+                                             scripting=scripting or parsed or columnar,
+                                             parsable=parsable,
+                                             columns=columns,
+                                             zfs_types=zfs_types,
+                                             source=source,
+                                             properties=properties,
+                                             env_variables_override=env_variables_override)
+
+    if not (parsed or columnar):
+        return await _run(command)
+
+    rows = [line.split("\t") for line in (await _run(command)).splitlines()]
+
+    if columnar:
+        return pyzfscmds.parse.columnar_get_rows(rows, columns=columns, parsable=parsable)
+
+    return list(pyzfscmds.parse.parse_get_rows(rows, columns=columns, parsable=parsable))
+
+
+async def zfs_get_iter(target: str,
+                       recursive: bool = False,
+                       depth: int = None,
+                       parsable: bool = False,
+                       columns: list = None,
+                       zfs_types: list = None,
+                       source: list = None,
+                       properties: list = None,
+                       env_variables_override: dict = None,
+                       parsed: bool = False,
+                       json_output: bool = False) -> AsyncIterator[Union[List[str], tuple]]:
+    """
+    Async generator version of pyzfscmds.cmd.zfs_get_iter
+    """
+    if json_output:
+        parsable = True
+
+    json_output = await _json_supported(json_output)
+
+    if json_output:
+        columns = list(pyzfscmds.parse.get_columns(columns))
+
+    command = pyzfscmds.cmd._zfs_get_command(target,
+                                             recursive=recursive,
+                                             depth=depth,
+                                             scripting=True,
+                                             parsable=parsable,
+                                             columns=columns,
+                                             zfs_types=zfs_types,
+                                             source=source,
+                                             properties=properties,
+                                             env_variables_override=env_variables_override,
+                                             json_output=json_output)
+
+    if json_output:
+        rows = _json_rows(command, "datasets",
+                          lambda name, entry: pyzfscmds.parse.json_get_rows(name, entry, columns))
+    else:
+        rows = _run_iter(command)
+
+    parse_row = pyzfscmds.parse.get_row_parser(columns, parsable) if parsed else None
+
+    async for row in rows:
+        yield parse_row(row) if parse_row is not None else row
+
+
+async def zfs_list(target: str,
+                   recursive: bool = False,
+                   depth: int = None,
+                   scripting: bool = True,
+                   parsable: bool = False,
+                   columns: list = None,
+                   zfs_types: list = None,
+                   sort_properties_ascending: list = None,
+                   sort_properties_descending: list = None,
+                   env_variables_override: dict = None,
+                   parsed: bool = False,
+                   columnar: bool = False,
+                   json_output: bool = False) -> Union[str, list, pyzfscmds.parse.Columnar]:
+    """
+    Coroutine version of pyzfscmds.cmd.zfs_list
+    """
+    if parsed and columnar:
+        raise RuntimeError("Cannot request both parsed and columnar output")
+
+    if json_output:
+        rows = [row async for row in zfs_list_iter(
+            target, recursive=recursive, depth=depth, columns=columns, zfs_types=zfs_types,
+            sort_properties_ascending=sort_properties_ascending,
+            sort_properties_descending=sort_properties_descending,
+            env_variables_override=env_variables_override, json_output=True)]
+
+        if columnar:
+            return pyzfscmds.parse.columnar_list_rows(rows, columns=columns, parsable=True)
+
+        return list(pyzfscmds.parse.parse_list_rows(rows, columns=columns, parsable=True))
+
+    if parsed or columnar:
+        # Fail before running anything if the columns cannot be parsed
+        pyzfscmds.parse.list_columns(columns)
+
+    command = pyzfscmds.cmd._zfs_list_command(
+        target,
+        recursive=recursive,
+        depth=depth,
+        scripting=scripting or parsed or columnar,
+        parsable=parsable,
+        columns=columns,
+        zfs_types=zfs_types,
+        sort_properties_ascending=sort_properties_ascending,
+        sort_properties_descending=sort_properties_descending,
+        env_variables_override=env_variables_override)
+
+    if not (parsed or columnar):
+        return await _run(command)
+
+    rows = [line.split("\t") for line in (await _run(command)).splitlines()]
+
+    if columnar:
+        return pyzfscmds.parse.columnar_list_rows(rows, columns=columns, parsable=parsable)
+
+    return list(pyzfscmds.parse.parse_list_rows(rows, columns=columns, parsable=parsable))
+
+
+async def zfs_list_iter(target: str,
+                        recursive: bool = False,
+                        depth: int = None,
+                        parsable: bool = False,
+                        columns: list = None,
+                        zfs_types: list = None,
+                        sort_properties_ascending: list = None,
+                        sort_properties_descending: list = None,
+                        env_variables_override: dict = None,
+                        parsed: bool = False,
+                        json_output: bool = False) -> AsyncIterator[Union[List[str], tuple]]:
+    """
+    Async generator version of pyzfscmds.cmd.zfs_list_iter
+    """
+    if json_output:
+        parsable = True
+
+    json_output = await _json_supported(json_output)
+
+    if json_output:
+        columns = list(pyzfscmds.parse.list_columns(columns))
+
+    parse_row = pyzfscmds.parse.list_row_parser(columns, parsable) if parsed else None
+
+    command = pyzfscmds.cmd._zfs_list_command(
+        target,
+        recursive=recursive,
+        depth=depth,
+        scripting=True,
+        parsable=parsable,
+        columns=columns,
+        zfs_types=zfs_types,
+        sort_properties_ascending=sort_properties_ascending,
+        sort_properties_descending=sort_properties_descending,
+        env_variables_override=env_variables_override,
+        json_output=json_output)
+
+    if json_output:
+        rows = _json_rows(
+            command, "datasets",
+            lambda name, entry: [pyzfscmds.parse.json_list_row(name, entry, columns)])
+    else:
+        rows = _run_iter(command)
+
+    async for row in rows:
+        yield parse_row(row) if parse_row is not None else row
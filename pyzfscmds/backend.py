@@ -0,0 +1,621 @@
+"""
+Execution backends for zfs and zpool commands
+
+Every _Command is run by a backend, the one given to set_backend() or a
+SubprocessBackend by default. A backend receives the argv of a command and
+its environment, None meaning the current one, and returns a
+subprocess.CompletedProcess with text output. The result may have a
+rusage attribute, the resource.struct_rusage of the child process, and an
+output_bytes attribute, the number of bytes read from its stdout.
+
+run_output() and run_output_async() return stdout as a command's output
+mode asks, subprocess based backends discard it without a pipe or skip
+decoding it.
+
+Commands overriding environment variables get their environment from the
+backend's environment(), PosixSpawnBackend builds it once instead of
+copying os.environ for every command.
+"""
+
+import collections
+import errno
+import io
+import locale
+import os
+import signal
+import subprocess
+import threading
+
+from typing import AsyncIterator, Callable, Iterable, Iterator, List, Mapping, Optional
+
+"""
+Output modes of a command. OUTPUT_DISCARD sends stdout to /dev/null,
+OUTPUT_BYTES returns it undecoded and OUTPUT_TEXT decoded. OUTPUT_STREAM
+output is read as it is produced with stream().
+"""
+
+OUTPUT_DISCARD = "discard"
+OUTPUT_BYTES = "bytes"
+OUTPUT_TEXT = "text"
+OUTPUT_STREAM = "stream"
+
+
+class Backend:
+    """
+    Base backend, subclasses implement run(). Streaming, other output
+    modes and the coroutine variants default to running the command with
+    run().
+    """
+
+    def run(self, argv: List[str], env: Optional[dict] = None) -> subprocess.CompletedProcess:
+        raise NotImplementedError
+
+    def run_output(self,
+                   argv: List[str],
+                   env: Optional[dict],
+                   output: str) -> subprocess.CompletedProcess:
+        """
+        Run argv with stdout None for OUTPUT_DISCARD, bytes for
+        OUTPUT_BYTES or text for OUTPUT_TEXT. stderr is always text.
+        """
+        return _converted(self.run(argv, env), output)
+
+    def environment(self, overrides: dict) -> dict:
+        """
+        Environment of a command setting overrides, os.environ with them
+        applied. The result is passed to run() and must not be modified.
+        """
+        env = dict(os.environ)
+        env.update(overrides)
+        return env
+
+    def stream(self,
+               argv: List[str],
+               env: Optional[dict],
+               read: Callable[[io.TextIOBase], Iterator]) -> Iterator:
+        """
+        Yield what read produces from the output of argv, then raise
+        subprocess.CalledProcessError if the command failed
+        """
+        result = self.run(argv, env)
+
+        yield from read(io.StringIO(result.stdout))
+
+        if result.returncode != 0:
+            raise subprocess.CalledProcessError(result.returncode, argv,
+                                                output=result.stdout, stderr=result.stderr)
+
+    async def run_async(self,
+                        argv: List[str],
+                        env: Optional[dict] = None) -> subprocess.CompletedProcess:
+        return self.run(argv, env)
+
+    async def run_output_async(self,
+                               argv: List[str],
+                               env: Optional[dict],
+                               output: str) -> subprocess.CompletedProcess:
+        """
+        Coroutine version of run_output()
+        """
+        return _converted(await self.run_async(argv, env), output)
+
+    async def stream_async(self,
+                           argv: List[str],
+                           env: Optional[dict],
+                           size: int = 65536) -> AsyncIterator[str]:
+        """
+        Yield the output of argv in chunks, then raise
+        subprocess.CalledProcessError if the command failed
+        """
+        result = await self.run_async(argv, env)
+
+        yield result.stdout
+
+        if result.returncode != 0:
+            raise subprocess.CalledProcessError(result.returncode, argv,
+                                                output=result.stdout, stderr=result.stderr)
+
+
+def _converted(result: subprocess.CompletedProcess, output: str) -> subprocess.CompletedProcess:
+    """
+    result of a command run for text output, with stdout as output asks
+    """
+    if output == OUTPUT_DISCARD:
+        result.stdout = None
+    elif output == OUTPUT_BYTES:
+        result.stdout = result.stdout.encode(locale.getpreferredencoding(False))
+
+    return result
+
+
+def _decode(output: bytes) -> str:
+    return output.decode(locale.getpreferredencoding(False))
+
+
+def _kill(process):
+    if process.returncode is None:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+
+
+async def _reap(process):
+    """
+    Kill the child if it is still running and wait for it to exit, the
+    wait is shielded so that cancelling the caller cannot leave it unreaped
+    """
+    import asyncio
+
+    _kill(process)
+    await asyncio.shield(process.wait())
+
+
+class SubprocessBackend(Backend):
+    """
+    Run commands as child processes
+    """
+
+    def run(self, argv: List[str], env: Optional[dict] = None) -> subprocess.CompletedProcess:
+        return self.run_output(argv, env, OUTPUT_TEXT)
+
+    def run_output(self,
+                   argv: List[str],
+                   env: Optional[dict],
+                   output: str) -> subprocess.CompletedProcess:
+        rusage = None
+
+        with subprocess.Popen(argv,
+                              stdout=(subprocess.DEVNULL if output == OUTPUT_DISCARD
+                                      else subprocess.PIPE),
+                              stderr=subprocess.PIPE,
+                              env=env) as process:
+            try:
+                if hasattr(os, "wait4"):
+                    # Read the pipes and reap the child here, Popen.wait would drop its rusage
+                    streams = [s for s in (process.stdout, process.stderr) if s is not None]
+                    outputs = _read_all([s.fileno() for s in streams])
+                    stdout = outputs[0] if process.stdout is not None else None
+                    stderr = outputs[-1]
+                    process.returncode, rusage = _wait(process.pid)
+                else:
+                    stdout, stderr = process.communicate()
+            except BaseException:
+                process.kill()
+                raise
+
+        output_bytes = len(stdout) if stdout is not None else None
+        if output == OUTPUT_TEXT:
+            stdout = _decode(stdout)
+
+        result = subprocess.CompletedProcess(argv, process.returncode, stdout, _decode(stderr))
+        result.rusage = rusage
+        result.output_bytes = output_bytes
+        return result
+
+    def stream(self,
+               argv: List[str],
+               env: Optional[dict],
+               read: Callable[[io.TextIOBase], Iterator]) -> Iterator:
+        """
+        Output is read as the child produces it. If the generator is
+        closed early the child process is killed.
+        """
+        # Imported here, most programs never stream and tempfile is slow to import
+        import tempfile
+
+        # stderr goes to a file so a chatty child can never block on a full pipe
+        with tempfile.TemporaryFile() as stderr_file:
+            process = subprocess.Popen(argv,
+                                       universal_newlines=True,
+                                       stdout=subprocess.PIPE,
+                                       stderr=stderr_file,
+                                       env=env)
+            exhausted = False
+            try:
+                yield from read(process.stdout)
+                exhausted = True
+            finally:
+                if not exhausted and process.poll() is None:
+                    process.kill()
+                process.stdout.close()
+                returncode = process.wait()
+
+            if returncode != 0:
+                stderr_file.seek(0)
+                raise subprocess.CalledProcessError(
+                    returncode, argv, stderr=stderr_file.read().decode(errors="replace"))
+
+    async def run_async(self,
+                        argv: List[str],
+                        env: Optional[dict] = None) -> subprocess.CompletedProcess:
+        return await self.run_output_async(argv, env, OUTPUT_TEXT)
+
+    async def run_output_async(self,
+                               argv: List[str],
+                               env: Optional[dict],
+                               output: str) -> subprocess.CompletedProcess:
+        """
+        Run with asyncio, cancelling kills the child process
+        """
+        import asyncio
+
+        process = await asyncio.create_subprocess_exec(
+            *argv,
+            stdout=subprocess.DEVNULL if output == OUTPUT_DISCARD else subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=env)
+        try:
+            stdout, stderr = await process.communicate()
+        except BaseException:
+            await _reap(process)
+            raise
+
+        output_bytes = len(stdout) if stdout is not None else None
+        if output == OUTPUT_TEXT:
+            stdout = _decode(stdout)
+
+        result = subprocess.CompletedProcess(argv, process.returncode, stdout, _decode(stderr))
+        result.output_bytes = output_bytes
+        return result
+
+    async def stream_async(self,
+                           argv: List[str],
+                           env: Optional[dict],
+                           size: int = 65536) -> AsyncIterator[str]:
+        import asyncio
+        import codecs
+
+        decoder = codecs.getincrementaldecoder(locale.getpreferredencoding(False))()
+
+        process = await asyncio.create_subprocess_exec(*argv,
+                                                       stdout=subprocess.PIPE,
+                                                       stderr=subprocess.PIPE,
+                                                       env=env)
+        try:
+            while True:
+                chunk = await process.stdout.read(size)
+                if not chunk:
+                    break
+                yield decoder.decode(chunk)
+
+            yield decoder.decode(b"", final=True)
+
+            stderr = await process.stderr.read()
+            await process.wait()
+        finally:
+            await _reap(process)
+
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, argv,
+                                                stderr=_decode(stderr))
+
+
+def _returncode(status: int) -> int:
+    """
+    Exit status of a wait status, negative signal number if killed
+    """
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def _wait(pid: int) -> tuple:
+    """
+    Reap pid, returning its exit status and resource usage
+    """
+    try:
+        _, status, rusage = os.wait4(pid, 0)
+    except ChildProcessError:
+        # Reaped elsewhere, report exit status 0 as subprocess does
+        return 0, None
+
+    return _returncode(status), rusage
+
+
+def _signal(pid: int):
+    try:
+        os.kill(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def _read_all(fds: List[int]) -> List[bytes]:
+    """
+    Read every fd to end of file at the same time, a child blocked on a
+    full stderr pipe could never finish writing stdout
+    """
+    # Imported here, only backends reading the pipes themselves need it
+    import selectors
+
+    chunks = {fd: [] for fd in fds}
+
+    with selectors.DefaultSelector() as selector:
+        for fd in fds:
+            selector.register(fd, selectors.EVENT_READ)
+
+        while selector.get_map():
+            for key, _ in selector.select():
+                data = os.read(key.fd, 65536)
+                if data:
+                    chunks[key.fd].append(data)
+                else:
+                    selector.unregister(key.fd)
+
+    return [b"".join(chunks[fd]) for fd in fds]
+
+
+class _Environments:
+    """
+    Environments made of base and a set of overrides, each built once
+    """
+
+    def __init__(self, base: dict):
+        self.base = base
+        # Merged environments by sorted override items, few distinct sets are ever used
+        self._merged = {}
+
+    def get(self, overrides: dict) -> dict:
+        key = tuple(sorted(overrides.items()))
+
+        env = self._merged.get(key)
+        if env is None:
+            env = dict(self.base)
+            env.update(overrides)
+            if len(self._merged) >= 64:
+                self._merged.clear()
+            self._merged[key] = env
+
+        return env
+
+
+class PosixSpawnBackend(Backend):
+    """
+    Run commands as child processes started with os.posix_spawn, which
+    uses vfork where the C library does and does not copy the page tables
+    of a large parent. Paths of zfs and zpool are looked up once, as is the
+    environment: commands get a copy of os.environ, or env, taken when the
+    backend is created. Coroutines use asyncio subprocesses.
+
+    Raises RuntimeError if os.posix_spawn is not available.
+    """
+
+    def __init__(self, env: Mapping[str, str] = None):
+        if not hasattr(os, "posix_spawn"):
+            raise RuntimeError("os.posix_spawn is not available on this platform")
+
+        self.env = dict(os.environ if env is None else env)
+
+        self._environments = _Environments(self.env)
+        self._executables = {}
+        self._asyncio = SubprocessBackend()
+
+        for program in ("zfs", "zpool"):
+            self._executables[program] = self._which(program)
+
+    def _which(self, program: str) -> Optional[str]:
+        # Imported here, shutil is slow to import and most backends never search PATH
+        import shutil
+
+        return shutil.which(program, path=self.env.get("PATH", os.defpath))
+
+    def executable(self, program: str) -> str:
+        """
+        Path program is run from, raises FileNotFoundError if it is not
+        in PATH. Paths of programs other than zfs and zpool are looked up
+        when first run.
+        """
+        if os.sep in program:
+            return program
+
+        path = self._executables.get(program)
+        if path is None:
+            path = self._which(program)
+            if path is None:
+                raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), program)
+            self._executables[program] = path
+
+        return path
+
+    def environment(self, overrides: dict) -> dict:
+        return self._environments.get(overrides)
+
+    def _spawn(self, argv: List[str], env: Optional[dict], stdout: Optional[int],
+               stderr: int) -> int:
+        """
+        Start argv with stdout and stderr on the given fds, stdout None
+        for /dev/null, returning its pid
+        """
+        stdout_action = (os.POSIX_SPAWN_DUP2, stdout, 1) if stdout is not None \
+            else (os.POSIX_SPAWN_OPEN, 1, os.devnull, os.O_WRONLY, 0)
+
+        return os.posix_spawn(
+            self.executable(argv[0]), argv, self.env if env is None else env,
+            file_actions=[stdout_action, (os.POSIX_SPAWN_DUP2, stderr, 2)],
+            # Python ignores SIGPIPE, restore the default as subprocess does
+            setsigdef=(signal.SIGPIPE, signal.SIGXFSZ))
+
+    def run(self, argv: List[str], env: Optional[dict] = None) -> subprocess.CompletedProcess:
+        return self.run_output(argv, env, OUTPUT_TEXT)
+
+    def run_output(self,
+                   argv: List[str],
+                   env: Optional[dict],
+                   output: str) -> subprocess.CompletedProcess:
+        stdout_read, stdout_write = os.pipe() if output != OUTPUT_DISCARD else (None, None)
+        stderr_read, stderr_write = os.pipe()
+        reading = [fd for fd in (stdout_read, stderr_read) if fd is not None]
+
+        try:
+            try:
+                pid = self._spawn(argv, env, stdout_write, stderr_write)
+            finally:
+                if stdout_write is not None:
+                    os.close(stdout_write)
+                os.close(stderr_write)
+
+            try:
+                outputs = _read_all(reading)
+            except BaseException:
+                _signal(pid)
+                _wait(pid)
+                raise
+        finally:
+            for fd in reading:
+                os.close(fd)
+
+        returncode, rusage = _wait(pid)
+
+        stdout = outputs[0] if stdout_read is not None else None
+        output_bytes = len(stdout) if stdout is not None else None
+        if output == OUTPUT_TEXT:
+            stdout = _decode(stdout)
+
+        result = subprocess.CompletedProcess(argv, returncode, stdout, _decode(outputs[-1]))
+        result.rusage = rusage
+        result.output_bytes = output_bytes
+        return result
+
+    def stream(self,
+               argv: List[str],
+               env: Optional[dict],
+               read: Callable[[io.TextIOBase], Iterator]) -> Iterator:
+        """
+        Output is read as the child produces it. If the generator is
+        closed early the child process is killed.
+        """
+        import tempfile
+
+        with tempfile.TemporaryFile() as stderr_file:
+            stdout_read, stdout_write = os.pipe()
+            try:
+                pid = self._spawn(argv, env, stdout_write, stderr_file.fileno())
+            except BaseException:
+                os.close(stdout_read)
+                raise
+            finally:
+                os.close(stdout_write)
+
+            exhausted = False
+            try:
+                with open(stdout_read, encoding=locale.getpreferredencoding(False)) as stdout:
+                    yield from read(stdout)
+                exhausted = True
+            finally:
+                if not exhausted:
+                    _signal(pid)
+                returncode, _ = _wait(pid)
+
+            if returncode != 0:
+                stderr_file.seek(0)
+                raise subprocess.CalledProcessError(
+                    returncode, argv, stderr=stderr_file.read().decode(errors="replace"))
+
+    async def run_async(self,
+                        argv: List[str],
+                        env: Optional[dict] = None) -> subprocess.CompletedProcess:
+        return await self._asyncio.run_async(argv, self.env if env is None else env)
+
+    async def run_output_async(self,
+                               argv: List[str],
+                               env: Optional[dict],
+                               output: str) -> subprocess.CompletedProcess:
+        return await self._asyncio.run_output_async(argv, self.env if env is None else env,
+                                                    output)
+
+    def stream_async(self,
+                     argv: List[str],
+                     env: Optional[dict],
+                     size: int = 65536) -> AsyncIterator[str]:
+        return self._asyncio.stream_async(argv, self.env if env is None else env, size)
+
+
+class RecordingBackend(Backend):
+    """
+    Run commands with another backend, a SubprocessBackend by default,
+    keeping every result in records. save() writes them for a ReplayBackend.
+    """
+
+    def __init__(self, backend: Backend = None):
+        self.backend = backend if backend is not None else SubprocessBackend()
+        self.records = []
+        self._lock = threading.Lock()
+
+    def run(self, argv: List[str], env: Optional[dict] = None) -> subprocess.CompletedProcess:
+        result = self.backend.run(argv, env)
+
+        with self._lock:
+            self.records.append(subprocess.CompletedProcess(
+                list(argv), result.returncode, result.stdout, result.stderr))
+
+        return result
+
+    def save(self, path: str):
+        import json
+
+        with self._lock:
+            records = [{"args": r.args, "returncode": r.returncode,
+                        "stdout": r.stdout, "stderr": r.stderr} for r in self.records]
+
+        with open(path, "w") as f:
+            json.dump(records, f, indent=1)
+
+
+class ReplayBackend(Backend):
+    """
+    Answer commands with recorded results instead of running anything.
+    Results for the same argv are returned in recorded order, the last one
+    is repeated once they run out. Unrecorded commands raise RuntimeError.
+    """
+
+    def __init__(self, records: Iterable[subprocess.CompletedProcess]):
+        self._results = collections.defaultdict(collections.deque)
+        self._lock = threading.Lock()
+
+        for record in records:
+            self._results[tuple(record.args)].append(record)
+
+    @classmethod
+    def load(cls, path: str) -> "ReplayBackend":
+        import json
+
+        with open(path) as f:
+            records = json.load(f)
+
+        return cls(subprocess.CompletedProcess(r["args"], r["returncode"], r["stdout"],
+                                               r["stderr"]) for r in records)
+
+    def run(self, argv: List[str], env: Optional[dict] = None) -> subprocess.CompletedProcess:
+        with self._lock:
+            results = self._results.get(tuple(argv))
+
+            if not results:
+                raise RuntimeError(f"No recorded result for '{' '.join(argv)}'")
+
+            result = results.popleft() if len(results) > 1 else results[0]
+
+        return subprocess.CompletedProcess(list(argv), result.returncode,
+                                           result.stdout, result.stderr)
+
+
+_backend = SubprocessBackend()
+
+
+def set_backend(backend: Backend = None) -> Backend:
+    """
+    Run all commands with backend for the rest of the process, None
+    restores a SubprocessBackend. Returns the previous backend.
+    Detected capabilities are cleared, they belong to the previous backend.
+    """
+    # capabilities imports this module
+    import pyzfscmds.capabilities
+
+    global _backend
+    previous = _backend
+    _backend = backend if backend is not None else SubprocessBackend()
+    pyzfscmds.capabilities.clear()
+    return previous
+
+
+def get_backend() -> Backend:
+    return _backend
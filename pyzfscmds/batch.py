@@ -0,0 +1,179 @@
+"""
+Run many zfs commands concurrently
+"""
+
+import collections
+import concurrent.futures
+import time
+
+from typing import Callable, Iterable, Optional, Union
+
+import pyzfscmds.cmd
+
+"""
+Result of one operation, error is the exception raised or None
+"""
+
+ItemResult = collections.namedtuple("ItemResult", ["operation", "output", "error", "duration"])
+
+
+class BatchResult:
+    """
+    Per operation results in input order, with throughput statistics
+    """
+
+    def __init__(self, items: list, elapsed: float):
+        self.items = items
+        self.elapsed = elapsed
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __getitem__(self, index: int) -> ItemResult:
+        return self.items[index]
+
+    @property
+    def outputs(self) -> list:
+        return [item.output for item in self.items]
+
+    @property
+    def errors(self) -> list:
+        return [item.error for item in self.items]
+
+    @property
+    def succeeded(self) -> int:
+        return sum(1 for item in self.items if item.error is None)
+
+    @property
+    def failed(self) -> int:
+        return len(self.items) - self.succeeded
+
+    @property
+    def throughput(self) -> float:
+        """Operations completed per second"""
+        return len(self.items) / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def mean_latency(self) -> float:
+        durations = [item.duration for item in self.items if item.duration is not None]
+        return sum(durations) / len(durations) if durations else 0.0
+
+    @property
+    def max_latency(self) -> float:
+        return max((item.duration for item in self.items if item.duration is not None),
+                   default=0.0)
+
+    def raise_on_error(self):
+        """Raise the first error, if any operation failed"""
+        for item in self.items:
+            if item.error is not None:
+                raise item.error
+
+
+class BatchCancelled(RuntimeError):
+    """Operation not started because an earlier one failed in fail fast mode"""
+
+
+Operation = Union[pyzfscmds.cmd._Command, Callable[[], str]]
+
+
+def _operation_pool(operation: Operation) -> Optional[str]:
+    if isinstance(operation, pyzfscmds.cmd._Command) and operation.targets:
+        return pyzfscmds.cmd._pool_name(operation.targets[-1])
+    return None
+
+
+def _execute(operation: Operation) -> tuple:
+    start = time.monotonic()
+    try:
+        if isinstance(operation, pyzfscmds.cmd._Command):
+            output = pyzfscmds.cmd._run(operation)
+        else:
+            output = operation()
+    except Exception as e:
+        return None, e, time.monotonic() - start
+
+    return output, None, time.monotonic() - start
+
+
+class BatchExecutor:
+    """
+    Thread pool running commands with at most max_workers in flight, and
+    at most max_in_flight_per_pool against any single pool.
+
+    Operations are _Command instances, such as those built by the private
+    builders in pyzfscmds.cmd, or callables taking no arguments. The pool
+    of a command is taken from its last target, callables share one group.
+    """
+
+    def __init__(self, max_workers: int = 8, max_in_flight_per_pool: int = 4):
+        if max_workers < 1 or max_in_flight_per_pool < 1:
+            raise RuntimeError("Concurrency limits must be at least 1")
+
+        self.max_workers = max_workers
+        self.max_in_flight_per_pool = max_in_flight_per_pool
+
+    def run(self, operations: Iterable[Operation], fail_fast: bool = False) -> BatchResult:
+        """
+        Run every operation and return their results in input order.
+        Failures are recorded per item, if fail_fast is set no new
+        operations are started after the first failure.
+        """
+        operations = list(operations)
+        results = [None] * len(operations)
+
+        pending = collections.OrderedDict()
+        for index, operation in enumerate(operations):
+            pending.setdefault(_operation_pool(operation), collections.deque()).append(index)
+
+        in_flight = collections.Counter()
+        futures = {}
+        start = time.monotonic()
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or futures:
+                # Round robin over pools so one large pool cannot starve the others
+                for pool in list(pending):
+                    queue = pending[pool]
+                    while (queue and in_flight[pool] < self.max_in_flight_per_pool
+                           and len(futures) < self.max_workers):
+                        index = queue.popleft()
+                        future = executor.submit(_execute, operations[index])
+                        futures[future] = (index, pool)
+                        in_flight[pool] += 1
+                    if not queue:
+                        del pending[pool]
+
+                done, _ = concurrent.futures.wait(
+                    futures, return_when=concurrent.futures.FIRST_COMPLETED)
+
+                for future in done:
+                    index, pool = futures.pop(future)
+                    in_flight[pool] -= 1
+                    output, error, duration = future.result()
+                    results[index] = ItemResult(operations[index], output, error, duration)
+
+                    if error is not None and fail_fast:
+                        for queue in pending.values():
+                            for skipped in queue:
+                                results[skipped] = ItemResult(
+                                    operations[skipped], None,
+                                    BatchCancelled("Cancelled after an earlier failure"), None)
+                        pending.clear()
+
+        return BatchResult(results, time.monotonic() - start)
+
+
+def run_batch(operations: Iterable[Operation],
+              max_workers: int = 8,
+              max_in_flight_per_pool: int = 4,
+              fail_fast: bool = False) -> BatchResult:
+    """
+    Run operations with a temporary BatchExecutor
+    """
+    executor = BatchExecutor(max_workers=max_workers,
+                             max_in_flight_per_pool=max_in_flight_per_pool)
+    return executor.run(operations, fail_fast=fail_fast)
@@ -0,0 +1,151 @@
+"""
+Read cache for zfs list and zfs get output
+
+Disabled by default, enable() turns it on for the whole process. Commands
+run through pyzfscmds.cmd which modify datasets invalidate the entries of
+every related dataset. Output of a read which was running while anything
+was invalidated is not stored. Changes made outside of pyzfscmds are only
+picked up once an entry expires.
+"""
+
+import collections
+import itertools
+import threading
+import time
+
+from typing import Iterable, Optional
+
+"""
+Name related to every dataset, invalidating it clears the cache
+"""
+
+EVERYTHING = ""
+
+# Generations are unique across caches, a result read while one cache was
+# enabled is never stored in the next
+_generations = itertools.count(1)
+
+
+def _dataset_name(name: str) -> str:
+    """Strip any snapshot or bookmark part of a name"""
+    return name.split("@", 1)[0].split("#", 1)[0]
+
+
+def related(first: str, second: str) -> bool:
+    """
+    True if one dataset is the other, or an ancestor of the other.
+    Snapshots are related to their dataset.
+    """
+    first = _dataset_name(first)
+    second = _dataset_name(second)
+
+    if first == EVERYTHING or second == EVERYTHING or first == second:
+        return True
+
+    return first.startswith(second + "/") or second.startswith(first + "/")
+
+
+class CommandCache:
+    """
+    LRU cache of command output with a time to live. Each entry records the
+    datasets it was read from so that only related entries are invalidated.
+    """
+
+    def __init__(self, ttl: float = 30.0, maxsize: int = 256):
+        if ttl <= 0 or maxsize <= 0:
+            raise RuntimeError("Cache ttl and maxsize must be positive")
+
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = collections.OrderedDict()
+        self._generation = next(_generations)
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self) -> int:
+        """
+        Changes whenever entries are invalidated or cleared
+        """
+        return self._generation
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: tuple) -> Optional[str]:
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key: tuple, datasets: Iterable[str], value: str, generation: int = None):
+        """
+        Store output read from datasets, an empty list of datasets means
+        the output covers every dataset. generation is read before running
+        the command, value is dropped if it has changed since.
+        """
+        datasets = tuple(datasets) or (EVERYTHING,)
+
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+
+            self._entries[key] = (time.monotonic() + self.ttl, datasets, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, names: Iterable[str]):
+        """
+        Drop entries read from any dataset related to names
+        """
+        names = list(names)
+
+        with self._lock:
+            # Reads running now may have seen the old state, even of datasets not cached yet
+            self._generation = next(_generations)
+
+            stale = [key for key, (_, datasets, _) in self._entries.items()
+                     if any(related(d, n) for d in datasets for n in names)]
+
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._generation = next(_generations)
+            self._entries.clear()
+
+
+_cache = None
+
+
+def enable(ttl: float = 30.0, maxsize: int = 256) -> CommandCache:
+    """
+    Cache zfs list and zfs get output for the rest of the process
+    """
+    global _cache
+    _cache = CommandCache(ttl=ttl, maxsize=maxsize)
+    return _cache
+
+
+def disable():
+    global _cache
+    _cache = None
+
+
+def get_cache() -> Optional[CommandCache]:
+    return _cache
@@ -0,0 +1,194 @@
+"""
+Detection of the installed ZFS version and the options it supports
+
+Detection runs once per process. It may also be stored on disk, keyed by
+the modification time of the zfs binary and kernel module, so that short
+lived programs skip it until ZFS is upgraded.
+"""
+
+import collections
+import os
+import re
+import threading
+
+from typing import Optional, Tuple
+
+import pyzfscmds.backend
+
+"""
+Detected version, a string such as '2.1.5' or None if unknown, and
+whether each option is supported. Unknown versions support nothing
+optional.
+"""
+
+Capabilities = collections.namedtuple("Capabilities", [
+    "version",
+    "multi_property_set",
+    "zpool_get_columns",
+    "wait",
+    "json",
+])
+
+"""
+First version supporting each option
+"""
+
+MINIMUM_VERSIONS = {
+    # zfs set a=1 b=2 ...
+    "multi_property_set": (0, 7, 0),
+    # zpool get -o
+    "zpool_get_columns": (0, 7, 0),
+    # zfs wait
+    "wait": (2, 0, 0),
+    # zfs list -j, zfs get -j and zpool get -j with --json-int
+    "json": (2, 3, 0),
+}
+
+LINUX_MODULE_VERSION = "/sys/module/zfs/version"
+
+_version_pattern = re.compile(r'(\d+)\.(\d+)(?:\.(\d+))?')
+
+_capabilities = None
+_lock = threading.Lock()
+
+
+def version_tuple(version: str) -> Optional[Tuple[int, int, int]]:
+    """
+    Convert a version string, e.g. 'zfs-2.1.5-1ubuntu6', to (2, 1, 5)
+    """
+    match = _version_pattern.search(version)
+
+    if match is None:
+        return None
+
+    return tuple(int(part or 0) for part in match.groups())
+
+
+def from_version(version: Optional[str]) -> Capabilities:
+    """
+    Capabilities of a ZFS version
+    """
+    parsed = version_tuple(version) if version is not None else None
+
+    return Capabilities(version=".".join(str(p) for p in parsed) if parsed else None,
+                        **{option: parsed is not None and parsed >= minimum
+                           for option, minimum in MINIMUM_VERSIONS.items()})
+
+
+def _probe_version() -> Optional[str]:
+    """
+    Version of the zfs userland, or of the kernel module for releases
+    without 'zfs version'
+    """
+    try:
+        result = pyzfscmds.backend.get_backend().run(["zfs", "version"])
+    except (OSError, RuntimeError):
+        result = None
+
+    output = result.stdout if result is not None and result.returncode == 0 else None
+
+    if output:
+        return output.splitlines()[0]
+
+    try:
+        with open(LINUX_MODULE_VERSION) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def _cache_key() -> list:
+    """
+    Identifies the installed zfs, changes when the binary or module is replaced
+    """
+    # The disk cache is optional, keep its imports out of pyzfscmds.cmd
+    import shutil
+
+    key = []
+    for path in (shutil.which("zfs"), LINUX_MODULE_VERSION):
+        try:
+            key.append([path, os.stat(path).st_mtime_ns])
+        except (OSError, TypeError):
+            key.append([path, None])
+
+    return key
+
+
+def _read_cache(cache_file: str, key: list) -> Optional[Capabilities]:
+    import json
+
+    try:
+        with open(cache_file) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(cached, dict) or cached.get("key") != key:
+        return None
+
+    return from_version(cached.get("version"))
+
+
+def _write_cache(cache_file: str, key: list, capabilities: Capabilities):
+    """
+    Replace the cache file atomically, failing to write is not an error
+    """
+    import json
+    import tempfile
+
+    directory = os.path.dirname(os.path.abspath(cache_file))
+
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=directory, prefix=".capabilities")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"key": key, "version": capabilities.version}, f)
+            os.replace(temporary, cache_file)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+    except OSError:
+        pass
+
+
+def detect(cache_file: str = None) -> Capabilities:
+    """
+    Detect the capabilities of the installed ZFS, once per process. If
+    cache_file is given the result is also read from and stored there.
+    Never raises, without a usable zfs the version is None.
+    """
+    global _capabilities
+
+    with _lock:
+        if _capabilities is not None:
+            return _capabilities
+
+        key = _cache_key() if cache_file is not None else None
+        capabilities = _read_cache(cache_file, key) if cache_file is not None else None
+
+        if capabilities is None:
+            capabilities = from_version(_probe_version())
+            if cache_file is not None:
+                _write_cache(cache_file, key, capabilities)
+
+        _capabilities = capabilities
+        return capabilities
+
+
+def detected() -> Optional[Capabilities]:
+    """
+    Result of an earlier detect() in this process, None if it has not run
+    since the last clear(). Never probes.
+    """
+    return _capabilities
+
+
+def clear():
+    """
+    Forget the in process result, the next detect() probes again
+    """
+    global _capabilities
+
+    with _lock:
+        _capabilities = None
@@ -0,0 +1,145 @@
+"""
+In memory catalog of datasets, loaded with a single zfs list call
+"""
+
+from typing import Iterable, List, Optional
+
+import pyzfscmds.cmd
+import pyzfscmds.parse
+
+CATALOG_COLUMNS = ["name", "type", "origin", "mountpoint"]
+
+
+class Catalog:
+    """
+    Snapshot of every dataset under target (or on the system if target is
+    None), indexed by name with parent/child links. Queries mirror the
+    helpers in pyzfscmds.utility without starting a process each.
+
+    The catalog is not updated by later changes, call refresh() to reload.
+    """
+
+    def __init__(self, target: str = None, rows: Iterable[List[str]] = None):
+        """
+        rows may be given as split 'zfs list -H -p -o name,type,origin,mountpoint'
+        output instead of running zfs list.
+        """
+        self.target = target
+        self._datasets = {}
+        self._children = {}
+        self._snapshots = {}
+
+        self.refresh(rows)
+
+    def refresh(self, rows: Iterable[List[str]] = None):
+        """
+        Reload the catalog, raises RuntimeError if zfs list fails
+        """
+        if rows is None:
+            rows = pyzfscmds.cmd.zfs_list_iter(self.target,
+                                               recursive=True,
+                                               parsable=True,
+                                               columns=CATALOG_COLUMNS,
+                                               zfs_types=["all"])
+
+        datasets = {}
+        children = {}
+        snapshots = {}
+
+        for record in pyzfscmds.parse.parse_list_rows(rows, columns=CATALOG_COLUMNS):
+            name = record.name
+            datasets[name] = record
+
+            if record.type == "snapshot":
+                snapshots.setdefault(name.rsplit('@', 1)[0], []).append(name)
+            elif record.type != "bookmark" and "/" in name:
+                children.setdefault(name.rsplit('/', 1)[0], []).append(name)
+
+        self._datasets = datasets
+        self._children = children
+        self._snapshots = snapshots
+
+    def __len__(self) -> int:
+        return len(self._datasets)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._datasets
+
+    def get(self, name: str) -> Optional[tuple]:
+        """
+        Record with the fields name, type, origin and mountpoint, or None
+        """
+        return self._datasets.get(name)
+
+    def children(self, dataset: str) -> List[str]:
+        """
+        Direct child filesystems and volumes of dataset
+        """
+        return list(self._children.get(dataset, []))
+
+    def snapshots(self, dataset: str) -> List[str]:
+        """
+        Snapshots of dataset in the order zfs listed them
+        """
+        return list(self._snapshots.get(dataset, []))
+
+    def dataset_exists(self, target: str, zfs_type: str = "filesystem") -> bool:
+        if target is None:
+            raise TypeError
+
+        record = self._datasets.get(target)
+
+        if record is None:
+            return False
+
+        return zfs_type == "all" or record.type == zfs_type
+
+    def is_snapshot(self, snapname: str) -> bool:
+        if "@" in snapname:
+            return self.dataset_exists(snapname, zfs_type="snapshot")
+
+        return False
+
+    def is_clone(self, dataset: str) -> bool:
+        """
+        Check if clone, raise if not valid dataset
+        """
+        record = self._datasets.get(dataset)
+
+        if record is None:
+            raise RuntimeError(f"Dataset {dataset} does not exist")
+
+        return record.origin != "-"
+
+    def dataset_parent(self, dataset: str) -> Optional[str]:
+        if dataset is None:
+            raise TypeError
+
+        if dataset not in self._datasets:
+            return None
+
+        return dataset.rsplit('/', 1)[0]
+
+    def dataset_child_name(self, dataset: str, check_exists: bool = True) -> Optional[str]:
+        if dataset is None:
+            raise TypeError
+
+        if check_exists and dataset not in self._datasets:
+            return None
+
+        return dataset.rsplit('/', 1)[-1]
+
+    def snapshot_parent_dataset(self, snapshot: str) -> Optional[str]:
+        """
+        Given a snapshot find the parent dataset
+        """
+        if snapshot is None:
+            raise TypeError
+
+        if not ("@" in snapshot):
+            return None
+
+        if not self.dataset_exists(snapshot, zfs_type="snapshot"):
+            return None
+
+        return snapshot.rsplit('@', 1)[-2]
@@ -1,13 +1,16 @@
 """ZFS library"""
 
+import collections
 import itertools
 import os
 import subprocess
+import sys
 
-from typing import List
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
 
-import pyzfscmds.check
-import pyzfscmds.utility
+import pyzfscmds.backend
+import pyzfscmds.cache
+import pyzfscmds.parse
 import pyzfscmds.system.agnostic
 
 """
@@ -15,6 +18,15 @@ ZFS commands
 """
 
 
+def _measure(argv: List[str]):
+    """
+    pyzfscmds.instrument.start, or None without importing it. Hooks can only
+    have been added once the module was imported.
+    """
+    instrument = sys.modules.get("pyzfscmds.instrument")
+    return instrument.start(argv) if instrument is not None else None
+
+
 class _Command:
 
     def __init__(self,
@@ -29,6 +41,17 @@ class _Command:
         self.targets = targets
         self.env_variables_override = env_variables_override
 
+        # Datasets read by a cacheable command, None if output is never cached
+        self.cache_datasets = None
+        # Datasets modified by the command, their cache entries are dropped
+        self.invalidates = None
+        # Start of the RuntimeError message raised if the command fails
+        self.failure = f"Failed to run {main_command} {sub_command}"
+        # Backend running this command, None for pyzfscmds.backend.get_backend()
+        self.backend = None
+        # How run() returns stdout, one of the pyzfscmds.backend OUTPUT_ modes
+        self.output = pyzfscmds.backend.OUTPUT_TEXT
+
         self.call_args = [o for o in options] if options is not None else []
 
         if properties:
@@ -54,15 +77,17 @@ class _Command:
             else:
                 self.call_args.extend(["-o", ",".join(columns)])
 
-    def run(self) -> str:
-
-        new_env = dict(os.environ)
+    def _prepare_env(self) -> Optional[dict]:
+        """
+        Environment of the command, None to inherit it unchanged
+        """
+        if not self.env_variables_override:
+            return None
 
-        if self.env_variables_override:
-            for key, value in self.env_variables_override.items():
-                new_env[key] = value
+        return self._get_backend().environment(self.env_variables_override)
 
-        arguments = self.call_args
+    def _prepare_call(self) -> list:
+        arguments = list(self.call_args)
 
         if hasattr(self, 'properties') and self.properties:
             arguments.extend(self.properties)
@@ -70,24 +95,233 @@ class _Command:
         if hasattr(self, 'targets') and self.targets:
             arguments.extend(self.targets)
 
-        zfs_call = [self.main_command, self.sub_command] + arguments
-
+        return [self.main_command, self.sub_command] + arguments
+
+    def _get_backend(self) -> pyzfscmds.backend.Backend:
+        return self.backend if self.backend is not None else pyzfscmds.backend.get_backend()
+
+    def _cache_key(self, zfs_call: list) -> tuple:
+        env = tuple(sorted(self.env_variables_override.items())) \
+            if self.env_variables_override else ()
+        return tuple(zfs_call), env
+
+    def _cacheable(self) -> bool:
+        return self.cache_datasets is not None and self.output == pyzfscmds.backend.OUTPUT_TEXT
+
+    def _cache_get(self, zfs_call: list) -> Optional[str]:
+        cache = pyzfscmds.cache.get_cache()
+        if cache is not None and self._cacheable():
+            return cache.get(self._cache_key(zfs_call))
+        return None
+
+    def _cache_generation(self) -> Optional[int]:
+        """
+        Generation of the cache before running the command, passed to _cache_put
+        """
+        cache = pyzfscmds.cache.get_cache()
+        if cache is not None and self._cacheable():
+            return cache.generation
+        return None
+
+    def _cache_put(self, zfs_call: list, output: str, generation: Optional[int]):
+        cache = pyzfscmds.cache.get_cache()
+        if cache is not None and self._cacheable():
+            cache.put(self._cache_key(zfs_call), self.cache_datasets, output, generation)
+
+    def _invalidate_cache(self):
+        cache = pyzfscmds.cache.get_cache()
+        if cache is not None and self.invalidates is not None:
+            cache.invalidate(self.invalidates)
+
+    def run(self) -> Union[str, bytes, Iterator[str]]:
+        """
+        Run the command returning its output as self.output asks: text,
+        bytes, an empty string if it was discarded, or for OUTPUT_STREAM an
+        iterator of chunks as run_chunks() returns.
+        """
+        if self.output == pyzfscmds.backend.OUTPUT_STREAM:
+            return self.run_chunks()
+
+        zfs_call = self._prepare_call()
+
+        output = self._cache_get(zfs_call)
+        if output is not None:
+            return output
+
+        generation = self._cache_generation()
+        backend = self._get_backend()
+        measurement = _measure(zfs_call)
         try:
-            output = subprocess.check_output(zfs_call,
-                                             universal_newlines=True,
-                                             stderr=subprocess.PIPE,
-                                             env=new_env)
-        except subprocess.CalledProcessError as e:
-            raise e
+            if self.output == pyzfscmds.backend.OUTPUT_TEXT:
+                result = backend.run(zfs_call, self._prepare_env())
+            else:
+                result = backend.run_output(zfs_call, self._prepare_env(), self.output)
+        except BaseException as e:
+            if measurement is not None:
+                measurement.fail(e)
+            raise
+        finally:
+            # A failed command may still have modified part of its targets
+            self._invalidate_cache()
+
+        if measurement is not None:
+            measurement.finish(result)
+
+        # Discarded output reads as empty
+        output = result.stdout if result.stdout is not None else ""
+
+        if result.returncode != 0:
+            raise subprocess.CalledProcessError(result.returncode, zfs_call,
+                                                output=output, stderr=result.stderr)
+
+        self._cache_put(zfs_call, output, generation)
 
         return output
 
+    def _stream(self, split_output, split_stdout) -> Iterator:
+        """
+        Run the command yielding the items split_stdout reads from its
+        stdout, or split_output makes of cached output.
+        """
+        zfs_call = self._prepare_call()
+
+        # Streamed output is too large to store, but can be served from the cache
+        output = self._cache_get(zfs_call)
+        if output is not None:
+            yield from split_output(output)
+            return
+
+        measurement = _measure(zfs_call)
+        if measurement is None:
+            yield from self._get_backend().stream(zfs_call, self._prepare_env(), split_stdout)
+            return
+
+        exhausted = False
+        error = None
+        try:
+            yield from self._get_backend().stream(zfs_call, self._prepare_env(), split_stdout)
+            exhausted = True
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if error is not None:
+                measurement.fail(error)
+            else:
+                measurement.finish_stream(exhausted)
+
+    def run_iter(self) -> Iterator[List[str]]:
+        """
+        Run the command yielding each line of output split on tabs as it is
+        produced, output is never held in memory as a whole.
+
+        If the generator is closed early the child process is killed.
+        Raises subprocess.CalledProcessError once output is exhausted if
+        the command failed.
+        """
+        return self._stream(
+            lambda output: (line.split("\t") for line in output.splitlines()),
+            lambda stdout: (line.rstrip("\n").split("\t") for line in stdout))
+
+    def run_chunks(self, size: int = 65536) -> Iterator[str]:
+        """
+        Run the command yielding its output in chunks of up to size
+        characters, for output which is not line oriented. Behaves as
+        run_iter otherwise.
+        """
+        return self._stream(
+            lambda output: [output],
+            lambda stdout: iter(lambda: stdout.read(size), ""))
+
+
+def _run(command: _Command) -> str:
+    try:
+        return command.run()
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"{command.failure}\n{e.output}\n")
+
+
+def _pool_name(dataset: str) -> str:
+    return dataset.split("/", 1)[0].split("@", 1)[0]
+
+
+# Used when the system does not report ARG_MAX, the Linux default
+_DEFAULT_ARG_MAX = 2097152
+# Headroom for the auxiliary vector and anything else sharing argv space
+_ARG_MAX_HEADROOM = 4096
+# Linux also limits the length of a single argument to 32 pages
+MAX_ARGUMENT_LENGTH = 131072
+
+
+def _argument_size(argument: str) -> int:
+    """Bytes used by one string on the command line, with its pointer"""
+    return len(os.fsencode(argument)) + 1 + 8
+
+
+def _argument_space() -> int:
+    """
+    Bytes available for command line arguments, ARG_MAX less the space
+    taken by the environment. Each string also costs a pointer.
+    """
+    try:
+        arg_max = os.sysconf("SC_ARG_MAX")
+    except (ValueError, OSError):
+        arg_max = _DEFAULT_ARG_MAX
+
+    if arg_max <= 0:
+        arg_max = _DEFAULT_ARG_MAX
+
+    env_size = sum(_argument_size(f"{k}={v}") for k, v in os.environ.items())
+
+    return max(arg_max - env_size - _ARG_MAX_HEADROOM, _ARG_MAX_HEADROOM)
+
+
+def _chunk_arguments(arguments: List[str], reserved: int = 0,
+                     limit: int = None) -> Iterator[List[str]]:
+    """
+    Split arguments into lists which fit on one command line alongside
+    reserved bytes of fixed arguments.
+    """
+    if limit is None:
+        limit = _argument_space()
+
+    available = limit - reserved
+    chunk = []
+    size = 0
+
+    for argument in arguments:
+        argument_size = _argument_size(argument)
+
+        if chunk and size + argument_size > available:
+            yield chunk
+            chunk = []
+            size = 0
+
+        chunk.append(argument)
+        size += argument_size
+
+    if chunk:
+        yield chunk
+
 
 """
 zpool Commands
 """
 
 
+def _zpool_set_command(pool: str, prop: str) -> _Command:
+    if pool is None:
+        raise TypeError("Target name cannot be of type 'None'")
+
+    command = _Command("set", [],
+                       main_command="zpool",
+                       targets=[prop, pool])
+    command.failure = f"Failed to set pool property {prop}"
+    command.output = pyzfscmds.backend.OUTPUT_DISCARD
+
+    return command
+
+
 def zpool_set(pool: str, prop: str) -> str:
     """
     zpool set property=value pool
@@ -96,24 +330,60 @@ def zpool_set(pool: str, prop: str) -> str:
              Properties section for more information on what properties
              can be set and acceptable values.
     """
-    if pool is None:
-        raise TypeError("Target name cannot be of type 'None'")
+    return _run(_zpool_set_command(pool, prop))
 
-    command = _Command("set", [],
+
+def _zpool_get_command(pool: str = None,
+                       scripting: bool = True,
+                       properties: list = None,
+                       columns: list = None,
+                       parsable: bool = False,
+                       json_output: bool = False) -> _Command:
+    call_args = []
+
+    if json_output:
+        call_args.extend(["-j", "--json-int"])
+    else:
+        if scripting:
+            call_args.append("-H")
+
+        if parsable:
+            call_args.append("-p")
+
+    if properties is None:
+        property_target = "all"
+    elif properties:
+        if "all" in properties:
+            if len(properties) < 2:
+                property_target = "all"
+            else:
+                raise RuntimeError(f"Cannot use 'all' with other properties")
+        else:
+            property_target = ",".join(properties)
+    else:
+        raise RuntimeError(f"Cannot request no property type")
+
+    target_list = [property_target]
+    if pool is not None:
+        target_list.append(pool)
+
+    command = _Command("get", call_args,
                        main_command="zpool",
-                       targets=[prop, pool])
+                       targets=target_list)
 
-    try:
-        return command.run()
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"Failed to set pool property {prop}\n{e.output}\n")
+    command.argcheck_columns(columns)
+    command.failure = f"Failed to get zfs property '{property_target}' from {pool}"
+
+    return command
 
 
 def zpool_get(pool: str = None,
               scripting: bool = True,
               properties: list = None,
               columns: list = None,
-              parsable: bool = False) -> str:
+              parsable: bool = False,
+              parsed: bool = False,
+              json_output: bool = False) -> Union[str, list]:
     """
      zpool get [-Hp] [-o field[,field]...] all|property[,property]...
              pool...
@@ -140,43 +410,80 @@ def zpool_get(pool: str = None,
 
     NOTE: -o requires zfsonlinux 0.7.0
     https://github.com/zfsonlinux/zfs/commit/2a8b84b747cb27a175aa3a45b8cdb293cde31886
+
+    If parsed is True a list of records is returned instead of text, see
+    pyzfscmds.parse.parse_get_rows. json_output implies parsed, see
+    zpool_get_iter.
     """
-    call_args = []
+    if parsed or json_output:
+        return list(zpool_get_iter(pool=pool,
+                                   properties=properties,
+                                   columns=columns,
+                                   parsable=parsable,
+                                   parsed=True,
+                                   json_output=json_output))
+
+    return _run(_zpool_get_command(pool=pool,
+                                   scripting=scripting,
+                                   properties=properties,
+                                   columns=columns,
+                                   parsable=parsable))
+
+
+def _detect():
+    """
+    pyzfscmds.capabilities.detect, the module is imported on first use
+    """
+    # Detection is never needed to import this module
+    import pyzfscmds.capabilities
 
-    if scripting:
-        call_args.append("-H")
+    return pyzfscmds.capabilities.detect()
 
-    if parsable:
-        call_args.append("-p")
 
-    if properties is None:
-        property_target = "all"
-    elif properties:
-        if "all" in properties:
-            if len(properties) < 2:
-                property_target = "all"
-            else:
-                raise RuntimeError(f"Cannot use 'all' with other properties")
-        else:
-            property_target = ",".join(properties)
-    else:
-        raise RuntimeError(f"Cannot request no property type")
+def _json_supported(json_output: bool) -> bool:
+    return json_output and _detect().json
 
-    target_list = [property_target]
-    if pool is not None:
-        target_list.append(pool)
 
-    command = _Command("get", call_args,
-                       main_command="zpool",
-                       targets=target_list)
+def zpool_get_iter(pool: str = None,
+                   properties: list = None,
+                   columns: list = None,
+                   parsable: bool = False,
+                   parsed: bool = False,
+                   json_output: bool = False) -> Iterator[Union[List[str], tuple]]:
+    """
+     zpool get -H [-p] [-o field[,field]...] all|property[,property]... pool...
 
-    command.argcheck_columns(columns)
+     Generator variant of zpool_get, yields each row as a list of fields.
+     If parsed is True records are yielded instead of lists.
+
+     If json_output is True and zpool supports it, output is read as JSON
+     (-j --json-int) and decoded as it streams. Rows are the same as those
+     of parsable text output, which is used when JSON is not supported.
+    """
+    if json_output:
+        parsable = True
+
+    if _json_supported(json_output):
+        columns = list(pyzfscmds.parse.get_columns(columns))
+        command = _zpool_get_command(pool=pool, properties=properties, json_output=True)
+        rows = pyzfscmds.parse.json_rows(
+            command.run_chunks(), "pools",
+            lambda name, entry: pyzfscmds.parse.json_get_rows(name, entry, columns))
+    else:
+        command = _zpool_get_command(pool=pool,
+                                     scripting=True,
+                                     properties=properties,
+                                     columns=columns,
+                                     parsable=parsable)
+        rows = command.run_iter()
+
+    if parsed:
+        rows = pyzfscmds.parse.parse_get_rows(rows, columns=columns, parsable=parsable)
 
     try:
-        return command.run()
+        yield from rows
     except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"Failed to get zfs property '{property_target}' "
-                           f"from {pool}\n{e.output}\n")
+        raise RuntimeError(f"{command.failure}\n{e.stderr}\n")
 
 
 """
@@ -184,13 +491,10 @@ zfs Commands
 """
 
 
-def zfs_create_dataset(filesystem: str,
-                       create_parent: bool = False,
-                       mounted: bool = True,
-                       properties: list = None) -> str:
-    """
-     zfs create	[-pu] [-o property=value]... filesystem
-    """
+def _zfs_create_dataset_command(filesystem: str,
+                                create_parent: bool = False,
+                                mounted: bool = True,
+                                properties: list = None) -> _Command:
     if filesystem is None:
         raise TypeError("Filesystem name cannot be of type 'None'")
 
@@ -200,29 +504,39 @@ def zfs_create_dataset(filesystem: str,
         call_args.append('-p')
 
     if not mounted:
-        if pyzfscmds.check.check_valid_system() == "freebsd":
+        if pyzfscmds.system.agnostic.check_valid_system() == "freebsd":
             call_args.append('-u')
         else:
             raise SystemError("-u is not valid on this system")
 
-    create = _Command("create", call_args, properties=properties, targets=[filesystem])
+    command = _Command("create", call_args, properties=properties, targets=[filesystem])
+    command.invalidates = [filesystem]
+    command.failure = f"Failed to create {filesystem}"
+    command.output = pyzfscmds.backend.OUTPUT_DISCARD
 
-    try:
-        return create.run()
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"Failed to create {filesystem}\n{e.output}\n")
+    return command
 
 
-def zfs_create_zvol(volume: str,
-                    size: int,
-                    size_suffix: str = "G",
-                    blocksize: int = None,
-                    create_parent: bool = False,
-                    sparse: bool = False,
-                    properties: list = None) -> str:
+def zfs_create_dataset(filesystem: str,
+                       create_parent: bool = False,
+                       mounted: bool = True,
+                       properties: list = None) -> str:
     """
-     zfs create	[-ps] [-b blocksize] [-o property=value]... -V size volume
+     zfs create	[-pu] [-o property=value]... filesystem
     """
+    return _run(_zfs_create_dataset_command(filesystem=filesystem,
+                                            create_parent=create_parent,
+                                            mounted=mounted,
+                                            properties=properties))
+
+
+def _zfs_create_zvol_command(volume: str,
+                             size: int,
+                             size_suffix: str = "G",
+                             blocksize: int = None,
+                             create_parent: bool = False,
+                             sparse: bool = False,
+                             properties: list = None) -> _Command:
     if volume is None:
         raise TypeError("Filesystem name cannot be of type 'None'")
 
@@ -240,32 +554,84 @@ def zfs_create_zvol(volume: str,
     call_args.extend(['-V', f"{str(size)}{size_suffix}"])
 
     command = _Command("create", call_args, properties=properties, targets=[volume])
+    command.invalidates = [volume]
+    command.failure = f"Failed to create {volume}"
+    command.output = pyzfscmds.backend.OUTPUT_DISCARD
 
-    try:
-        return command.run()
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"Failed to create {volume}\n{e.output}\n")
+    return command
+
+
+def zfs_create_zvol(volume: str,
+                    size: int,
+                    size_suffix: str = "G",
+                    blocksize: int = None,
+                    create_parent: bool = False,
+                    sparse: bool = False,
+                    properties: list = None) -> str:
+    """
+     zfs create	[-ps] [-b blocksize] [-o property=value]... -V size volume
+    """
+    return _run(_zfs_create_zvol_command(volume=volume,
+                                         size=size,
+                                         size_suffix=size_suffix,
+                                         blocksize=blocksize,
+                                         create_parent=create_parent,
+                                         sparse=sparse,
+                                         properties=properties))
+
+
+def _zfs_clone_command(snapname: str,
+                       filesystem: str,
+                       properties: list = None,
+                       create_parent: bool = False) -> _Command:
+    if snapname is None:
+        raise TypeError("Snapshot name cannot be of type 'None'")
+
+    call_args = []
+
+    if create_parent:
+        call_args = ["-p"]
+
+    command = _Command("clone", call_args, properties=properties, targets=[snapname, filesystem])
+    command.invalidates = [snapname, filesystem]
+    command.failure = f"Failed to clone {filesystem}"
+    command.output = pyzfscmds.backend.OUTPUT_DISCARD
+
+    return command
 
 
 def zfs_clone(snapname: str,
               filesystem: str,
               properties: list = None,
               create_parent: bool = False) -> str:
+    """
+     zfs clone [-p] [-o property=value]... snapshot filesystem|volume
+    """
+    return _run(_zfs_clone_command(snapname=snapname,
+                                   filesystem=filesystem,
+                                   properties=properties,
+                                   create_parent=create_parent))
+
 
+def _zfs_snapshot_command(filesystem: str,
+                          snapname: str,
+                          recursive: bool = False,
+                          properties: list = None) -> _Command:
     if snapname is None:
         raise TypeError("Snapshot name cannot be of type 'None'")
 
     call_args = []
 
-    if create_parent:
-        call_args = ["-p"]
+    if recursive:
+        call_args = ["-r"]
 
-    command = _Command("clone", call_args, properties=properties, targets=[snapname, filesystem])
+    command = _Command("snapshot", call_args,
+                       properties=properties, targets=[f"{filesystem}@{snapname}"])
+    command.invalidates = [filesystem]
+    command.failure = f"Failed to snapshot {filesystem}"
+    command.output = pyzfscmds.backend.OUTPUT_DISCARD
 
-    try:
-        return command.run()
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"Failed to clone {filesystem}\n{e.output}\n")
+    return command
 
 
 def zfs_snapshot(filesystem: str,
@@ -277,49 +643,133 @@ def zfs_snapshot(filesystem: str,
      filesystem@snapname|volume@snapname
      filesystem@snapname|volume@snapname...
     """
-    if snapname is None:
-        raise TypeError("Snapshot name cannot be of type 'None'")
+    return _run(_zfs_snapshot_command(filesystem=filesystem,
+                                      snapname=snapname,
+                                      recursive=recursive,
+                                      properties=properties))
 
-    call_args = []
 
-    if recursive:
-        call_args = ["-r"]
+def _snapshot_rounds(snapshots: List[str], recursive: bool = False) -> List[List[str]]:
+    """
+    Split snapshots of one pool into groups zfs can create in one call,
+    in order. zfs rejects a call snapshotting a dataset twice, which with
+    recursive includes a target nested in another target.
+    """
+    # Datasets of each round, and with recursive every ancestor of them
+    rounds = []
+
+    for snapshot in snapshots:
+        dataset = snapshot.split("@", 1)[0]
+        parts = dataset.split("/")
+        ancestors = ["/".join(parts[:i]) for i in range(1, len(parts))]
+
+        for datasets, parents, members in rounds:
+            if dataset in datasets:
+                continue
+            if recursive and (dataset in parents or any(a in datasets for a in ancestors)):
+                continue
+            break
+        else:
+            datasets, parents, members = set(), set(), []
+            rounds.append((datasets, parents, members))
 
-    command = _Command("snapshot", call_args,
-                       properties=properties, targets=[f"{filesystem}@{snapname}"])
+        datasets.add(dataset)
+        parents.update(ancestors)
+        members.append(snapshot)
 
-    try:
-        return command.run()
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"Failed to snapshot {filesystem}\n{e.output}\n")
+    return [members for _, _, members in rounds]
 
 
-def zfs_get(target: str,
-            recursive: bool = False,
-            depth: int = None,
-            scripting: bool = True,
-            parsable: bool = False,
-            columns: list = None,
-            zfs_types: list = None,
-            source: list = None,
-            properties: list = None,
-            env_variables_override: dict = None) -> str:
-    """
-     zfs get [-r|-d depth] [-Hp] [-o all | field[,field]...] [-t
-     type[,type]...] [-s source[,source]...] all | property[,property]...
-     filesystem|volume|snapshot...
+def _zfs_snapshot_multiple_commands(targets: Iterable[Union[str, Tuple[str, str]]],
+                                    snapname: str = None,
+                                    recursive: bool = False,
+                                    properties: list = None) -> List[_Command]:
+    snapshots = collections.OrderedDict()
+
+    for target in targets:
+        if isinstance(target, str):
+            if snapname is None:
+                raise TypeError("Snapshot name cannot be of type 'None'")
+            filesystem, name = target, snapname
+        else:
+            filesystem, name = target
+
+        if filesystem is None or name is None:
+            raise TypeError("Snapshot name cannot be of type 'None'")
+
+        # zfs only creates snapshots of a single pool in one call
+        snapshots.setdefault(_pool_name(filesystem), []).append(f"{filesystem}@{name}")
+
+    if not snapshots:
+        raise RuntimeError("No snapshots requested")
+
+    call_args = ["-r"] if recursive else []
+
+    # Reserve room for the command, options and properties
+    fixed = ["zfs", "snapshot"] + call_args + _Command._prepare_properties(properties)
+    reserved = sum(_argument_size(a) for a in fixed)
+
+    commands = []
+    for pool_snapshots in snapshots.values():
+        for group in _snapshot_rounds(pool_snapshots, recursive):
+            for chunk in _chunk_arguments(group, reserved=reserved):
+                command = _Command("snapshot", call_args, properties=properties,
+                                   targets=chunk)
+                command.invalidates = [s.split("@", 1)[0] for s in chunk]
+                command.failure = f"Failed to create snapshots {chunk[0]} to {chunk[-1]}"
+                command.output = pyzfscmds.backend.OUTPUT_DISCARD
+                commands.append(command)
+
+    return commands
+
+
+def zfs_snapshot_multiple(targets: Iterable[Union[str, Tuple[str, str]]],
+                          snapname: str = None,
+                          recursive: bool = False,
+                          properties: list = None) -> str:
     """
+     zfs snapshot|snap [-r] [-o	property=value]...
+     filesystem@snapname|volume@snapname
+     filesystem@snapname|volume@snapname...
 
+     Snapshot many datasets with as few zfs calls as possible. targets are
+     dataset names, snapshotted as snapname, or (dataset, snapname) pairs.
+
+     Snapshots in one call are created atomically in one transaction group.
+     One call is made per pool, split further if the arguments exceed
+     ARG_MAX, only snapshots within a call are atomic with each other.
+     Further snapshots of a dataset, and with recursive snapshots of a
+     target nested in another, go in later calls in the order given.
+     If a call fails, snapshots from earlier calls remain.
+    """
+    return "".join(_run(command) for command in _zfs_snapshot_multiple_commands(
+        targets, snapname=snapname, recursive=recursive, properties=properties))
+
+
+def _zfs_get_command(target: Union[str, List[str]],
+                     recursive: bool = False,
+                     depth: int = None,
+                     scripting: bool = True,
+                     parsable: bool = False,
+                     columns: list = None,
+                     zfs_types: list = None,
+                     source: list = None,
+                     properties: list = None,
+                     env_variables_override: dict = None,
+                     json_output: bool = False) -> _Command:
     call_args = []
 
     if recursive:
         call_args.append("-r")
 
-    if scripting:
-        call_args.append("-H")
+    if json_output:
+        call_args.extend(["-j", "--json-int"])
+    else:
+        if scripting:
+            call_args.append("-H")
 
-    if parsable:
-        call_args.append("-p")
+        if parsable:
+            call_args.append("-p")
 
     if zfs_types:
         call_args.extend(["-t", ",".join(zfs_types)])
@@ -340,44 +790,176 @@ def zfs_get(target: str,
     else:
         raise RuntimeError(f"Cannot request no property type")
 
-    command = _Command("get", call_args, targets=[property_target, target],
+    targets = [target] if isinstance(target, str) else list(target)
+
+    command = _Command("get", call_args, targets=[property_target] + targets,
                        env_variables_override=env_variables_override)
+    command.cache_datasets = targets
+    command.failure = f"Failed to get zfs properties of {' '.join(targets)}"
 
     command.argcheck_depth(depth)
     command.argcheck_columns(columns)
 
-    try:
-        return command.run()
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"Failed to get zfs properties of {target}\n{e.output}\n")
+    return command
 
 
-def zfs_list(target: str,
-             recursive: bool = False,
-             depth: int = None,
-             scripting: bool = True,
-             parsable: bool = False,
-             columns: list = None,
-             zfs_types: list = None,
-             sort_properties_ascending: list = None,
-             sort_properties_descending: list = None,
-             env_variables_override: dict = None) -> str:
+def zfs_get(target: str,
+            recursive: bool = False,
+            depth: int = None,
+            scripting: bool = True,
+            parsable: bool = False,
+            columns: list = None,
+            zfs_types: list = None,
+            source: list = None,
+            properties: list = None,
+            env_variables_override: dict = None,
+            parsed: bool = False,
+            columnar: bool = False,
+            json_output: bool = False) -> Union[str, list, pyzfscmds.parse.Columnar]:
     """
-     zfs list [-r|-d depth] [-Hp] [-o property[,property]...] [-t
-     type[,type]...] [-s property]... [-S property]...
+     zfs get [-r|-d depth] [-Hp] [-o all | field[,field]...] [-t
+     type[,type]...] [-s source[,source]...] all | property[,property]...
      filesystem|volume|snapshot...
-    """
 
-    call_args = []
+     If parsed is True a list of records is returned instead of text,
+     see pyzfscmds.parse.parse_get_rows. If columnar is True a
+     pyzfscmds.parse.Columnar with one column per property is returned.
+     Parsing implies scripting mode.
 
-    if recursive:
-        call_args.append("-r")
+     json_output implies parsable and, unless columnar, parsed output,
+     see zfs_get_iter.
+    """
+    if parsed and columnar:
+        raise RuntimeError("Cannot request both parsed and columnar output")
+
+    if json_output:
+        parsable = True
+        parsed = not columnar
+
+    if columnar:
+        rows = zfs_get_iter(target,
+                            recursive=recursive,
+                            depth=depth,
+                            parsable=parsable,
+                            columns=columns,
+                            zfs_types=zfs_types,
+                            source=source,
+                            properties=properties,
+                            env_variables_override=env_variables_override,
+                            json_output=json_output)
+        return pyzfscmds.parse.columnar_get_rows(rows, columns=columns, parsable=parsable)
+
+    if parsed:
+        return list(zfs_get_iter(target,
+                                 recursive=recursive,
+                                 depth=depth,
+                                 parsable=parsable,
+                                 columns=columns,
+                                 zfs_types=zfs_types,
+                                 source=source,
+                                 properties=properties,
+                                 env_variables_override=env_variables_override,
+                                 parsed=True,
+                                 json_output=json_output))
+
+    command = _zfs_get_command(target,
+                               recursive=recursive,
+                               depth=depth,
+                               scripting=scripting,
+                               parsable=parsable,
+                               columns=columns,
+                               zfs_types=zfs_types,
+                               source=source,
+                               properties=properties,
+                               env_variables_override=env_variables_override)
+
+    return _run(command)
+
+
+def zfs_get_iter(target: str,
+                 recursive: bool = False,
+                 depth: int = None,
+                 parsable: bool = False,
+                 columns: list = None,
+                 zfs_types: list = None,
+                 source: list = None,
+                 properties: list = None,
+                 env_variables_override: dict = None,
+                 parsed: bool = False,
+                 json_output: bool = False) -> Iterator[Union[List[str], tuple]]:
+    """
+     zfs get -H [-r|-d depth] [-p] [-o all | field[,field]...] [-t
+     type[,type]...] [-s source[,source]...] all | property[,property]...
+     filesystem|volume|snapshot...
 
-    if scripting:
-        call_args.append("-H")
+     Generator variant of zfs_get, yields each row as a list of fields as
+     soon as zfs outputs it. Always runs in scripting mode.
+     If parsed is True records are yielded instead of lists.
 
-    if parsable:
-        call_args.append("-p")
+     If json_output is True and zfs supports it, output is read as JSON
+     (-j --json-int) and decoded as it streams. Rows are the same as those
+     of parsable text output, which is used when JSON is not supported.
+    """
+    if json_output:
+        parsable = True
+
+    json_output = _json_supported(json_output)
+
+    if json_output:
+        columns = list(pyzfscmds.parse.get_columns(columns))
+
+    command = _zfs_get_command(target,
+                               recursive=recursive,
+                               depth=depth,
+                               scripting=True,
+                               parsable=parsable,
+                               columns=columns,
+                               zfs_types=zfs_types,
+                               source=source,
+                               properties=properties,
+                               env_variables_override=env_variables_override,
+                               json_output=json_output)
+
+    if json_output:
+        rows = pyzfscmds.parse.json_rows(
+            command.run_chunks(), "datasets",
+            lambda name, entry: pyzfscmds.parse.json_get_rows(name, entry, columns))
+    else:
+        rows = command.run_iter()
+
+    if parsed:
+        rows = pyzfscmds.parse.parse_get_rows(rows, columns=columns, parsable=parsable)
+
+    try:
+        yield from rows
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"{command.failure}\n{e.stderr}\n")
+
+
+def _zfs_list_command(target: str,
+                      recursive: bool = False,
+                      depth: int = None,
+                      scripting: bool = True,
+                      parsable: bool = False,
+                      columns: list = None,
+                      zfs_types: list = None,
+                      sort_properties_ascending: list = None,
+                      sort_properties_descending: list = None,
+                      env_variables_override: dict = None,
+                      json_output: bool = False) -> _Command:
+    call_args = []
+
+    if recursive:
+        call_args.append("-r")
+
+    if json_output:
+        call_args.extend(["-j", "--json-int"])
+    else:
+        if scripting:
+            call_args.append("-H")
+
+        if parsable:
+            call_args.append("-p")
 
     if zfs_types:
         call_args.extend(["-t", ",".join(zfs_types)])
@@ -390,27 +972,165 @@ def zfs_list(target: str,
         call_args.extend(
             [p for prop in sort_properties_descending for p in ("-S", prop)])
 
-    command = _Command("list", call_args, targets=[target],
+    targets = [target] if target is not None else []
+
+    command = _Command("list", call_args, targets=targets,
                        env_variables_override=env_variables_override)
+    command.cache_datasets = targets
+    command.failure = f"Failed to get zfs list of {target}"
     command.argcheck_depth(depth)
     command.argcheck_columns(columns)
 
-    try:
-        return command.run()
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"Failed to get zfs list of {target}\n{e.output}\n")
+    return command
 
 
-def zfs_destroy(target: str,
-                recursive_children: bool = False,
-                recursive_dependents: bool = False,
-                force_unmount: bool = False,
-                dry_run: bool = False,
-                machine_parsable: bool = False,
-                verbose: bool = False) -> str:
+def zfs_list(target: str,
+             recursive: bool = False,
+             depth: int = None,
+             scripting: bool = True,
+             parsable: bool = False,
+             columns: list = None,
+             zfs_types: list = None,
+             sort_properties_ascending: list = None,
+             sort_properties_descending: list = None,
+             env_variables_override: dict = None,
+             parsed: bool = False,
+             columnar: bool = False,
+             json_output: bool = False) -> Union[str, list, pyzfscmds.parse.Columnar]:
     """
-    zfs destroy [-fnpRrv] filesystem|volume
+     zfs list [-r|-d depth] [-Hp] [-o property[,property]...] [-t
+     type[,type]...] [-s property]... [-S property]...
+     [filesystem|volume|snapshot...]
+
+     If target is None all datasets are listed.
+     If parsed is True a list of records is returned instead of text,
+     see pyzfscmds.parse.parse_list_rows. If columnar is True a
+     pyzfscmds.parse.Columnar is returned. Parsing implies scripting mode.
+
+     json_output implies parsable and, unless columnar, parsed output,
+     see zfs_list_iter.
+    """
+    if parsed and columnar:
+        raise RuntimeError("Cannot request both parsed and columnar output")
+
+    if json_output:
+        parsable = True
+        parsed = not columnar
+
+    if columnar:
+        # Fail before running anything if the columns cannot be parsed
+        pyzfscmds.parse.list_columns(columns)
+        rows = zfs_list_iter(target,
+                             recursive=recursive,
+                             depth=depth,
+                             parsable=parsable,
+                             columns=columns,
+                             zfs_types=zfs_types,
+                             sort_properties_ascending=sort_properties_ascending,
+                             sort_properties_descending=sort_properties_descending,
+                             env_variables_override=env_variables_override,
+                             json_output=json_output)
+        return pyzfscmds.parse.columnar_list_rows(rows, columns=columns, parsable=parsable)
+
+    if parsed:
+        return list(zfs_list_iter(target,
+                                  recursive=recursive,
+                                  depth=depth,
+                                  parsable=parsable,
+                                  columns=columns,
+                                  zfs_types=zfs_types,
+                                  sort_properties_ascending=sort_properties_ascending,
+                                  sort_properties_descending=sort_properties_descending,
+                                  env_variables_override=env_variables_override,
+                                  parsed=True,
+                                  json_output=json_output))
+
+    command = _zfs_list_command(target,
+                                recursive=recursive,
+                                depth=depth,
+                                scripting=scripting,
+                                parsable=parsable,
+                                columns=columns,
+                                zfs_types=zfs_types,
+                                sort_properties_ascending=sort_properties_ascending,
+                                sort_properties_descending=sort_properties_descending,
+                                env_variables_override=env_variables_override)
+
+    return _run(command)
+
+
+def zfs_list_iter(target: str,
+                  recursive: bool = False,
+                  depth: int = None,
+                  parsable: bool = False,
+                  columns: list = None,
+                  zfs_types: list = None,
+                  sort_properties_ascending: list = None,
+                  sort_properties_descending: list = None,
+                  env_variables_override: dict = None,
+                  parsed: bool = False,
+                  json_output: bool = False) -> Iterator[Union[List[str], tuple]]:
+    """
+     zfs list -H [-r|-d depth] [-p] [-o property[,property]...] [-t
+     type[,type]...] [-s property]... [-S property]...
+     [filesystem|volume|snapshot...]
+
+     Generator variant of zfs_list, yields each row as a list of fields as
+     soon as zfs outputs it. Always runs in scripting mode.
+     If parsed is True records are yielded instead of lists.
+
+     If json_output is True and zfs supports it, output is read as JSON
+     (-j --json-int) and decoded as it streams. Rows are the same as those
+     of parsable text output, which is used when JSON is not supported.
     """
+    if parsed or json_output:
+        # Fail before running anything if the columns cannot be parsed
+        pyzfscmds.parse.list_columns(columns)
+
+    if json_output:
+        parsable = True
+
+    json_output = _json_supported(json_output)
+
+    if json_output:
+        # JSON has no default columns, request them explicitly
+        columns = list(pyzfscmds.parse.list_columns(columns))
+
+    command = _zfs_list_command(target,
+                                recursive=recursive,
+                                depth=depth,
+                                scripting=True,
+                                parsable=parsable,
+                                columns=columns,
+                                zfs_types=zfs_types,
+                                sort_properties_ascending=sort_properties_ascending,
+                                sort_properties_descending=sort_properties_descending,
+                                env_variables_override=env_variables_override,
+                                json_output=json_output)
+
+    if json_output:
+        rows = pyzfscmds.parse.json_rows(
+            command.run_chunks(), "datasets",
+            lambda name, entry: [pyzfscmds.parse.json_list_row(name, entry, columns)])
+    else:
+        rows = command.run_iter()
+
+    if parsed:
+        rows = pyzfscmds.parse.parse_list_rows(rows, columns=columns, parsable=parsable)
+
+    try:
+        yield from rows
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"{command.failure}\n{e.stderr}\n")
+
+
+def _zfs_destroy_command(target: str,
+                         recursive_children: bool = False,
+                         recursive_dependents: bool = False,
+                         force_unmount: bool = False,
+                         dry_run: bool = False,
+                         machine_parsable: bool = False,
+                         verbose: bool = False) -> _Command:
     if target is None:
         raise TypeError("Target name cannot be of type 'None'")
 
@@ -430,23 +1150,43 @@ def zfs_destroy(target: str,
         call_args.append("-v")
 
     command = _Command("destroy", call_args, targets=[target])
+    # Dependents may be clones anywhere in the pool
+    # A destroyed clone is also dropped from the clones of its origin, anywhere in the pool
+    command.invalidates = [_pool_name(target)]
+    command.failure = f"Failed to destroy {target}"
+    if not (dry_run or machine_parsable or verbose):
+        # Only reports of a dry run or verbose destroy are printed
+        command.output = pyzfscmds.backend.OUTPUT_DISCARD
 
-    try:
-        return command.run()
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"Failed to destroy {target}\n{e.output}\n")
+    return command
 
 
-def zfs_destroy_snapshot(snapname: str,
-                         recursive_descendents: bool = False,
-                         recursive_clones: bool = False,
-                         dry_run: bool = False,
-                         machine_parsable: bool = False,
-                         verbose: bool = False,
-                         defer: bool = False) -> str:
+def zfs_destroy(target: str,
+                recursive_children: bool = False,
+                recursive_dependents: bool = False,
+                force_unmount: bool = False,
+                dry_run: bool = False,
+                machine_parsable: bool = False,
+                verbose: bool = False) -> str:
     """
-     zfs destroy [-dnpRrv] snapshot[%snapname][,...]
+    zfs destroy [-fnpRrv] filesystem|volume
     """
+    return _run(_zfs_destroy_command(target=target,
+                                     recursive_children=recursive_children,
+                                     recursive_dependents=recursive_dependents,
+                                     force_unmount=force_unmount,
+                                     dry_run=dry_run,
+                                     machine_parsable=machine_parsable,
+                                     verbose=verbose))
+
+
+def _zfs_destroy_snapshot_command(snapname: str,
+                                  recursive_descendents: bool = False,
+                                  recursive_clones: bool = False,
+                                  dry_run: bool = False,
+                                  machine_parsable: bool = False,
+                                  verbose: bool = False,
+                                  defer: bool = False) -> _Command:
     if snapname is None:
         raise TypeError("Snapshot name cannot be of type 'None'")
 
@@ -466,20 +1206,252 @@ def zfs_destroy_snapshot(snapname: str,
         call_args.append("-d")
 
     command = _Command("destroy", call_args, targets=[snapname])
+    # Clones of the snapshot, destroyed by -R or kept by -d, may be anywhere in the pool
+    command.invalidates = [_pool_name(snapname)]
+    command.failure = f"Failed to destroy {snapname}"
+    if not (dry_run or machine_parsable or verbose):
+        # Only reports of a dry run or verbose destroy are printed
+        command.output = pyzfscmds.backend.OUTPUT_DISCARD
 
-    try:
-        return command.run()
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"Failed to destroy {snapname}\n{e.output}\n")
+    return command
 
 
-def zfs_rollback(snapname: str,
-                 destroy_between: bool = False,
-                 destroy_more_recent: bool = False,
-                 force_unmount: bool = False):
+def zfs_destroy_snapshot(snapname: str,
+                         recursive_descendents: bool = False,
+                         recursive_clones: bool = False,
+                         dry_run: bool = False,
+                         machine_parsable: bool = False,
+                         verbose: bool = False,
+                         defer: bool = False) -> str:
     """
-     zfs rollback [-rRf] snapshot
+     zfs destroy [-dnpRrv] snapshot[%snapname][,...]
+    """
+    return _run(_zfs_destroy_snapshot_command(snapname=snapname,
+                                              recursive_descendents=recursive_descendents,
+                                              recursive_clones=recursive_clones,
+                                              dry_run=dry_run,
+                                              machine_parsable=machine_parsable,
+                                              verbose=verbose,
+                                              defer=defer))
+
+
+def _snapshot_ranges(snapnames: Iterable[str], snapshot_order: List[str] = None) -> List[str]:
+    """
+    Compress snapshot names into zfs destroy list elements. Three or more
+    snapshots adjacent in snapshot_order become a 'first%last' range, so
+    snapshot_order must hold every snapshot of the dataset oldest first.
+    """
+    requested = list(collections.OrderedDict.fromkeys(snapnames))
+
+    if not snapshot_order:
+        return requested
+
+    if len(set(snapshot_order)) != len(snapshot_order):
+        raise RuntimeError("Snapshot order lists a snapshot more than once")
+
+    positions = {name: i for i, name in enumerate(snapshot_order)}
+    known = sorted((n for n in requested if n in positions), key=positions.__getitem__)
+    # Unknown names are passed through, zfs reports them if they do not exist
+    unknown = [n for n in requested if n not in positions]
+
+    elements = []
+    run = []
+
+    def flush():
+        if len(run) >= 3:
+            elements.append(f"{run[0]}%{run[-1]}")
+        else:
+            elements.extend(run)
+
+    for name in known:
+        if run and positions[name] != positions[run[-1]] + 1:
+            flush()
+            run = []
+        run.append(name)
+    flush()
+
+    return elements + unknown
+
+
+def _snapshot_names(dataset: str, snapnames: Iterable[str]) -> List[str]:
+    """
+    Short names of snapshots of dataset, given short or in full, raises
+    RuntimeError for a snapshot of another dataset
+    """
+    if dataset is None:
+        raise TypeError("Dataset name cannot be of type 'None'")
+
+    names = []
+    for snapname in snapnames:
+        if snapname is None:
+            raise TypeError("Snapshot name cannot be of type 'None'")
+        if "@" in snapname:
+            snapshot_dataset, snapname = snapname.split("@", 1)
+            if snapshot_dataset != dataset:
+                raise RuntimeError(f"Snapshot {snapshot_dataset}@{snapname} is not of {dataset}")
+        names.append(snapname)
+
+    if not names:
+        raise RuntimeError("No snapshots requested")
+
+    return names
+
+
+def _zfs_destroy_snapshots_commands(dataset: str,
+                                    snapnames: Iterable[str],
+                                    recursive_descendents: bool = False,
+                                    recursive_clones: bool = False,
+                                    dry_run: bool = False,
+                                    machine_parsable: bool = False,
+                                    verbose: bool = False,
+                                    defer: bool = False,
+                                    snapshot_order: List[str] = None) -> List[_Command]:
+    names = _snapshot_names(dataset, snapnames)
+
+    def destroy_command(snapshots: str) -> _Command:
+        return _zfs_destroy_snapshot_command(snapshots,
+                                             recursive_descendents=recursive_descendents,
+                                             recursive_clones=recursive_clones,
+                                             dry_run=dry_run,
+                                             machine_parsable=machine_parsable,
+                                             verbose=verbose,
+                                             defer=defer)
+
+    # With -r or -R a range applies in every descendant or clone, where it
+    # may span snapshots which were not requested, so names are listed
+    if recursive_descendents or recursive_clones:
+        snapshot_order = None
+
+    # zfs destroy takes one snapshot list argument, split it into several
+    # calls if it would exceed the single argument or total argument limit
+    reserved = sum(_argument_size(a) for a in destroy_command(dataset)._prepare_call()[:-1])
+    limit = min(MAX_ARGUMENT_LENGTH, _argument_space() - reserved) - len(f"{dataset}@") - 1
+
+    chunks = []
+    chunk = []
+    size = 0
+    for element in _snapshot_ranges(names, snapshot_order):
+        if chunk and size + len(element) + 1 > limit:
+            chunks.append(chunk)
+            chunk = []
+            size = 0
+        chunk.append(element)
+        size += len(element) + 1
+    chunks.append(chunk)
+
+    commands = []
+    for chunk in chunks:
+        command = destroy_command(f"{dataset}@{','.join(chunk)}")
+        command.failure = f"Failed to destroy snapshots of {dataset}"
+        commands.append(command)
+
+    return commands
+
+
+def _snapshot_listing(dataset: str) -> List[tuple]:
+    """
+    Snapshots of dataset, as records of name and used, oldest first
+    """
+    return zfs_list(dataset, depth=1, parsable=True, parsed=True,
+                    columns=["name", "used"], zfs_types=["snapshot"],
+                    sort_properties_ascending=["createtxg"])
+
+
+def _checked_snapshot_order(dataset: str, snapshot_order: Optional[List[str]],
+                            listing: List[tuple]) -> List[str]:
+    """
+    Snapshot names of dataset in listing, raises RuntimeError if a given
+    snapshot_order differs from them
+    """
+    names = [r.name.split("@", 1)[1] for r in listing]
+
+    if snapshot_order is not None and list(snapshot_order) != names:
+        raise RuntimeError(f"Snapshot order is not every snapshot of {dataset} oldest first")
+
+    return names
+
+
+def zfs_destroy_snapshots(dataset: str,
+                          snapnames: Iterable[str],
+                          recursive_descendents: bool = False,
+                          recursive_clones: bool = False,
+                          dry_run: bool = False,
+                          machine_parsable: bool = False,
+                          verbose: bool = False,
+                          defer: bool = False,
+                          snapshot_order: List[str] = None) -> str:
+    """
+     zfs destroy [-dnpRrv] snapshot[%snapname][,...]
+
+     Destroy many snapshots of dataset with as few zfs calls as possible.
+     snapnames are snapshot names without the dataset, runs of adjacent
+     snapshots are sent as 'first%last' ranges. Ranges are not used with
+     recursive_descendents or recursive_clones, they would also destroy
+     unrequested snapshots of descendants and clones.
+
+     The snapshots of dataset are read with one zfs list call to build
+     ranges. snapshot_order, every snapshot name of dataset oldest first,
+     is checked against them, RuntimeError is raised if it differs.
+     The list is split into several calls if it exceeds the argument
+     limits, if a call fails snapshots destroyed by earlier calls stay
+     destroyed.
+    """
+    if recursive_descendents or recursive_clones:
+        snapshot_order = None
+    else:
+        snapshot_order = _checked_snapshot_order(dataset, snapshot_order,
+                                                 _snapshot_listing(dataset))
+
+    commands = _zfs_destroy_snapshots_commands(dataset, snapnames,
+                                               recursive_descendents=recursive_descendents,
+                                               recursive_clones=recursive_clones,
+                                               dry_run=dry_run,
+                                               machine_parsable=machine_parsable,
+                                               verbose=verbose,
+                                               defer=defer,
+                                               snapshot_order=snapshot_order)
+
+    return "".join(_run(command) for command in commands)
+
+
+def zfs_destroy_snapshots_estimate(dataset: str,
+                                   snapnames: Iterable[str],
+                                   recursive_descendents: bool = False,
+                                   recursive_clones: bool = False
+                                   ) -> pyzfscmds.parse.DestroyEstimate:
+    """
+     zfs destroy -nvp [-rR] snapshot[%snapname][,...]
+
+     Dry run of zfs_destroy_snapshots. Returns the names zfs would destroy,
+     the space used by each requested snapshot on its own, and the total
+     space destroying them together would reclaim.
     """
+    snapnames = _snapshot_names(dataset, snapnames)
+    listing = _snapshot_listing(dataset)
+
+    commands = _zfs_destroy_snapshots_commands(
+        dataset, snapnames,
+        recursive_descendents=recursive_descendents,
+        recursive_clones=recursive_clones,
+        dry_run=True,
+        machine_parsable=True,
+        verbose=True,
+        snapshot_order=_checked_snapshot_order(dataset, None, listing))
+
+    output = "".join(_run(command) for command in commands)
+
+    estimate = pyzfscmds.parse.parse_destroy_dry_run(output)
+
+    requested = {f"{dataset}@{s}" for s in snapnames}
+    estimate.used.update((r.name, r.used) for r in listing if r.name in requested)
+
+    return estimate
+
+
+def _zfs_rollback_command(snapname: str,
+                          destroy_between: bool = False,
+                          destroy_more_recent: bool = False,
+                          force_unmount: bool = False) -> _Command:
     if snapname is None:
         raise TypeError("Snapshot name cannot be of type 'None'")
 
@@ -493,40 +1465,49 @@ def zfs_rollback(snapname: str,
         call_args.append("-f")
 
     command = _Command("rollback", call_args, targets=[snapname])
+    command.invalidates = [_pool_name(snapname) if destroy_more_recent else snapname]
+    command.failure = f"Failed to rollback {snapname}"
+    command.output = pyzfscmds.backend.OUTPUT_DISCARD
 
-    try:
-        return command.run()
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"Failed to rollback {snapname}\n{e.output}\n")
+    return command
 
 
-def zfs_promote(clone: str) -> str:
+def zfs_rollback(snapname: str,
+                 destroy_between: bool = False,
+                 destroy_more_recent: bool = False,
+                 force_unmount: bool = False):
     """
-     zfs promote clone-filesystem
+     zfs rollback [-rRf] snapshot
     """
+    return _run(_zfs_rollback_command(snapname=snapname,
+                                      destroy_between=destroy_between,
+                                      destroy_more_recent=destroy_more_recent,
+                                      force_unmount=force_unmount))
+
+
+def _zfs_promote_command(clone: str) -> _Command:
     command = _Command("promote", [], targets=[clone])
+    # Snapshots move between the clone and its origin, which may be anywhere in the pool
+    command.invalidates = [_pool_name(clone)]
+    command.failure = f"Failed to promote {clone}"
+    command.output = pyzfscmds.backend.OUTPUT_DISCARD
 
-    try:
-        return command.run()
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"Failed to promote {clone}\n{e.output}\n")
+    return command
 
 
-def zfs_rename(target_source: str,
-               target_dest: str,
-               create_parents: bool = False,
-               dont_remount: bool = False,
-               force_unmount: bool = False,
-               recursive: bool = False) -> str:
+def zfs_promote(clone: str) -> str:
     """
-     zfs rename	[-f] filesystem|volume|snapshot	filesystem|volume|snapshot
-
-     zfs rename	[-f] -p	filesystem|volume filesystem|volume
+     zfs promote clone-filesystem
+    """
+    return _run(_zfs_promote_command(clone))
 
-     zfs rename	-u [-p]	filesystem filesystem
 
-     zfs rename	-r snapshot snapshot
-    """
+def _zfs_rename_command(target_source: str,
+                        target_dest: str,
+                        create_parents: bool = False,
+                        dont_remount: bool = False,
+                        force_unmount: bool = False,
+                        recursive: bool = False) -> _Command:
     if target_source is None or target_dest is None:
         raise TypeError("Target name cannot be of type 'None'")
 
@@ -545,35 +1526,164 @@ def zfs_rename(target_source: str,
         call_args.append("-r")
 
     command = _Command("rename", call_args, targets=[target_source, target_dest])
+    # Renaming changes the origin of clones, which may be anywhere in the pool
+    command.invalidates = [_pool_name(target_source)]
+    command.failure = f"Failed to rename {target_source} to {target_dest}"
+    command.output = pyzfscmds.backend.OUTPUT_DISCARD
 
-    try:
-        return command.run()
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"Failed to rename {target_source} to {target_dest}\n{e.output}\n")
+    return command
 
 
-def zfs_set(target: str, prop: str) -> str:
+def zfs_rename(target_source: str,
+               target_dest: str,
+               create_parents: bool = False,
+               dont_remount: bool = False,
+               force_unmount: bool = False,
+               recursive: bool = False) -> str:
     """
-     zfs set property=value [property=value]...	filesystem|volume|snapshot
+     zfs rename	[-f] filesystem|volume|snapshot	filesystem|volume|snapshot
+
+     zfs rename	[-f] -p	filesystem|volume filesystem|volume
+
+     zfs rename	-u [-p]	filesystem filesystem
+
+     zfs rename	-r snapshot snapshot
     """
+    return _run(_zfs_rename_command(target_source=target_source,
+                                    target_dest=target_dest,
+                                    create_parents=create_parents,
+                                    dont_remount=dont_remount,
+                                    force_unmount=force_unmount,
+                                    recursive=recursive))
+
+
+def _zfs_set_command(target: str, prop: str) -> _Command:
     if target is None:
         raise TypeError("Target name cannot be of type 'None'")
 
     command = _Command("set", [], targets=[prop, target])
+    command.invalidates = [target]
+    command.failure = f"Failed to set {prop} on {target}"
+    command.output = pyzfscmds.backend.OUTPUT_DISCARD
 
-    try:
-        return command.run()
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"Failed to \n{e.output}\n")
+    return command
 
 
-def zfs_inherit(prop: str,
-                target: str,
-                recursive: bool = False,
-                revert: bool = False) -> str:
+def zfs_set(target: str, prop: str) -> str:
     """
-     zfs inherit [-rS] property	filesystem|volume|snapshot...
+     zfs set property=value [property=value]...	filesystem|volume|snapshot
+    """
+    return _run(_zfs_set_command(target, prop))
+
+
+def _zfs_set_multiple_commands(targets: Iterable[str],
+                               properties: dict,
+                               multi_property: bool = True) -> List[_Command]:
+    targets = list(targets)
+
+    if not targets:
+        raise RuntimeError("No targets requested")
+
+    if not properties:
+        raise RuntimeError("No properties requested")
+
+    if any(t is None for t in targets):
+        raise TypeError("Target name cannot be of type 'None'")
+
+    assignments = [f"{prop}={value}" for prop, value in properties.items()]
+
+    # Older zfs only accepts a single property=value per call
+    groups = [assignments] if multi_property else [[a] for a in assignments]
+
+    commands = []
+    for group in groups:
+        reserved = sum(_argument_size(a) for a in ["zfs", "set"] + group)
+
+        for chunk in _chunk_arguments(targets, reserved=reserved):
+            command = _Command("set", [], targets=group + chunk)
+            command.invalidates = chunk
+            command.failure = f"Failed to set {' '.join(group)} on {chunk[0]} to {chunk[-1]}"
+            command.output = pyzfscmds.backend.OUTPUT_DISCARD
+            commands.append(command)
+
+    return commands
+
+
+def _zfs_set_current_commands(targets: List[str], properties: dict) -> List[_Command]:
+    """
+    zfs get commands reading the current value of properties on targets
+    """
+    property_target = ",".join(properties)
+    reserved = sum(_argument_size(a) for a in
+                   ["zfs", "get", "-H", "-p", "-o", "name,property,value", property_target])
+
+    return [_zfs_get_command(chunk, parsable=True, columns=["name", "property", "value"],
+                             properties=list(properties))
+            for chunk in _chunk_arguments(targets, reserved=reserved)]
+
+
+def _zfs_set_changes(targets: List[str], properties: dict,
+                     rows: Iterable[List[str]]) -> collections.OrderedDict:
+    """
+    Group targets by the properties which differ from their current values,
+    rows are split 'zfs get -H -p -o name,property,value' output. Targets
+    already holding every value are left out.
+    """
+    current = {(name, prop): value for name, prop, value in rows}
+
+    changes = collections.OrderedDict()
+    for target in targets:
+        changed = tuple((prop, value) for prop, value in properties.items()
+                        if current.get((target, prop)) != str(value))
+        if changed:
+            changes.setdefault(changed, []).append(target)
+
+    return changes
+
+
+def zfs_set_multiple(targets: Iterable[str],
+                     properties: dict,
+                     diff: bool = False,
+                     multi_property: bool = None) -> str:
+    """
+     zfs set property=value [property=value]...	filesystem|volume|snapshot...
+
+     Set every property in the properties mapping on every target, with as
+     few zfs calls as possible. Targets are split into several calls if they
+     exceed ARG_MAX. If multi_property is False one call is made per
+     property, for zfs versions which only accept one property=value.
+     By default it is detected with pyzfscmds.capabilities.
+
+     If diff is True the current values are read first with one zfs get
+     per call and only differing properties are set, targets which already
+     hold every value are not written. Values are compared as strings
+     against parsable output, so '1G' is set again over 1073741824.
     """
+    targets = list(targets)
+
+    if multi_property is None:
+        multi_property = _detect().multi_property_set
+
+    if not diff:
+        return "".join(_run(command) for command in _zfs_set_multiple_commands(
+            targets, properties, multi_property=multi_property))
+
+    rows = []
+    for command in _zfs_set_current_commands(targets, properties):
+        rows.extend(line.split("\t") for line in _run(command).splitlines())
+
+    output = []
+    for changed, changed_targets in _zfs_set_changes(targets, properties, rows).items():
+        output.extend(_run(command) for command in _zfs_set_multiple_commands(
+            changed_targets, dict(changed), multi_property=multi_property))
+
+    return "".join(output)
+
+
+def _zfs_inherit_command(prop: str,
+                         target: str,
+                         recursive: bool = False,
+                         revert: bool = False) -> _Command:
     if prop is None:
         raise TypeError("Property name cannot be of type 'None'")
 
@@ -589,11 +1699,35 @@ def zfs_inherit(prop: str,
         call_args.append("-S")
 
     command = _Command("inherit", call_args, targets=[prop, target])
+    command.invalidates = [target]
+    command.failure = "Failed to inherit property"
+    command.output = pyzfscmds.backend.OUTPUT_DISCARD
 
-    try:
-        return command.run()
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"Failed to inherit property\n{e.output}\n")
+    return command
+
+
+def zfs_inherit(prop: str,
+                target: str,
+                recursive: bool = False,
+                revert: bool = False) -> str:
+    """
+     zfs inherit [-rS] property	filesystem|volume|snapshot...
+    """
+    return _run(_zfs_inherit_command(prop=prop,
+                                     target=target,
+                                     recursive=recursive,
+                                     revert=revert))
+
+
+def _zfs_upgrade_list_command(supported: bool = False) -> _Command:
+    call_args = []
+    if supported:
+        call_args.append("-v")
+
+    command = _Command("upgrade", call_args)
+    command.failure = "Failed to list upgradeable filesystems"
+
+    return command
 
 
 def zfs_upgrade_list(supported: bool = False) -> str:
@@ -607,25 +1741,13 @@ def zfs_upgrade_list(supported: bool = False) -> str:
          supported versions are	displayed, along with an explanation
          of the	features provided with each version.
      """
-    call_args = []
-    if supported:
-        call_args.append("-v")
-
-    command = _Command("upgrade", call_args)
-
-    try:
-        return command.run()
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"Failed to list upgradeable filesystems\n{e.output}\n")
+    return _run(_zfs_upgrade_list_command(supported))
 
 
-def zfs_upgrade(target: str = None,
-                descendent: bool = False,
-                version: str = None,
-                upgrade_all: bool = False) -> str:
-    """
-    zfs upgrade [-r] [-V version] -a |	filesystem
-    """
+def _zfs_upgrade_command(target: str = None,
+                         descendent: bool = False,
+                         version: str = None,
+                         upgrade_all: bool = False) -> _Command:
     if target is not None and upgrade_all:
         raise RuntimeError("Both target and upgrade all cannot be true")
 
@@ -643,37 +1765,46 @@ def zfs_upgrade(target: str = None,
     targets = [target] if target is not None else []
 
     command = _Command("upgrade", call_args, targets=targets)
+    command.invalidates = targets or [pyzfscmds.cache.EVERYTHING]
+    command.failure = "Failed to run upgrade"
 
-    try:
-        return command.run()
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"Failed to run upgrade\n{e.output}\n")
+    return command
 
 
-def zfs_mount_list() -> str:
+def zfs_upgrade(target: str = None,
+                descendent: bool = False,
+                version: str = None,
+                upgrade_all: bool = False) -> str:
     """
-     zfs mount
+    zfs upgrade [-r] [-V version] -a |	filesystem
+    """
+    return _run(_zfs_upgrade_command(target=target,
+                                     descendent=descendent,
+                                     version=version,
+                                     upgrade_all=upgrade_all))
 
-     Displays all ZFS file systems currently mounted.
-     """
 
+def _zfs_mount_list_command() -> _Command:
     command = _Command("mount", [])
+    command.failure = "Failed to list mounted filesystems"
 
-    try:
-        return command.run()
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"Failed to \n{e.output}\n")
+    return command
 
 
-def zfs_mount(target: str = None,
-              progress: bool = False,
-              overlay: bool = False,
-              properties: list = None,
-              mount_all: bool = False) -> str:
+def zfs_mount_list() -> str:
     """
+     zfs mount
 
-     zfs mount [-vO] [-o property[,property]...] -a | filesystem
-    """
+     Displays all ZFS file systems currently mounted.
+     """
+    return _run(_zfs_mount_list_command())
+
+
+def _zfs_mount_command(target: str = None,
+                       progress: bool = False,
+                       overlay: bool = False,
+                       properties: list = None,
+                       mount_all: bool = False) -> _Command:
     if target is not None and mount_all:
         raise RuntimeError("Both target and unmount all cannot be true")
 
@@ -694,19 +1825,34 @@ def zfs_mount(target: str = None,
     targets = [target] if target is not None else []
 
     command = _Command("mount", call_args, targets=targets)
+    command.invalidates = targets or [pyzfscmds.cache.EVERYTHING]
+    command.failure = "Failed to mount target"
+    if (targets or mount_all) and not progress:
+        # Without either zfs mount lists mounted filesystems
+        command.output = pyzfscmds.backend.OUTPUT_DISCARD
 
-    try:
-        return command.run()
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"Failed to mount target\n{e.output}\n")
+    return command
 
 
-def zfs_unmount(target: str = None,
-                force: bool = False,
-                unmount_all: bool = False) -> str:
+def zfs_mount(target: str = None,
+              progress: bool = False,
+              overlay: bool = False,
+              properties: list = None,
+              mount_all: bool = False) -> str:
     """
-     zfs unmount|umount	[-f] -a	| filesystem|mountpoint
+
+     zfs mount [-vO] [-o property[,property]...] -a | filesystem
     """
+    return _run(_zfs_mount_command(target=target,
+                                   progress=progress,
+                                   overlay=overlay,
+                                   properties=properties,
+                                   mount_all=mount_all))
+
+
+def _zfs_unmount_command(target: str = None,
+                         force: bool = False,
+                         unmount_all: bool = False) -> _Command:
     if target is not None and unmount_all:
         raise RuntimeError("Both target and unmount all cannot be true")
 
@@ -721,11 +1867,23 @@ def zfs_unmount(target: str = None,
     targets = [target] if target is not None else []
 
     command = _Command("unmount", call_args, targets=targets)
+    # Target may be a mountpoint rather than a dataset
+    command.invalidates = [pyzfscmds.cache.EVERYTHING]
+    command.failure = f"Failed to unmount {target}"
+    command.output = pyzfscmds.backend.OUTPUT_DISCARD
 
-    try:
-        return command.run()
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"Failed to unmount {target}\n{e.output}\n")
+    return command
+
+
+def zfs_unmount(target: str = None,
+                force: bool = False,
+                unmount_all: bool = False) -> str:
+    """
+     zfs unmount|umount	[-f] -a	| filesystem|mountpoint
+    """
+    return _run(_zfs_unmount_command(target=target,
+                                     force=force,
+                                     unmount_all=unmount_all))
 
 # TODO: Unimplemented:
 # def zfs_userspace():
@@ -0,0 +1,451 @@
+"""
+Run commands from a long lived helper process
+
+ForkServerBackend starts a small Python process once, the fork server,
+and sends it the argv and environment of every command over a Unix socket
+pair. The server starts the command with os.posix_spawnp, or fork and exec
+where it is missing, so the calling process, however large or threaded,
+never forks. Along with each request go the write ends of pipes for
+stdout, stderr and status: the command writes its output straight to the
+caller, and the server reports the pid, then the exit status and resource
+usage, on the status pipe.
+
+Requests from many threads share the socket and are sent whole under a
+lock, the server handles them one at a time while earlier commands run.
+"""
+
+import array
+import io
+import json
+import os
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import threading
+
+from typing import AsyncIterator, Callable, Iterator, List, Mapping, Optional
+
+import pyzfscmds.backend
+
+"""
+Requests are a header of kind and body length followed by a JSON body.
+RUN carries [argv, env] and the stdout, stderr and status fds, env None
+meaning the server's own environment. KILL carries the pid of a command.
+"""
+
+_HEADER = struct.Struct("!cI")
+RUN = b"R"
+KILL = b"K"
+
+"""
+Records written to the status pipe of a command. STARTED holds its pid,
+FAILED the errno of starting it. EXITED follows STARTED with the exit
+status and the sixteen fields of resource.struct_rusage.
+"""
+
+_START = struct.Struct("!ci")
+STARTED = b"P"
+FAILED = b"E"
+_EXITED = struct.Struct("!i2d14q")
+
+_FDS = 3
+
+_SERVE = ("import sys; sys.path.insert(0, sys.argv[1]); "
+          "import pyzfscmds.forkserver; pyzfscmds.forkserver.serve(int(sys.argv[2]))")
+
+
+def _read_exactly(fd: int, size: int) -> bytes:
+    """
+    size bytes from fd, fewer only at end of file
+    """
+    data = b""
+    while len(data) < size:
+        chunk = os.read(fd, size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def _write(fd: int, data: bytes):
+    try:
+        os.write(fd, data)
+    except OSError:
+        # The caller is gone
+        pass
+
+
+def _exec(argv: List[str], env: Optional[dict], stdout: int, stderr: int) -> int:
+    """
+    Fork and exec argv, returning its pid. Raises OSError if exec failed.
+    """
+    if hasattr(os, "posix_spawnp"):
+        return os.posix_spawnp(
+            argv[0], argv, os.environ if env is None else env,
+            file_actions=[(os.POSIX_SPAWN_DUP2, stdout, 1), (os.POSIX_SPAWN_DUP2, stderr, 2)],
+            setsigdef=(signal.SIGPIPE, signal.SIGCHLD))
+
+    errors_read, errors_write = os.pipe()
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.dup2(stdout, 1)
+            os.dup2(stderr, 2)
+            signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+            if env is None:
+                os.execvp(argv[0], argv)
+            else:
+                os.execvpe(argv[0], argv, env)
+        except OSError as e:
+            os.write(errors_write, struct.pack("!i", e.errno or 0))
+        finally:
+            os._exit(127)
+
+    os.close(errors_write)
+    try:
+        # End of file once exec closes the pipe, an errno if it failed
+        error = _read_exactly(errors_read, 4)
+    finally:
+        os.close(errors_read)
+
+    if error:
+        os.waitpid(pid, 0)
+        number, = struct.unpack("!i", error)
+        raise OSError(number, os.strerror(number), argv[0])
+
+    return pid
+
+
+def _receive(server: socket.socket) -> tuple:
+    """
+    Next request as (kind, message, fds), kind None at end of file
+    """
+    fds = array.array("i")
+    header, ancillary, _, _ = server.recvmsg(
+        _HEADER.size, socket.CMSG_SPACE(_FDS * fds.itemsize))
+
+    for level, kind, data in ancillary:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(data[:len(data) - len(data) % fds.itemsize])
+
+    # Received fds are inheritable, commands must only get their own
+    for fd in fds:
+        os.set_inheritable(fd, False)
+
+    if not header:
+        return None, None, list(fds)
+
+    while len(header) < _HEADER.size:
+        header += server.recv(_HEADER.size - len(header))
+
+    kind, length = _HEADER.unpack(header)
+
+    body = b""
+    while len(body) < length:
+        chunk = server.recv(length - len(body))
+        if not chunk:
+            break
+        body += chunk
+
+    return kind, json.loads(body.decode()), list(fds)
+
+
+def _reap(running: dict):
+    while True:
+        try:
+            pid, status, rusage = os.wait4(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+
+        fd = running.pop(pid, None)
+        if fd is not None:
+            _write(fd, _EXITED.pack(pyzfscmds.backend._returncode(status), *rusage))
+            os.close(fd)
+
+
+def serve(fd: int):
+    """
+    Serve requests on the socket fd until it is closed
+    """
+    # Imported here, only the server process needs it
+    import selectors
+
+    server = socket.socket(fileno=fd)
+    server.set_inheritable(False)
+
+    # SIGCHLD wakes the loop through this pipe to reap commands
+    wakeup_read, wakeup_write = os.pipe()
+    os.set_blocking(wakeup_read, False)
+    os.set_blocking(wakeup_write, False)
+    signal.set_wakeup_fd(wakeup_write)
+    signal.signal(signal.SIGCHLD, lambda number, frame: None)
+
+    # Status fds of running commands by pid
+    running = {}
+
+    with selectors.DefaultSelector() as selector:
+        selector.register(server, selectors.EVENT_READ)
+        selector.register(wakeup_read, selectors.EVENT_READ)
+
+        while True:
+            for key, _ in selector.select():
+                if key.fileobj is not server:
+                    while True:
+                        try:
+                            if not os.read(wakeup_read, 4096):
+                                break
+                        except BlockingIOError:
+                            break
+                    continue
+
+                kind, message, fds = _receive(server)
+                if kind is None:
+                    return
+
+                if kind == KILL:
+                    if message in running:
+                        os.kill(message, signal.SIGKILL)
+                elif kind == RUN and len(fds) == _FDS:
+                    argv, env = message
+                    stdout, stderr, status = fds
+                    try:
+                        pid = _exec(argv, env, stdout, stderr)
+                    except OSError as e:
+                        _write(status, _START.pack(FAILED, e.errno or 0))
+                        os.close(status)
+                    else:
+                        _write(status, _START.pack(STARTED, pid))
+                        running[pid] = status
+                    finally:
+                        os.close(stdout)
+                        os.close(stderr)
+                else:
+                    for received in fds:
+                        os.close(received)
+
+            _reap(running)
+
+
+class ForkServerBackend(pyzfscmds.backend.Backend):
+    """
+    Run commands from a fork server, started with the first command.
+    Commands get env, by default a copy of os.environ taken when the
+    backend is created. If the server exits it is started again by the
+    next command. Coroutines use asyncio subprocesses.
+    """
+
+    def __init__(self, env: Mapping[str, str] = None):
+        self.env = dict(os.environ if env is None else env)
+
+        self._environments = pyzfscmds.backend._Environments(self.env)
+        self._socket = None
+        self._process = None
+        self._lock = threading.Lock()
+        self._asyncio = pyzfscmds.backend.SubprocessBackend()
+
+    def environment(self, overrides: dict) -> dict:
+        return self._environments.get(overrides)
+
+    def _start(self):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+        ours, theirs = socket.socketpair()
+        try:
+            self._process = subprocess.Popen(
+                [sys.executable, "-c", _SERVE, root, str(theirs.fileno())],
+                pass_fds=[theirs.fileno()], stdout=subprocess.DEVNULL, env=self.env)
+        except BaseException:
+            ours.close()
+            raise
+        finally:
+            theirs.close()
+
+        self._socket = ours
+
+    def _stop(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._process.wait()
+            self._socket = None
+            self._process = None
+
+    def close(self):
+        """
+        Stop the fork server, commands still running are not affected
+        """
+        with self._lock:
+            self._stop()
+
+    def _send(self, kind: bytes, message, fds: List[int] = ()):
+        body = json.dumps(message).encode()
+        data = _HEADER.pack(kind, len(body)) + body
+        ancillary = [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array("i", fds))] \
+            if fds else []
+
+        with self._lock:
+            for attempt in range(2):
+                if self._socket is None:
+                    self._start()
+                try:
+                    sent = self._socket.sendmsg([data], ancillary)
+                    self._socket.sendall(data[sent:])
+                    return
+                except (BrokenPipeError, ConnectionResetError):
+                    # The server exited, start another
+                    self._stop()
+
+        raise RuntimeError("Failed to send a command to the fork server")
+
+    def _launch(self, argv: List[str], env: Optional[dict], stdout: int, stderr: int) -> tuple:
+        """
+        Start argv with stdout and stderr on the given fds, returning its
+        pid and the status pipe to read its exit status from
+        """
+        status_read, status_write = os.pipe()
+        try:
+            try:
+                self._send(RUN, [list(argv), env], [stdout, stderr, status_write])
+            finally:
+                os.close(status_write)
+
+            record = _read_exactly(status_read, _START.size)
+            if len(record) < _START.size:
+                raise RuntimeError(f"The fork server exited before starting '{argv[0]}'")
+
+            kind, value = _START.unpack(record)
+            if kind == FAILED:
+                raise OSError(value, os.strerror(value), argv[0])
+        except BaseException:
+            os.close(status_read)
+            raise
+
+        return value, status_read
+
+    def _kill(self, pid: int):
+        try:
+            self._send(KILL, pid)
+        except RuntimeError:
+            # No server, nothing left running to kill
+            pass
+
+    @staticmethod
+    def _wait(status: int) -> tuple:
+        """
+        Exit status and resource usage of a started command
+        """
+        import resource
+
+        record = _read_exactly(status, _EXITED.size)
+        if len(record) < _EXITED.size:
+            raise RuntimeError("The fork server exited before the command")
+
+        fields = _EXITED.unpack(record)
+        return fields[0], resource.struct_rusage(fields[1:])
+
+    def run(self, argv: List[str], env: Optional[dict] = None) -> subprocess.CompletedProcess:
+        return self.run_output(argv, env, pyzfscmds.backend.OUTPUT_TEXT)
+
+    def run_output(self,
+                   argv: List[str],
+                   env: Optional[dict],
+                   output: str) -> subprocess.CompletedProcess:
+        if output == pyzfscmds.backend.OUTPUT_DISCARD:
+            stdout_read, stdout_write = None, os.open(os.devnull, os.O_WRONLY)
+        else:
+            stdout_read, stdout_write = os.pipe()
+        stderr_read, stderr_write = os.pipe()
+        reading = [fd for fd in (stdout_read, stderr_read) if fd is not None]
+        status = None
+
+        try:
+            try:
+                pid, status = self._launch(argv, env, stdout_write, stderr_write)
+            finally:
+                os.close(stdout_write)
+                os.close(stderr_write)
+
+            try:
+                outputs = pyzfscmds.backend._read_all(reading)
+            except BaseException:
+                self._kill(pid)
+                raise
+
+            returncode, rusage = self._wait(status)
+        finally:
+            for fd in reading:
+                os.close(fd)
+            if status is not None:
+                os.close(status)
+
+        stdout = outputs[0] if stdout_read is not None else None
+        output_bytes = len(stdout) if stdout is not None else None
+        if output == pyzfscmds.backend.OUTPUT_TEXT:
+            stdout = pyzfscmds.backend._decode(stdout)
+
+        result = subprocess.CompletedProcess(argv, returncode, stdout,
+                                             pyzfscmds.backend._decode(outputs[-1]))
+        result.rusage = rusage
+        result.output_bytes = output_bytes
+        return result
+
+    def stream(self,
+               argv: List[str],
+               env: Optional[dict],
+               read: Callable[[io.TextIOBase], Iterator]) -> Iterator:
+        """
+        Output is read as the child produces it. If the generator is
+        closed early the child process is killed.
+        """
+        import locale
+        import tempfile
+
+        with tempfile.TemporaryFile() as stderr_file:
+            stdout_read, stdout_write = os.pipe()
+            try:
+                pid, status = self._launch(argv, env, stdout_write, stderr_file.fileno())
+            except BaseException:
+                os.close(stdout_read)
+                raise
+            finally:
+                os.close(stdout_write)
+
+            exhausted = False
+            try:
+                with open(stdout_read, encoding=locale.getpreferredencoding(False)) as stdout:
+                    yield from read(stdout)
+                exhausted = True
+            finally:
+                if not exhausted:
+                    self._kill(pid)
+                try:
+                    returncode, _ = self._wait(status)
+                finally:
+                    os.close(status)
+
+            if returncode != 0:
+                stderr_file.seek(0)
+                raise subprocess.CalledProcessError(
+                    returncode, argv, stderr=stderr_file.read().decode(errors="replace"))
+
+    async def run_async(self,
+                        argv: List[str],
+                        env: Optional[dict] = None) -> subprocess.CompletedProcess:
+        return await self._asyncio.run_async(argv, self.env if env is None else env)
+
+    async def run_output_async(self,
+                               argv: List[str],
+                               env: Optional[dict],
+                               output: str) -> subprocess.CompletedProcess:
+        return await self._asyncio.run_output_async(argv, self.env if env is None else env,
+                                                    output)
+
+    def stream_async(self,
+                     argv: List[str],
+                     env: Optional[dict],
+                     size: int = 65536) -> AsyncIterator[str]:
+        return self._asyncio.stream_async(argv, self.env if env is None else env, size)
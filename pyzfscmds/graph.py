@@ -0,0 +1,233 @@
+"""
+Clone and origin dependency graph, loaded with a single zfs list call
+"""
+
+from typing import Iterable, List, Optional
+
+import pyzfscmds.cmd
+import pyzfscmds.parse
+
+GRAPH_COLUMNS = ["name", "type", "origin", "clones", "createtxg"]
+
+
+def _names(value: str) -> List[str]:
+    """Split a comma separated list of names, '-' and '' mean none"""
+    if value in ("-", ""):
+        return []
+    return value.split(",")
+
+
+class CloneGraph:
+    """
+    Dependencies between the datasets and snapshots under target (or on
+    the system if target is None). Datasets depend on their parent, snapshots
+    on their dataset and clones on their origin snapshot. Since clones
+    cannot cross pools, listing a pool is enough to see every dependency
+    of its datasets.
+
+    The graph is not updated by later changes, call refresh() to reload.
+    """
+
+    def __init__(self, target: str = None, rows: Iterable[List[str]] = None):
+        """
+        rows may be given as split 'zfs list -H -p -o name,type,origin,clones,createtxg'
+        output instead of running zfs list.
+        """
+        self.target = target
+        self._datasets = {}
+        self._children = {}
+        self._snapshots = {}
+        self._clones = {}
+
+        self.refresh(rows)
+
+    def refresh(self, rows: Iterable[List[str]] = None):
+        """
+        Reload the graph, raises RuntimeError if zfs list fails
+        """
+        if rows is None:
+            rows = pyzfscmds.cmd.zfs_list_iter(self.target,
+                                               recursive=True,
+                                               parsable=True,
+                                               columns=GRAPH_COLUMNS,
+                                               zfs_types=["filesystem", "volume", "snapshot"])
+
+        datasets = {}
+        children = {}
+        snapshots = {}
+        clones = {}
+
+        for record in pyzfscmds.parse.parse_list_rows(rows, columns=GRAPH_COLUMNS,
+                                                      parsable=True):
+            name = record.name
+            datasets[name] = record
+
+            if record.type == "snapshot":
+                snapshots.setdefault(name.rsplit('@', 1)[0], []).append(name)
+                for clone in _names(record.clones):
+                    clones.setdefault(name, []).append(clone)
+            else:
+                if "/" in name:
+                    children.setdefault(name.rsplit('/', 1)[0], []).append(name)
+                if record.origin != "-":
+                    clones.setdefault(record.origin, []).append(name)
+
+        for snapshot_list in snapshots.values():
+            snapshot_list.sort(key=lambda s: datasets[s].createtxg or 0)
+
+        # Clones are seen both in the origin and clones columns
+        for snapshot, snapshot_clones in clones.items():
+            clones[snapshot] = list(dict.fromkeys(snapshot_clones))
+
+        self._datasets = datasets
+        self._children = children
+        self._snapshots = snapshots
+        self._clones = clones
+
+    def __len__(self) -> int:
+        return len(self._datasets)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._datasets
+
+    def _require(self, name: str):
+        if name is None:
+            raise TypeError
+
+        if name not in self._datasets:
+            raise RuntimeError(f"Dataset {name} does not exist")
+
+    def origin(self, dataset: str) -> Optional[str]:
+        """
+        Origin snapshot of a clone, or None
+        """
+        self._require(dataset)
+
+        origin = self._datasets[dataset].origin
+        return origin if origin != "-" else None
+
+    def is_clone(self, dataset: str) -> bool:
+        """
+        Check if clone, raise if not valid dataset
+        """
+        return self.origin(dataset) is not None
+
+    def clones(self, snapshot: str) -> List[str]:
+        """
+        Datasets cloned from snapshot
+        """
+        self._require(snapshot)
+        return list(self._clones.get(snapshot, []))
+
+    def snapshots(self, dataset: str) -> List[str]:
+        """
+        Snapshots of dataset, oldest first
+        """
+        self._require(dataset)
+        return list(self._snapshots.get(dataset, []))
+
+    def _direct_dependents(self, name: str, follow_clones: bool) -> List[str]:
+        if "@" in name:
+            return self._clones.get(name, []) if follow_clones else []
+        return self._children.get(name, []) + self._snapshots.get(name, [])
+
+    def _walk(self, target: str, follow_clones: bool) -> List[str]:
+        """
+        Names depending on target in post order, so that each name comes
+        before anything it depends on
+        """
+        self._require(target)
+
+        ordered = []
+        seen = {target}
+        stack = [(target, iter(self._direct_dependents(target, follow_clones)))]
+
+        # Iterative, clone chains can be deep
+        while stack:
+            name, pending = stack[-1]
+            for dependent in pending:
+                if dependent not in seen:
+                    seen.add(dependent)
+                    stack.append(
+                        (dependent, iter(self._direct_dependents(dependent, follow_clones))))
+                    break
+            else:
+                stack.pop()
+                if name != target:
+                    ordered.append(name)
+
+        return ordered
+
+    def descendants(self, target: str) -> List[str]:
+        """
+        Everything 'zfs destroy -r target' would destroy besides target,
+        descendants and their snapshots, in a safe destroy order
+        """
+        return self._walk(target, follow_clones=False)
+
+    def dependents(self, target: str) -> List[str]:
+        """
+        Everything 'zfs destroy -R target' would destroy besides target:
+        descendants, their snapshots, and clones of those snapshots with
+        their own dependents. Ordered so that each name comes before
+        anything it depends on, destroying them in order never fails on
+        a dependency.
+        """
+        return self._walk(target, follow_clones=True)
+
+    def ancestors(self, dataset: str) -> List[str]:
+        """
+        Chain of origin snapshots of a clone, nearest first. Empty if
+        dataset is not a clone.
+        """
+        chain = []
+        origin = self.origin(dataset)
+
+        while origin is not None and origin not in chain:
+            chain.append(origin)
+            parent = origin.rsplit('@', 1)[0]
+            origin = self.origin(parent) if parent in self._datasets else None
+
+        return chain
+
+    def promote_effect(self, clone: str) -> List[str]:
+        """
+        Snapshots 'zfs promote clone' moves from the origin dataset to
+        clone, the origin and every older snapshot. Their clones then
+        depend on clone instead.
+        """
+        origin = self.origin(clone)
+
+        if origin is None:
+            raise RuntimeError(f"Dataset {clone} is not a clone")
+
+        origin_txg = self._datasets[origin].createtxg or 0
+
+        return [s for s in self._snapshots.get(origin.rsplit('@', 1)[0], [])
+                if (self._datasets[s].createtxg or 0) <= origin_txg]
+
+    def promote_order(self, dataset: str) -> List[str]:
+        """
+        Clones to promote, in order, before dataset and its descendants
+        can be destroyed with 'zfs destroy -r' while keeping the clones.
+        For each dataset with clones outside the destroyed tree, the clone
+        of its newest cloned snapshot is promoted, taking every older
+        snapshot and so every other clone with it.
+        """
+        descendants = self.descendants(dataset)
+        destroyed = set(descendants)
+        destroyed.add(dataset)
+
+        order = []
+        for name in [dataset] + descendants:
+            if "@" in name:
+                continue
+
+            external = [(self._datasets[s].createtxg or 0, clone)
+                        for s in self._snapshots.get(name, [])
+                        for clone in self._clones.get(s, []) if clone not in destroyed]
+
+            if external:
+                order.append(max(external)[1])
+
+        return order
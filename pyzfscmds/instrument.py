@@ -0,0 +1,295 @@
+"""
+Instrumentation of zfs and zpool commands
+
+Hooks given to add_hooks() are called around every command pyzfscmds runs,
+output served from the cache runs nothing and is not reported. Without
+hooks the only cost is checking for them. CommandStats is a hook keeping
+counters and latency histograms per subcommand.
+"""
+
+import bisect
+import collections
+import heapq
+import itertools
+import os
+import subprocess
+import threading
+import time
+
+from typing import Dict, Iterable, List, Optional
+
+"""
+A finished command. wall_time and cpu_time are in seconds.
+cpu_time is the user and system time of the child, None if the backend
+does not report it.
+returncode is None if streamed output was not read to the end.
+output_bytes is the number of bytes read from stdout, None for streamed
+or discarded output or if the backend does not report it.
+error is the exception raised, None if the command ran to completion.
+"""
+
+CommandEvent = collections.namedtuple("CommandEvent", [
+    "argv",
+    "wall_time",
+    "cpu_time",
+    "returncode",
+    "output_bytes",
+    "error",
+])
+
+
+class Hooks:
+    """
+    Base hooks, subclasses override the methods they need. After
+    pre_exec() either post_exec() is called for a command which exited with
+    status 0, or error() for one which failed or raised. Exceptions raised
+    by hooks propagate to the caller of the command.
+    """
+
+    def pre_exec(self, argv: List[str]):
+        pass
+
+    def post_exec(self, event: CommandEvent):
+        pass
+
+    def error(self, event: CommandEvent):
+        pass
+
+
+_hooks = ()
+_lock = threading.Lock()
+
+
+def add_hooks(hooks: Hooks):
+    """
+    Call hooks around every command for the rest of the process
+    """
+    global _hooks
+
+    with _lock:
+        if hooks not in _hooks:
+            _hooks = _hooks + (hooks,)
+
+
+def remove_hooks(hooks: Hooks):
+    global _hooks
+
+    with _lock:
+        _hooks = tuple(h for h in _hooks if h is not hooks)
+
+
+def get_hooks() -> tuple:
+    return _hooks
+
+
+class Measurement:
+    """
+    One command being run, created by start()
+    """
+    __slots__ = ("hooks", "argv", "start")
+
+    def __init__(self, hooks: tuple, argv: List[str]):
+        self.hooks = hooks
+        self.argv = argv
+
+        for hook in hooks:
+            hook.pre_exec(argv)
+
+        # Started after the hooks, their time is not the command's
+        self.start = time.perf_counter()
+
+    def _notify(self, returncode: Optional[int], cpu_time: Optional[float],
+                output_bytes: Optional[int], error: Optional[BaseException]):
+        event = CommandEvent(self.argv, time.perf_counter() - self.start, cpu_time,
+                             returncode, output_bytes, error)
+
+        failed = error is not None or returncode not in (0, None)
+        for hook in self.hooks:
+            if failed:
+                hook.error(event)
+            else:
+                hook.post_exec(event)
+
+    def finish(self, result: subprocess.CompletedProcess):
+        """
+        The command exited, result may carry the rusage of the child and
+        the number of bytes read from its stdout
+        """
+        rusage = getattr(result, "rusage", None)
+        cpu_time = rusage.ru_utime + rusage.ru_stime if rusage is not None else None
+
+        # Counted by the backend as it read stdout, decoded text has lost the byte count
+        output_bytes = getattr(result, "output_bytes", None) if result.stdout is not None else None
+
+        self._notify(result.returncode, cpu_time, output_bytes, None)
+
+    def finish_stream(self, exhausted: bool):
+        """
+        Streamed output was read to the end, or the stream was closed early
+        """
+        self._notify(0 if exhausted else None, None, None, None)
+
+    def fail(self, error: BaseException):
+        returncode = error.returncode if isinstance(error, subprocess.CalledProcessError) \
+            else None
+
+        self._notify(returncode, None, None, error)
+
+
+def start(argv: List[str]) -> Optional[Measurement]:
+    """
+    Call pre_exec hooks for argv, None if there are no hooks
+    """
+    hooks = _hooks
+    return Measurement(hooks, argv) if hooks else None
+
+
+"""
+Upper bounds in seconds of the default latency histogram buckets
+"""
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+"""
+Totals of a subcommand. wall_time, cpu_time and output_bytes are sums,
+cpu_time over the calls which reported it. buckets holds (upper bound,
+count of calls taking at most that long), ending with infinity.
+"""
+
+CommandSummary = collections.namedtuple("CommandSummary", [
+    "calls",
+    "errors",
+    "wall_time",
+    "cpu_time",
+    "output_bytes",
+    "max_wall_time",
+    "buckets",
+])
+
+
+def _quantile(summary: CommandSummary, q: float) -> float:
+    for bound, count in summary.buckets:
+        if count >= q * summary.calls:
+            return min(bound, summary.max_wall_time)
+
+    return summary.max_wall_time
+
+
+def subcommand(argv: List[str]) -> str:
+    """
+    Name commands are grouped under, e.g. 'zfs list'
+    """
+    return " ".join([os.path.basename(argv[0])] + argv[1:2]) if argv else ""
+
+
+class _Totals:
+    __slots__ = ("calls", "errors", "wall_time", "cpu_time", "output_bytes", "max_wall_time",
+                 "counts")
+
+    def __init__(self, buckets: int):
+        self.calls = 0
+        self.errors = 0
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.output_bytes = 0
+        self.max_wall_time = 0.0
+        # Calls per bucket, the last one is unbounded
+        self.counts = [0] * (buckets + 1)
+
+
+class CommandStats(Hooks):
+    """
+    Counters and a latency histogram per subcommand, and the slowest
+    commands with their full argv
+    """
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS, slowest: int = 10):
+        self.buckets = tuple(sorted(buckets))
+        self.keep_slowest = slowest
+
+        self._totals = {}
+        # Heap of (wall time, sequence, event), fastest first
+        self._slowest = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def _record(self, event: CommandEvent, failed: bool):
+        key = subcommand(event.argv)
+
+        with self._lock:
+            totals = self._totals.get(key)
+            if totals is None:
+                totals = self._totals[key] = _Totals(len(self.buckets))
+
+            totals.calls += 1
+            totals.errors += failed
+            totals.wall_time += event.wall_time
+            totals.cpu_time += event.cpu_time or 0.0
+            totals.output_bytes += event.output_bytes or 0
+            totals.max_wall_time = max(totals.max_wall_time, event.wall_time)
+            totals.counts[bisect.bisect_left(self.buckets, event.wall_time)] += 1
+
+            if self.keep_slowest > 0:
+                entry = (event.wall_time, next(self._sequence), event)
+                if len(self._slowest) < self.keep_slowest:
+                    heapq.heappush(self._slowest, entry)
+                else:
+                    heapq.heappushpop(self._slowest, entry)
+
+    def post_exec(self, event: CommandEvent):
+        self._record(event, failed=False)
+
+    def error(self, event: CommandEvent):
+        self._record(event, failed=True)
+
+    def summary(self) -> Dict[str, CommandSummary]:
+        """
+        Totals of each subcommand, the one taking the longest overall first
+        """
+        with self._lock:
+            items = sorted(self._totals.items(), key=lambda item: -item[1].wall_time)
+
+            return collections.OrderedDict(
+                (key, CommandSummary(t.calls, t.errors, t.wall_time, t.cpu_time,
+                                     t.output_bytes, t.max_wall_time,
+                                     list(zip(self.buckets + (float("inf"),),
+                                              itertools.accumulate(t.counts)))))
+                for key, t in items)
+
+    def quantile(self, key: str, q: float) -> Optional[float]:
+        """
+        Estimate of a latency quantile of a subcommand, the upper bound of
+        the bucket holding it. None if the subcommand never ran.
+        """
+        summary = self.summary().get(key)
+        return _quantile(summary, q) if summary is not None else None
+
+    def slowest(self) -> List[CommandEvent]:
+        """
+        The slowest commands seen, slowest first
+        """
+        with self._lock:
+            return [event for _, _, event in sorted(self._slowest, reverse=True)]
+
+    def report(self) -> str:
+        """
+        Table of summary(), times in milliseconds
+        """
+        lines = [f"{'command':<20} {'calls':>8} {'errors':>7} {'total s':>9} {'mean':>9} "
+                 f"{'p50':>9} {'p99':>9} {'max':>9} {'cpu s':>8} {'output':>12}"]
+
+        for key, s in self.summary().items():
+            lines.append(f"{key:<20} {s.calls:>8} {s.errors:>7} {s.wall_time:>9.3f} "
+                         f"{s.wall_time / s.calls * 1000:>9.2f} "
+                         f"{_quantile(s, 0.5) * 1000:>9.2f} "
+                         f"{_quantile(s, 0.99) * 1000:>9.2f} "
+                         f"{s.max_wall_time * 1000:>9.2f} {s.cpu_time:>8.3f} "
+                         f"{s.output_bytes:>12}")
+
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._totals.clear()
+            self._slowest.clear()
@@ -2,14 +2,14 @@
 Common functions
 """
 
-import logging.config
-import logging.handlers
+import logging
 
 
 class ZFSLogger:
 
     logger_config = {
         'version': 1,
+        'disable_existing_loggers': False,
         'formatters': {
             'console': {
                 'class': 'logging.Formatter',
@@ -23,18 +23,33 @@ class ZFSLogger:
                 'formatter': 'console',
             },
         },
-        'root': {
-            'level': logging.DEBUG,
-            'handlers': ['console']
+        'loggers': {
+            'pyzfscmds': {
+                'level': logging.DEBUG,
+                'handlers': ['console'],
+                'propagate': False,
+            },
         },
     }
 
-    logging.config.dictConfig(logger_config)
     logger = logging.getLogger(__name__)
+    configured = False
+
+    @classmethod
+    def configure(cls):
+        """
+        Apply logger_config to the pyzfscmds loggers, done on first use
+        so importing never touches the logging configuration
+        """
+        if not cls.configured:
+            import logging.config
+            logging.config.dictConfig(cls.logger_config)
+            cls.configured = True
 
     @classmethod
     def callback(cls, log, exit_on_error=False):
         """Helper to call the appropriate logging level"""
+        cls.configure()
 
         if log['level'] == 'CRITICAL':
             cls.logger.critical(log['message'])
@@ -0,0 +1,213 @@
+"""
+Pool and dataset metrics in the Prometheus text exposition format
+
+A scrape runs one zpool get for every pool and one recursive zfs get for
+their filesystems and volumes, however many datasets there are. Results
+are reused until the scrape interval has passed.
+"""
+
+import collections
+import os
+import threading
+import time
+
+from typing import Iterable, List, Optional
+
+import pyzfscmds.cmd
+import pyzfscmds.parse
+
+"""
+A metric value, labels is a tuple of (name, value) pairs
+"""
+
+Sample = collections.namedtuple("Sample", ["name", "labels", "value"])
+
+"""
+Pool metrics as (property, metric name, help, divisor). Values are
+divided by divisor, percentages become ratios.
+"""
+
+POOL_METRICS = [
+    ("size", "zfs_pool_size_bytes", "Size of the pool.", 1),
+    ("allocated", "zfs_pool_allocated_bytes", "Space allocated in the pool.", 1),
+    ("free", "zfs_pool_free_bytes", "Space free in the pool.", 1),
+    ("capacity", "zfs_pool_capacity_ratio", "Fraction of the pool allocated.", 100),
+    ("fragmentation", "zfs_pool_fragmentation_ratio", "Fragmentation of free space.", 100),
+]
+
+"""
+Dataset metrics as (property, metric name, help), all in bytes
+"""
+
+DATASET_METRICS = [
+    ("used", "zfs_dataset_used_bytes", "Space used by the dataset and its descendants."),
+    ("available", "zfs_dataset_available_bytes", "Space available to the dataset."),
+    ("referenced", "zfs_dataset_referenced_bytes", "Data accessible by the dataset."),
+    ("written", "zfs_dataset_written_bytes", "Data written since the previous snapshot."),
+]
+
+HEALTH_METRIC = "zfs_pool_health"
+
+"""
+Pool states, each pool has a zfs_pool_health sample of 1 for its state
+and 0 for the others
+"""
+
+HEALTH_STATES = ["ONLINE", "DEGRADED", "FAULTED", "OFFLINE", "UNAVAIL", "REMOVED", "SUSPENDED"]
+
+_HELP = dict([(name, text) for _, name, text, _ in POOL_METRICS] +
+             [(name, text) for _, name, text in DATASET_METRICS] +
+             [(HEALTH_METRIC, "Health of the pool, 1 for its current state.")])
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value) -> str:
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+
+def render(samples: Iterable[Sample]) -> str:
+    """
+    Samples in the Prometheus text exposition format, grouped by metric
+    """
+    grouped = collections.OrderedDict()
+    for sample in samples:
+        grouped.setdefault(sample.name, []).append(sample)
+
+    lines = []
+    for name, group in grouped.items():
+        if name in _HELP:
+            lines.append(f"# HELP {name} {_HELP[name]}")
+        lines.append(f"# TYPE {name} gauge")
+
+        for sample in group:
+            labels = ",".join(f'{label}="{_escape(value)}"' for label, value in sample.labels)
+            lines.append(f"{name}{{{labels}}} {_format_value(sample.value)}")
+
+    return "".join(line + "\n" for line in lines)
+
+
+class MetricsCollector:
+    """
+    Collects metrics of pools, every imported pool unless pools is given,
+    at most once per interval seconds
+    """
+
+    def __init__(self, pools: Optional[List[str]] = None, interval: float = 15.0,
+                 datasets: bool = True):
+        """
+        datasets False collects pool metrics only
+        """
+        self.pools = list(pools) if pools is not None else None
+        self.interval = interval
+        self.datasets = datasets
+
+        self._samples = None
+        self._collected = None
+        self._lock = threading.Lock()
+
+    def _pool_samples(self) -> tuple:
+        """
+        Samples of every selected pool and the names of those pools
+        """
+        records = pyzfscmds.cmd.zpool_get(
+            properties=[prop for prop, _, _, _ in POOL_METRICS] + ["health"],
+            columns=["name", "property", "value"], parsable=True, parsed=True)
+
+        metrics = {prop: (name, divisor) for prop, name, _, divisor in POOL_METRICS}
+        samples = []
+        pools = []
+
+        for record in records:
+            if self.pools is not None and record.name not in self.pools:
+                continue
+
+            if not pools or pools[-1] != record.name:
+                pools.append(record.name)
+
+            labels = (("pool", record.name),)
+
+            if record.property == "health":
+                samples.extend(Sample(HEALTH_METRIC, labels + (("state", state),),
+                                      int(record.value == state)) for state in HEALTH_STATES)
+                continue
+
+            value = pyzfscmds.parse.parse_int(record.value)
+            if isinstance(value, int):
+                name, divisor = metrics[record.property]
+                samples.append(Sample(name, labels, value / divisor if divisor != 1 else value))
+
+        return samples, pools
+
+    def _dataset_samples(self, pools: List[str]) -> List[Sample]:
+        columnar = pyzfscmds.cmd.zfs_get(
+            pools, recursive=True, parsable=True, columnar=True,
+            properties=[prop for prop, _, _ in DATASET_METRICS] + ["type"],
+            columns=["name", "property", "value"], zfs_types=["filesystem", "volume"])
+
+        labels = [(("pool", name.split("/", 1)[0]), ("dataset", name), ("type", dataset_type))
+                  for name, dataset_type in zip(columnar.names, columnar["type"])]
+
+        samples = []
+        for prop, name, _ in DATASET_METRICS:
+            if prop not in columnar:
+                continue
+            samples.extend(Sample(name, dataset_labels, value)
+                           for dataset_labels, value in zip(labels, columnar[prop])
+                           if value != pyzfscmds.parse.MISSING)
+
+        return samples
+
+    def collect(self) -> List[Sample]:
+        """
+        Current samples, collected again once interval has passed since
+        the last collection. Raises RuntimeError if a command fails.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._samples is not None and now - self._collected < self.interval:
+                return self._samples
+
+            samples, pools = self._pool_samples()
+            if self.datasets and pools:
+                samples.extend(self._dataset_samples(pools))
+
+            self._samples = samples
+            self._collected = now
+
+            return samples
+
+    def render(self) -> str:
+        return render(self.collect())
+
+    def write(self, path: str):
+        """
+        Replace path with the rendered metrics atomically, for the node
+        exporter textfile collector
+        """
+        # Only needed when writing, keep tempfile out of scrapes
+        import tempfile
+
+        output = self.render()
+        directory = os.path.dirname(os.path.abspath(path))
+
+        fd, temporary = tempfile.mkstemp(dir=directory, prefix=".metrics")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(output)
+            os.chmod(temporary, 0o644)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def clear(self):
+        """
+        Forget collected samples, the next collect() runs the commands
+        """
+        with self._lock:
+            self._samples = None
@@ -0,0 +1,554 @@
+"""
+Parsers for scripted (-H) zfs output
+"""
+
+import array
+import collections
+import functools
+import re
+
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple, Union
+
+"""
+Properties holding integers when displayed in parsable (-p) mode
+"""
+
+NUMERIC_PROPERTIES = frozenset([
+    "available", "avail", "copies", "createtxg", "creation",
+    "filesystem_count", "filesystem_limit", "guid", "logicalreferenced", "lrefer",
+    "logicalused", "lused", "objsetid", "quota", "recordsize", "refquota", "referenced",
+    "refer", "refreservation", "refreserv", "reservation", "reserv", "snapshot_count",
+    "snapshot_limit", "used", "usedbychildren", "usedchild", "usedbydataset", "usedds",
+    "usedbyrefreservation", "usedrefreserv", "usedbysnapshots", "usedsnap",
+    "userrefs", "volblocksize", "volblock", "volsize", "written"
+])
+
+"""
+Columns zfs displays when none are requested
+"""
+
+LIST_DEFAULT_COLUMNS = ("name", "used", "avail", "refer", "mountpoint")
+GET_DEFAULT_COLUMNS = ("name", "property", "value", "source")
+GET_ALL_COLUMNS = ("name", "property", "value", "received", "source")
+
+GetRecord = collections.namedtuple("GetRecord", GET_DEFAULT_COLUMNS)
+
+
+def parse_int(value: str) -> Optional[Union[int, str]]:
+    """
+    Convert a parsable numeric value, '-' and 'none' mean no value.
+    Anything else which is not an integer is returned unchanged.
+    """
+    try:
+        return int(value)
+    except ValueError:
+        if value in ("-", "none"):
+            return None
+        return value
+
+
+@functools.lru_cache(maxsize=None)
+def list_record_type(columns: Tuple[str, ...]) -> type:
+    """
+    Record type for a set of zfs list columns, fields are named after the
+    columns. Columns which are not valid identifiers (user properties) are
+    renamed positionally, e.g. '_2'.
+    """
+    return collections.namedtuple("ListRecord", columns, rename=True)
+
+
+@functools.lru_cache(maxsize=None)
+def get_record_type(columns: Tuple[str, ...]) -> type:
+    """
+    Record type for a set of zfs get columns
+    """
+    if columns == GET_DEFAULT_COLUMNS:
+        return GetRecord
+    return collections.namedtuple("GetRecord", columns, rename=True)
+
+
+def list_columns(columns: Optional[list]) -> Tuple[str, ...]:
+    if not columns:
+        return LIST_DEFAULT_COLUMNS
+
+    if "all" in columns:
+        raise RuntimeError("Cannot parse zfs list output of unknown columns 'all'")
+
+    return tuple(columns)
+
+
+def get_columns(columns: Optional[list]) -> Tuple[str, ...]:
+    if not columns:
+        return GET_DEFAULT_COLUMNS
+
+    if "all" in columns:
+        return GET_ALL_COLUMNS
+
+    return tuple(columns)
+
+
+def list_row_parser(columns: Optional[list] = None,
+                    parsable: bool = False) -> Callable[[List[str]], tuple]:
+    """
+    Function converting one split zfs list row into a record, numeric
+    columns become integers if the output was parsable.
+    """
+    columns = list_columns(columns)
+    make = list_record_type(columns)._make
+
+    numeric = [i for i, c in enumerate(columns) if c in NUMERIC_PROPERTIES] if parsable else []
+
+    if not numeric:
+        return make
+
+    def parse_row(row):
+        for i in numeric:
+            row[i] = parse_int(row[i])
+        return make(row)
+
+    return parse_row
+
+
+def get_row_parser(columns: Optional[list] = None,
+                   parsable: bool = False) -> Callable[[List[str]], tuple]:
+    """
+    Function converting one split zfs get row into a record. If the output
+    was parsable and both property and value columns were requested, values
+    of numeric properties become integers.
+    """
+    columns = get_columns(columns)
+    make = get_record_type(columns)._make
+
+    if not parsable or "property" not in columns or "value" not in columns:
+        return make
+
+    property_index = columns.index("property")
+    value_index = columns.index("value")
+
+    def parse_row(row):
+        if row[property_index] in NUMERIC_PROPERTIES:
+            row[value_index] = parse_int(row[value_index])
+        return make(row)
+
+    return parse_row
+
+
+def parse_list_rows(rows: Iterable[List[str]],
+                    columns: Optional[list] = None,
+                    parsable: bool = False) -> Iterator[tuple]:
+    """
+    Convert split zfs list rows into records, see list_row_parser
+    """
+    return map(list_row_parser(columns, parsable), rows)
+
+
+def parse_get_rows(rows: Iterable[List[str]],
+                   columns: Optional[list] = None,
+                   parsable: bool = False) -> Iterator[tuple]:
+    """
+    Convert split zfs get rows into records, see get_row_parser
+    """
+    return map(get_row_parser(columns, parsable), rows)
+
+
+"""
+Columnar output
+"""
+
+# Stored in numeric columns where zfs reported no value ('-' or 'none')
+MISSING = -1
+
+# Unsigned 64 bit values which do not fit a signed column, kept in lists
+UNSIGNED_PROPERTIES = frozenset(["guid"])
+
+
+class Columnar:
+    """
+    Column oriented result, dataset names in a list and each column in a
+    list of strings. Numeric columns of parsable output are stored in
+    array('q') with MISSING for absent values, so they can be aggregated
+    or exported to numpy without touching Python objects per value.
+    """
+
+    __slots__ = ("names", "columns")
+
+    def __init__(self, names: list, columns: dict):
+        self.names = names
+        self.columns = columns
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __getitem__(self, column: str):
+        return self.columns[column]
+
+    def __contains__(self, column: str) -> bool:
+        return column in self.columns
+
+    def to_numpy(self, column: str = None):
+        """
+        Export a column, or a dict of all columns, as numpy arrays. Numeric
+        columns are exported without copying. Requires numpy.
+        """
+        try:
+            import numpy
+        except ImportError:
+            raise RuntimeError("Exporting to numpy requires numpy to be installed")
+
+        def export(values):
+            if isinstance(values, array.array):
+                return numpy.frombuffer(values, dtype=numpy.int64)
+            return numpy.array(values, dtype=object)
+
+        if column is not None:
+            return export(self.columns[column])
+
+        exported = {c: export(v) for c, v in self.columns.items()}
+        exported["name"] = numpy.array(self.names, dtype=object)
+        return exported
+
+
+def _is_array_column(column: str, parsable: bool) -> bool:
+    return parsable and column in NUMERIC_PROPERTIES and column not in UNSIGNED_PROPERTIES
+
+
+def _array_value(value: str) -> int:
+    try:
+        return int(value)
+    except ValueError:
+        if value in ("-", "none"):
+            return MISSING
+        raise RuntimeError(f"Non numeric value '{value}' in numeric column")
+
+
+def columnar_list_rows(rows: Iterable[List[str]],
+                       columns: Optional[list] = None,
+                       parsable: bool = False) -> Columnar:
+    """
+    Collect split zfs list rows into a Columnar result
+    """
+    columns = list_columns(columns)
+
+    if "name" not in columns:
+        raise RuntimeError("Columnar output requires the 'name' column")
+
+    name_index = columns.index("name")
+    names = []
+    data = [array.array("q") if _is_array_column(c, parsable) else [] for c in columns]
+
+    appenders = []
+    for i, column in enumerate(columns):
+        if i == name_index:
+            continue
+        if isinstance(data[i], array.array):
+            appenders.append((i, data[i].append, _array_value))
+        else:
+            appenders.append((i, data[i].append, None))
+
+    for row in rows:
+        names.append(row[name_index])
+        for i, append, convert in appenders:
+            append(convert(row[i]) if convert is not None else row[i])
+
+    return Columnar(names, {c: data[i] for i, c in enumerate(columns) if i != name_index})
+
+
+def columnar_get_rows(rows: Iterable[List[str]],
+                      columns: Optional[list] = None,
+                      parsable: bool = False) -> Columnar:
+    """
+    Pivot split zfs get rows into a Columnar result with one column per
+    property. Datasets without a property hold MISSING or None.
+    """
+    columns = get_columns(columns)
+
+    if not {"name", "property", "value"}.issubset(columns):
+        raise RuntimeError("Columnar output requires the 'name', 'property' and 'value' columns")
+
+    name_index = columns.index("name")
+    property_index = columns.index("property")
+    value_index = columns.index("value")
+
+    names = []
+    data = {}
+    current = None
+
+    for row in rows:
+        name = row[name_index]
+        if name != current:
+            current = name
+            names.append(name)
+
+        prop = row[property_index]
+        values = data.get(prop)
+        if values is None:
+            if _is_array_column(prop, parsable):
+                values = array.array("q")
+            else:
+                values = []
+            data[prop] = values
+
+        # Pad datasets which did not report this property
+        missing = len(names) - 1 - len(values)
+        if missing:
+            values.extend([MISSING if isinstance(values, array.array) else None] * missing)
+
+        if isinstance(values, array.array):
+            values.append(_array_value(row[value_index]))
+        else:
+            values.append(row[value_index])
+
+    for values in data.values():
+        missing = len(names) - len(values)
+        if missing:
+            values.extend([MISSING if isinstance(values, array.array) else None] * missing)
+
+    return Columnar(names, data)
+
+
+"""
+JSON output (-j --json-int)
+"""
+
+"""
+Canonical names of property abbreviations, JSON output only uses these
+"""
+
+PROPERTY_ALIASES = {
+    "avail": "available", "compress": "compression", "lrefer": "logicalreferenced",
+    "lused": "logicalused", "rdonly": "readonly", "recsize": "recordsize",
+    "refer": "referenced", "refreserv": "refreservation", "reserv": "reservation",
+    "usedchild": "usedbychildren", "usedds": "usedbydataset",
+    "usedrefreserv": "usedbyrefreservation", "usedsnap": "usedbysnapshots",
+    "volblock": "volblocksize",
+}
+
+
+class JSONCollectionParser:
+    """
+    Incremental parser for zfs and zpool JSON output. Entries of one top
+    level collection, 'datasets' or 'pools', are returned by feed() as soon
+    as each is complete, so the document is never held as a whole.
+    """
+
+    _whitespace = re.compile(r'[ \t\n\r]*')
+
+    def __init__(self, collection: str):
+        # Imported here, only JSON output needs it and json is slow to import
+        import json
+
+        self.collection = collection
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._state = "start"
+        self._key = None
+        self._in_collection = False
+        self._closed = False
+
+    def _decode(self, position: int):
+        """Decode the value at position, None if it is not complete yet"""
+        try:
+            value, end = self._decoder.raw_decode(self._buffer, position)
+        except ValueError as e:
+            if self._closed:
+                raise RuntimeError(f"Invalid JSON output: {e}")
+            return None
+
+        # A number may continue in the next chunk
+        if end == len(self._buffer) and not self._closed \
+                and not isinstance(value, (dict, list, str)):
+            return None
+
+        return value, end
+
+    def _close_object(self):
+        if self._in_collection:
+            self._in_collection = False
+            self._state = "next"
+        else:
+            self._state = "done"
+
+    def feed(self, chunk: str) -> List[Tuple[str, dict]]:
+        """
+        Add output, returns the (name, entry) pairs completed by it
+        """
+        buffer = self._buffer = self._buffer + chunk
+        position = 0
+        entries = []
+
+        while True:
+            position = self._whitespace.match(buffer, position).end()
+            if position == len(buffer):
+                break
+
+            state = self._state
+            character = buffer[position]
+
+            if state == "done":
+                raise RuntimeError("Unexpected data after JSON output")
+
+            if state in ("start", "open") and character == "{":
+                position += 1
+                self._in_collection = state == "open"
+                self._state = "key"
+            elif state in ("key", "next") and character == "}":
+                position += 1
+                self._close_object()
+            elif state == "next" and character == ",":
+                position += 1
+                self._state = "key"
+            elif state == "key" and character == '"':
+                decoded = self._decode(position)
+                if decoded is None:
+                    break
+                self._key, position = decoded
+                self._state = "colon"
+            elif state == "colon" and character == ":":
+                position += 1
+                collection = not self._in_collection and self._key == self.collection
+                self._state = "open" if collection else "value"
+            elif state == "value":
+                decoded = self._decode(position)
+                if decoded is None:
+                    break
+                value, position = decoded
+                if self._in_collection:
+                    entries.append((self._key, value))
+                self._state = "next"
+            else:
+                raise RuntimeError(f"Unexpected '{character}' in JSON output")
+
+        self._buffer = buffer[position:]
+        return entries
+
+    def close(self) -> List[Tuple[str, dict]]:
+        """
+        Mark the end of output, raises RuntimeError if it was incomplete
+        """
+        self._closed = True
+        entries = self.feed("")
+
+        if self._state != "done":
+            raise RuntimeError("Incomplete JSON output")
+
+        return entries
+
+
+def _json_value(value) -> str:
+    """Format a JSON value as in parsable text output"""
+    if value is None:
+        return "-"
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return "on" if value else "off"
+    return str(value)
+
+
+def _json_source(source: Optional[dict]) -> str:
+    """Format a JSON property source as in text output"""
+    if not source:
+        return "-"
+
+    source_type = source.get("type", "NONE")
+
+    if source_type == "INHERITED":
+        return f"inherited from {source.get('data', '-')}"
+    if source_type == "NONE":
+        return "-"
+
+    return source_type.lower()
+
+
+def _json_property(properties: dict, prop: str) -> Optional[dict]:
+    detail = properties.get(prop)
+    if detail is None:
+        detail = properties.get(PROPERTY_ALIASES.get(prop))
+    return detail
+
+
+def json_list_row(name: str, entry: dict, columns: Iterable[str]) -> List[str]:
+    """
+    One JSON zfs list entry as the fields of a 'zfs list -H -p' row
+    """
+    properties = entry.get("properties", {})
+    row = []
+
+    for column in columns:
+        detail = _json_property(properties, column)
+
+        if column == "name":
+            row.append(name)
+        elif detail is not None:
+            row.append(_json_value(detail.get("value")))
+        elif column == "type" and "type" in entry:
+            # Types are upper case in JSON output only
+            row.append(entry["type"].lower())
+        else:
+            row.append(_json_value(entry.get(column)))
+
+    return row
+
+
+def json_get_rows(name: str, entry: dict, columns: Iterable[str]) -> List[List[str]]:
+    """
+    One JSON zfs get or zpool get entry as 'get -H -p' rows, one per property
+    """
+    rows = []
+
+    for prop, detail in entry.get("properties", {}).items():
+        fields = {
+            "name": name,
+            "property": prop,
+            "value": _json_value(detail.get("value")),
+            "received": _json_value(detail.get("received")),
+            "source": _json_source(detail.get("source")),
+        }
+        rows.append([fields[column] for column in columns])
+
+    return rows
+
+
+def json_rows(chunks: Iterable[str],
+              collection: str,
+              convert: Callable[[str, dict], List[List[str]]]) -> Iterator[List[str]]:
+    """
+    Rows converted from each entry of JSON output as it is parsed
+    """
+    parser = JSONCollectionParser(collection)
+
+    for chunk in chunks:
+        for name, entry in parser.feed(chunk):
+            yield from convert(name, entry)
+
+    for name, entry in parser.close():
+        yield from convert(name, entry)
+
+
+"""
+zfs destroy dry run output
+"""
+
+"""
+Estimate of a destroy: names zfs would destroy, space used by each
+requested snapshot alone, and the total space reclaimed
+"""
+
+DestroyEstimate = collections.namedtuple("DestroyEstimate", ["destroyed", "used", "reclaim"])
+
+
+def parse_destroy_dry_run(output: str) -> DestroyEstimate:
+    """
+    Parse the output of 'zfs destroy -n -p -v'
+    """
+    destroyed = []
+    reclaim = 0
+
+    for line in output.splitlines():
+        fields = line.split("\t")
+        if fields[0] == "destroy" and len(fields) > 1:
+            destroyed.append(fields[1])
+        elif fields[0] == "reclaim" and len(fields) > 1:
+            reclaim += int(fields[1])
+
+    return DestroyEstimate(destroyed, {}, reclaim)
@@ -0,0 +1,1980 @@
+"""
+Simulated zfs and zpool commands
+
+SimulatedBackend answers the commands built by pyzfscmds from an in memory
+model of pools, datasets, snapshots and clones, so code using pyzfscmds can
+be tested and benchmarked without ZFS. Text and JSON output follow OpenZFS,
+sizes and times are made up but consistent with each other.
+"""
+
+import collections
+import getopt
+import json
+import locale
+import os
+import random
+import subprocess
+import threading
+import time
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pyzfscmds.backend
+import pyzfscmds.parse
+
+
+class _Failure(Exception):
+    """
+    A failed command, message is written to stderr
+    """
+
+    def __init__(self, message: str, returncode: int = 1, stdout: str = ""):
+        super().__init__(message)
+        self.message = message
+        self.returncode = returncode
+        self.stdout = stdout
+
+
+class _Invalid(Exception):
+    """
+    Invalid property or value, reported with the dataset it was given for
+    """
+
+
+def _usage(message: str) -> _Failure:
+    return _Failure(message, returncode=2)
+
+
+def _options(args: List[str], short: str, long: Iterable[str] = ()) -> Tuple[dict, List[str]]:
+    """
+    Parse options like zfs does on Linux, returning a dict of option to
+    its last value, lists of values for repeated options -o -s and -S,
+    and the remaining arguments
+    """
+    try:
+        parsed, arguments = getopt.gnu_getopt(args, short, list(long))
+    except getopt.GetoptError as e:
+        raise _usage(str(e))
+
+    options = {}
+    for option, value in parsed:
+        if option in ("-o", "-s", "-S"):
+            options.setdefault(option, []).append(value)
+        else:
+            options[option] = value
+
+    return options, arguments
+
+
+"""
+Properties
+"""
+
+_Property = collections.namedtuple("_Property", ["kind", "default", "types", "inherit", "access"])
+
+
+def _prop(kind, default=None, types="fv", inherit=False, access="set") -> _Property:
+    """
+    kind is 'size', 'number', 'time', 'ratio', 'percent', 'string' or a
+    tuple of accepted values. types holds the first letter of each dataset
+    type the property applies to. access is 'set', 'setonce' for
+    properties only given at creation, or 'readonly'.
+    """
+    return _Property(kind, default, types, inherit, access)
+
+
+_ONOFF = ("on", "off")
+
+_COMPRESSION = ("on", "off", "lzjb", "gzip") + tuple(f"gzip-{i}" for i in range(1, 10)) + (
+    "zle", "lz4", "zstd", "zstd-fast")
+
+"""
+zfs properties, in 'zfs get all' order
+"""
+
+ZFS_PROPERTIES = collections.OrderedDict([
+    ("type", _prop("string", types="fvs", access="readonly")),
+    ("creation", _prop("time", types="fvs", access="readonly")),
+    ("used", _prop("size", types="fvs", access="readonly")),
+    ("available", _prop("size", access="readonly")),
+    ("referenced", _prop("size", types="fvs", access="readonly")),
+    ("compressratio", _prop("ratio", types="fvs", access="readonly")),
+    ("mounted", _prop("string", types="f", access="readonly")),
+    ("origin", _prop("string", access="readonly")),
+    ("quota", _prop("size", 0, types="f")),
+    ("reservation", _prop("size", 0)),
+    ("recordsize", _prop("size", 131072, types="f", inherit=True)),
+    ("mountpoint", _prop("string", types="f", inherit=True)),
+    ("sharenfs", _prop("string", "off", types="f", inherit=True)),
+    ("checksum", _prop(("on", "off", "fletcher2", "fletcher4", "sha256", "sha512", "skein",
+                        "edonr", "blake3"), "on", inherit=True)),
+    ("compression", _prop(_COMPRESSION, "off", inherit=True)),
+    ("atime", _prop(_ONOFF, "on", types="f", inherit=True)),
+    ("devices", _prop(_ONOFF, "on", types="f", inherit=True)),
+    ("exec", _prop(_ONOFF, "on", types="f", inherit=True)),
+    ("setuid", _prop(_ONOFF, "on", types="f", inherit=True)),
+    ("readonly", _prop(_ONOFF, "off", inherit=True)),
+    ("snapdir", _prop(("hidden", "visible"), "hidden", types="f", inherit=True)),
+    ("aclinherit", _prop(("discard", "noallow", "restricted", "passthrough", "passthrough-x"),
+                         "restricted", types="f", inherit=True)),
+    ("createtxg", _prop("number", types="fvs", access="readonly")),
+    ("canmount", _prop(("on", "off", "noauto"), "on", types="f")),
+    ("xattr", _prop(("on", "off", "sa", "dir"), "on", types="f", inherit=True)),
+    ("copies", _prop(("1", "2", "3"), "1", inherit=True)),
+    ("version", _prop("number", 5, types="f", access="setonce")),
+    ("utf8only", _prop(_ONOFF, "off", types="f", access="setonce")),
+    ("normalization", _prop(("none", "formC", "formD", "formKC", "formKD"), "none",
+                            types="f", access="setonce")),
+    ("casesensitivity", _prop(("sensitive", "insensitive", "mixed"), "sensitive",
+                              types="f", access="setonce")),
+    ("sharesmb", _prop("string", "off", types="f", inherit=True)),
+    ("refquota", _prop("size", 0, types="f")),
+    ("refreservation", _prop("size", 0)),
+    ("guid", _prop("number", types="fvs", access="readonly")),
+    ("primarycache", _prop(("all", "none", "metadata"), "all", inherit=True)),
+    ("secondarycache", _prop(("all", "none", "metadata"), "all", inherit=True)),
+    ("usedbysnapshots", _prop("size", access="readonly")),
+    ("usedbydataset", _prop("size", access="readonly")),
+    ("usedbychildren", _prop("size", access="readonly")),
+    ("usedbyrefreservation", _prop("size", access="readonly")),
+    ("logbias", _prop(("latency", "throughput"), "latency", inherit=True)),
+    ("dedup", _prop(("on", "off", "verify", "sha256", "sha512", "skein"), "off", inherit=True)),
+    ("sync", _prop(("standard", "always", "disabled"), "standard", inherit=True)),
+    ("dnodesize", _prop(("legacy", "auto", "1k", "2k", "4k", "8k", "16k"), "legacy",
+                        types="f", inherit=True)),
+    ("refcompressratio", _prop("ratio", types="fvs", access="readonly")),
+    ("written", _prop("size", types="fvs", access="readonly")),
+    ("logicalused", _prop("size", types="fvs", access="readonly")),
+    ("logicalreferenced", _prop("size", types="fvs", access="readonly")),
+    ("volmode", _prop(("default", "full", "geom", "dev", "none"), "default",
+                      types="v", inherit=True)),
+    ("volsize", _prop("size", types="v")),
+    ("volblocksize", _prop("size", 16384, types="v", access="setonce")),
+    ("snapdev", _prop(("hidden", "visible"), "hidden", types="v", inherit=True)),
+    ("acltype", _prop(("off", "noacl", "nfsv4", "posix", "posixacl"), "off",
+                      types="f", inherit=True)),
+    ("relatime", _prop(_ONOFF, "off", types="f", inherit=True)),
+    ("redundant_metadata", _prop(("all", "most", "some", "none"), "all", inherit=True)),
+    ("overlay", _prop(_ONOFF, "on", types="f", inherit=True)),
+    ("special_small_blocks", _prop("size", 0, types="f", inherit=True)),
+    ("clones", _prop("string", types="s", access="readonly")),
+    ("defer_destroy", _prop(_ONOFF, types="s", access="readonly")),
+    ("userrefs", _prop("number", types="s", access="readonly")),
+])
+
+"""
+zpool properties, in 'zpool get all' order
+"""
+
+ZPOOL_PROPERTIES = collections.OrderedDict([
+    ("size", _prop("size", access="readonly")),
+    ("capacity", _prop("percent", access="readonly")),
+    ("altroot", _prop("string", access="setonce")),
+    ("health", _prop("string", access="readonly")),
+    ("guid", _prop("number", access="readonly")),
+    ("version", _prop("number", access="readonly")),
+    ("bootfs", _prop("string")),
+    ("delegation", _prop(_ONOFF, "on")),
+    ("autoreplace", _prop(_ONOFF, "off")),
+    ("cachefile", _prop("string")),
+    ("failmode", _prop(("wait", "continue", "panic"), "wait")),
+    ("listsnapshots", _prop(_ONOFF, "off")),
+    ("autoexpand", _prop(_ONOFF, "off")),
+    ("dedupratio", _prop("ratio", access="readonly")),
+    ("free", _prop("size", access="readonly")),
+    ("allocated", _prop("size", access="readonly")),
+    ("readonly", _prop(_ONOFF, access="readonly")),
+    ("ashift", _prop("number", 0, access="setonce")),
+    ("comment", _prop("string")),
+    ("expandsize", _prop("size", access="readonly")),
+    ("freeing", _prop("size", access="readonly")),
+    ("fragmentation", _prop("percent", access="readonly")),
+    ("leaked", _prop("size", access="readonly")),
+    ("multihost", _prop(_ONOFF, "off")),
+    ("checkpoint", _prop("size", access="readonly")),
+    ("load_guid", _prop("number", access="readonly")),
+    ("autotrim", _prop(_ONOFF, "off")),
+    ("compatibility", _prop("string", "off")),
+])
+
+# Size properties shown as 'none' when zero
+_NONE_SIZES = {"quota", "refquota", "reservation", "refreservation"}
+
+_TYPES = {"filesystem": "filesystem", "fs": "filesystem", "volume": "volume", "vol": "volume",
+          "snapshot": "snapshot", "snap": "snapshot", "bookmark": "bookmark"}
+
+_ALL_TYPES = frozenset(["filesystem", "volume", "snapshot", "bookmark"])
+
+_SOURCES = frozenset(["local", "default", "inherited", "temporary", "received", "none"])
+
+_GET_COLUMNS = ("name", "property", "value", "received", "source")
+
+_LIST_HEADERS = {
+    "available": "AVAIL", "referenced": "REFER", "compressratio": "RATIO",
+    "refcompressratio": "REFRATIO", "recordsize": "RECSIZE", "reservation": "RESERV",
+    "refreservation": "REFRESERV", "volblocksize": "VOLBLOCK", "logicalused": "LUSED",
+    "logicalreferenced": "LREFER", "usedbysnapshots": "USEDSNAP", "usedbydataset": "USEDDS",
+    "usedbychildren": "USEDCHILD", "usedbyrefreservation": "USEDREFRESERV",
+    "compression": "COMPRESS", "readonly": "RDONLY",
+}
+
+_SUFFIXES = "BKMGTPE"
+
+_NAME_CHARACTERS = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
+                             "0123456789_.: -")
+
+_USER_PROPERTY_CHARACTERS = frozenset("abcdefghijklmnopqrstuvwxyz0123456789_.:-")
+
+# Creation time of the first transaction group
+_EPOCH = 1577836800
+
+_FILESYSTEM_REFERENCED = 98304
+_VOLUME_REFERENCED = 57344
+
+_UPGRADE_VERSIONS = """The following filesystem versions are supported:
+
+VER  DESCRIPTION
+---  --------------------------------------------------------
+ 1   Initial ZFS filesystem version
+ 2   Enhanced directory entries
+ 3   Case insensitive and filesystem user identifier (FUID)
+ 4   userquota, groupquota properties
+ 5   System attributes
+
+For more information on a particular version, including supported releases,
+see the ZFS Administration Guide.
+
+"""
+
+
+def _canonical(prop: str) -> str:
+    return pyzfscmds.parse.PROPERTY_ALIASES.get(prop, prop)
+
+
+def _user_property(prop: str) -> bool:
+    return ":" in prop
+
+
+def _valid_property(prop: str) -> bool:
+    if _user_property(prop):
+        return not prop.startswith(":") and len(prop) <= 256 and \
+            all(c in _USER_PROPERTY_CHARACTERS for c in prop)
+
+    return _canonical(prop) in ZFS_PROPERTIES
+
+
+def _parse_size(value: str) -> Optional[int]:
+    """
+    Bytes in a size such as '512', '4K' or '1.5G', None if invalid
+    """
+    number = value
+    multiplier = 1
+
+    # '4K' and '4KB' are the same size
+    if len(number) > 2 and number[-1] in "bB" and number[-2].upper() in _SUFFIXES[1:]:
+        number = number[:-1]
+
+    if number and number[-1].upper() in _SUFFIXES:
+        multiplier = 1024 ** _SUFFIXES.index(number[-1].upper())
+        number = number[:-1]
+
+    try:
+        size = float(number) if "." in number else int(number)
+    except ValueError:
+        return None
+
+    if size < 0:
+        return None
+
+    return int(size * multiplier)
+
+
+def _nicenum(value: int) -> str:
+    """
+    Human readable size like zfs prints it, at most five characters
+    """
+    index = 0
+    scaled = value
+    while scaled >= 1024 and index < len(_SUFFIXES) - 1:
+        scaled //= 1024
+        index += 1
+
+    if index == 0 or value % (1024 ** index) == 0:
+        return f"{scaled}{_SUFFIXES[index]}"
+
+    exact = value / 1024 ** index
+    for precision in (2, 1, 0):
+        text = f"{exact:.{precision}f}{_SUFFIXES[index]}"
+        if len(text) <= 5:
+            break
+
+    return text
+
+
+def _format(definition: _Property, prop: str, value, parsable: bool) -> str:
+    """
+    Text output of a property value
+    """
+    if value is None:
+        return "-"
+
+    kind = definition.kind
+
+    if kind == "size":
+        if parsable:
+            return str(value)
+        return "none" if value == 0 and prop in _NONE_SIZES else _nicenum(value)
+
+    if kind == "time" and not parsable:
+        t = time.localtime(value)
+        return f"{time.strftime('%a %b', t)} {t.tm_mday:>2} {t.tm_hour:>2}:{t.tm_min:02} " \
+               f"{t.tm_year}"
+
+    if kind == "ratio":
+        return f"{value:.2f}" if parsable else f"{value:.2f}x"
+
+    if kind == "percent" and not parsable:
+        return f"{value}%"
+
+    return str(value)
+
+
+def _json_value(definition: _Property, prop: str, value, parsable: bool, json_int: bool):
+    if json_int and isinstance(value, int) and definition.kind != "string":
+        return value
+    return _format(definition, prop, value, parsable)
+
+
+def _json_source(source: str) -> dict:
+    if source.startswith("inherited from "):
+        return {"type": "INHERITED", "data": source[len("inherited from "):]}
+    if source == "-":
+        return {"type": "NONE", "data": "-"}
+    return {"type": source.upper(), "data": "-"}
+
+
+def _source_type(source: str) -> str:
+    if source == "-":
+        return "none"
+    if source.startswith("inherited"):
+        return "inherited"
+    return source
+
+
+def _parse_value(prop: str, value: str):
+    """
+    Stored form of a property value, raises _Invalid
+    """
+    if _user_property(prop):
+        if len(value) > 8191:
+            raise _Invalid(f"property value '{prop}' is too long")
+        return value
+
+    definition = ZFS_PROPERTIES[prop]
+    kind = definition.kind
+
+    if isinstance(kind, tuple):
+        if value not in kind:
+            raise _Invalid(f"'{prop}' must be one of '{' | '.join(kind)}'")
+        return value
+
+    if kind == "size":
+        if value == "none" and prop in _NONE_SIZES:
+            return 0
+
+        size = _parse_size(value)
+        if size is None:
+            raise _Invalid(f"bad numeric value '{value}'")
+
+        if prop in ("recordsize", "volblocksize") and \
+                (size & (size - 1) or not 512 <= size <= 16 * 1024 ** 2):
+            raise _Invalid(f"'{prop}' must be power of 2 from 512B to 16M")
+
+        if prop == "volsize" and size == 0:
+            raise _Invalid("volume size cannot be zero")
+
+        return size
+
+    if kind == "number":
+        try:
+            return int(value)
+        except ValueError:
+            raise _Invalid(f"bad numeric value '{value}'")
+
+    if prop == "mountpoint":
+        if value not in ("none", "legacy") and not value.startswith("/"):
+            raise _Invalid("'mountpoint' must be an absolute path, 'none', or 'legacy'")
+        return value.rstrip("/") or "/"
+
+    return value
+
+
+def _name_error(name: str, snapshot: bool = False) -> Optional[str]:
+    """
+    Why name is not a valid dataset, or snapshot, name. None if it is.
+    """
+    if len(name) >= 256:
+        return "name is too long"
+
+    dataset, at, snapname = name.partition("@")
+
+    if at and not snapshot:
+        return "snapshot delimiter '@' is not expected here"
+
+    if snapshot and not at:
+        return "missing '@' delimiter in snapshot name"
+
+    for component in dataset.split("/") + ([snapname] if at else []):
+        if not component:
+            return "empty component or misplaced '@' or '#' delimiter in name"
+
+        for character in component:
+            if character not in _NAME_CHARACTERS:
+                return f"invalid character '{character}' in name"
+
+    if not dataset[0].isalpha():
+        return "pool name must begin with a letter"
+
+    return None
+
+
+def _parent_name(name: str) -> Optional[str]:
+    if "@" in name:
+        return name.split("@", 1)[0]
+    return name.rpartition("/")[0] or None
+
+
+def _default_order(dataset: "_Dataset") -> tuple:
+    """
+    Order of zfs list without -s, names compared up to the '@' and then
+    snapshots after their dataset, oldest first
+    """
+    base, at, _ = dataset.name.partition("@")
+    return base, bool(at), dataset.createtxg
+
+
+def _table(header: List[str], rows: List[List[str]], scripting: bool,
+           right: Iterable[int] = ()) -> str:
+    """
+    Rows as tab separated lines, or as aligned columns under a header
+    """
+    if scripting:
+        return "".join("\t".join(row) + "\n" for row in rows)
+
+    if not rows:
+        return ""
+
+    right = set(right)
+    lines = [header] + rows
+    widths = [max(len(line[i]) for line in lines) for i in range(len(header))]
+
+    return "".join("  ".join(cell.rjust(width) if i in right else cell.ljust(width)
+                             for i, (cell, width) in enumerate(zip(line, widths))).rstrip() + "\n"
+                   for line in lines)
+
+
+"""
+Model
+"""
+
+
+class _Dataset:
+    """
+    A filesystem, volume or snapshot. Pools may hold millions of snapshots,
+    so containers a snapshot never fills are shared empty ones.
+    """
+    __slots__ = ("name", "type", "createtxg", "guid", "referenced", "used",
+                 "properties", "origin", "clones", "mounted", "deferred",
+                 "children", "snapshots")
+
+    def __init__(self, name: str, dataset_type: str, createtxg: int, guid: int,
+                 referenced: int):
+        self.name = name
+        self.type = dataset_type
+        self.createtxg = createtxg
+        self.guid = guid
+        self.referenced = referenced
+        # Space used by the dataset and its descendants, kept up to date
+        # by SimulatedBackend as they change
+        self.used = 0
+        # Local property values
+        self.properties = {}
+        # Origin snapshot of a clone
+        self.origin = None
+        # Clones of a snapshot, replaced by a list when it is cloned
+        self.clones = ()
+        self.mounted = False
+        # Snapshot destroyed with its last clone
+        self.deferred = False
+
+        if dataset_type == "snapshot":
+            self.children = frozenset()
+            self.snapshots = ()
+        else:
+            # Names of child filesystems and volumes
+            self.children = set()
+            # Names of snapshots as keys, oldest first
+            self.snapshots = {}
+
+    @property
+    def creation(self) -> int:
+        return _EPOCH + self.createtxg
+
+
+class _Pool:
+    __slots__ = ("name", "size", "guid", "properties")
+
+    def __init__(self, name: str, size: int, guid: int):
+        self.name = name
+        self.size = size
+        self.guid = guid
+        self.properties = {}
+
+
+class SimulatedBackend(pyzfscmds.backend.Backend):
+    """
+    Backend answering zfs and zpool commands from an in memory model, no
+    process is run. Pools are created with create_pool(), everything in
+    them with commands. Commands on one backend are serialised.
+    """
+
+    def __init__(self, version: str = "2.3.4", seed: int = 0,
+                 fallback: pyzfscmds.backend.Backend = None):
+        """
+        version is reported by 'zfs version', seed makes guids repeatable.
+        Programs other than zfs and zpool are run by fallback if given.
+        """
+        self.version = version
+        self.fallback = fallback
+        self._lock = threading.RLock()
+        self._random = random.Random(seed)
+        self._pools = collections.OrderedDict()
+        self._datasets = {}
+        self._txg = 0
+
+    def create_pool(self, name: str, size: int = 1 << 40):
+        """
+        Add an empty pool of size bytes, its root filesystem is mounted
+        """
+        with self._lock:
+            error = _name_error(name) if "/" not in name else "invalid pool name"
+            if error is not None:
+                raise RuntimeError(f"Cannot create pool '{name}': {error}")
+
+            if name in self._pools:
+                raise RuntimeError(f"Pool {name} already exists")
+
+            self._pools[name] = _Pool(name, size, self._random.getrandbits(63))
+
+            root = self._new_dataset(name, "filesystem")
+            self._insert(root)
+            root.mounted = True
+
+    def _delegated(self, argv: List[str]) -> bool:
+        return self.fallback is not None and \
+            (not argv or os.path.basename(argv[0]) not in ("zfs", "zpool"))
+
+    def run(self, argv: List[str], env: Optional[dict] = None) -> subprocess.CompletedProcess:
+        argv = list(argv)
+
+        if self._delegated(argv):
+            return self.fallback.run(argv, env)
+
+        with self._lock:
+            try:
+                stdout = self._dispatch(argv)
+            except _Failure as e:
+                return subprocess.CompletedProcess(argv, e.returncode, e.stdout, e.message + "\n")
+
+        result = subprocess.CompletedProcess(argv, 0, stdout, "")
+        # The bytes zfs would have written, as run_output() encodes them
+        result.output_bytes = len(stdout.encode(locale.getpreferredencoding(False)))
+        return result
+
+    def stream(self, argv, env, read):
+        if self._delegated(argv):
+            return self.fallback.stream(argv, env, read)
+        return super().stream(argv, env, read)
+
+    async def run_async(self, argv, env=None):
+        if self._delegated(argv):
+            return await self.fallback.run_async(argv, env)
+        return self.run(argv, env)
+
+    async def run_output_async(self, argv, env, output):
+        if self._delegated(argv):
+            return await self.fallback.run_output_async(argv, env, output)
+        return await super().run_output_async(argv, env, output)
+
+    def stream_async(self, argv, env, size=65536):
+        if self._delegated(argv):
+            return self.fallback.stream_async(argv, env, size)
+        return super().stream_async(argv, env, size)
+
+    def _dispatch(self, argv: List[str]) -> str:
+        program = os.path.basename(argv[0]) if argv else ""
+
+        if program not in ("zfs", "zpool"):
+            raise _Failure(f"{program}: command not found", returncode=127)
+
+        if len(argv) < 2:
+            raise _usage("missing command")
+
+        sub_command = {"snap": "snapshot", "umount": "unmount"}.get(argv[1], argv[1])
+        handler = getattr(self, f"_{program}_{sub_command}", None)
+
+        if handler is None:
+            raise _usage(f"unrecognized command '{argv[1]}'")
+
+        return handler(argv[2:])
+
+    """
+    Datasets
+    """
+
+    def _new_dataset(self, name: str, dataset_type: str, createtxg: int = None,
+                     referenced: int = None) -> _Dataset:
+        if createtxg is None:
+            self._txg += 1
+            createtxg = self._txg
+
+        if referenced is None:
+            referenced = _VOLUME_REFERENCED if dataset_type == "volume" \
+                else _FILESYSTEM_REFERENCED
+
+        return _Dataset(name, dataset_type, createtxg, self._random.getrandbits(63), referenced)
+
+    def _charge(self, dataset: Optional[_Dataset], delta: int):
+        """
+        Add delta bytes to the space used by dataset and its ancestors
+        """
+        while dataset is not None and delta:
+            dataset.used += delta
+            dataset = self._parent(dataset)
+
+    def _insert(self, dataset: _Dataset):
+        self._datasets[dataset.name] = dataset
+
+        parent = _parent_name(dataset.name)
+        if parent is not None:
+            if dataset.type == "snapshot":
+                self._datasets[parent].snapshots[dataset.name] = None
+            else:
+                self._datasets[parent].children.add(dataset.name)
+
+        if dataset.type != "snapshot":
+            self._charge(dataset, self._own_used(dataset))
+
+    def _remove(self, dataset: _Dataset):
+        parent = self._datasets.get(_parent_name(dataset.name) or "")
+
+        if dataset.type != "snapshot":
+            self._charge(parent, -dataset.used)
+
+        del self._datasets[dataset.name]
+
+        if parent is not None:
+            if dataset.type == "snapshot":
+                del parent.snapshots[dataset.name]
+            else:
+                parent.children.discard(dataset.name)
+
+        origin = self._datasets.get(dataset.origin or "")
+        if origin is not None:
+            origin.clones.remove(dataset.name)
+            if origin.deferred and not origin.clones:
+                self._remove(origin)
+
+    def _open(self, name: str, types: Iterable[str] = _ALL_TYPES) -> _Dataset:
+        dataset = self._datasets.get(name)
+
+        if dataset is None:
+            raise _Failure(f"cannot open '{name}': dataset does not exist")
+
+        if dataset.type not in types:
+            raise _Failure(f"cannot open '{name}': operation not applicable to datasets "
+                           f"of this type")
+
+        return dataset
+
+    def _walk(self, dataset: _Dataset, depth: int = None,
+              snapshots: bool = True) -> Iterable[_Dataset]:
+        """
+        dataset and everything below it, at most depth levels down
+        """
+        stack = [(dataset, 0)]
+
+        while stack:
+            current, level = stack.pop()
+            yield current
+
+            if current.type == "snapshot" or (depth is not None and level >= depth):
+                continue
+
+            if snapshots:
+                for name in current.snapshots:
+                    yield self._datasets[name]
+
+            stack.extend((self._datasets[child], level + 1) for child in current.children)
+
+    def _dependents(self, roots: Iterable[_Dataset], clones: bool) -> List[_Dataset]:
+        """
+        roots with their descendants and snapshots, and with clones of the
+        snapshots if clones is True. Each comes before what it depends on.
+        """
+        def direct(dataset):
+            if dataset.type == "snapshot":
+                return list(dataset.clones) if clones else []
+            return sorted(dataset.children) + list(dataset.snapshots)
+
+        roots = list(roots)
+        ordered = []
+        seen = {root.name for root in roots}
+
+        # Iterative, clone chains can be deep
+        for root in roots:
+            stack = [(root, iter(direct(root)))]
+            while stack:
+                dataset, pending = stack[-1]
+                for name in pending:
+                    if name not in seen:
+                        seen.add(name)
+                        dependent = self._datasets[name]
+                        stack.append((dependent, iter(direct(dependent))))
+                        break
+                else:
+                    stack.pop()
+                    ordered.append(dataset)
+
+        return ordered
+
+    def _destroy(self, datasets: Iterable[_Dataset]):
+        for dataset in datasets:
+            if dataset.name in self._datasets:
+                self._remove(dataset)
+
+    def _rename(self, mapping: Dict[str, str]):
+        """
+        Rename datasets and snapshots, mapping old to new names. Snapshots
+        may move to another dataset.
+        """
+        renamed = [self._datasets.pop(old) for old in mapping]
+
+        for dataset in renamed:
+            dataset.name = mapping[dataset.name]
+            if dataset.type != "snapshot":
+                dataset.children = {mapping.get(c, c) for c in dataset.children}
+                dataset.snapshots = {mapping.get(s, s): None for s in dataset.snapshots}
+            if dataset.clones:
+                dataset.clones = [mapping.get(c, c) for c in dataset.clones]
+            if dataset.origin is not None:
+                dataset.origin = mapping.get(dataset.origin, dataset.origin)
+            self._datasets[dataset.name] = dataset
+
+        names = set(mapping.values())
+        resort = set()
+        for old, new in mapping.items():
+            dataset = self._datasets[new]
+            old_parent = _parent_name(old)
+            new_parent = _parent_name(new)
+
+            # Links from outside the renamed names
+            if old_parent is not None and old_parent not in mapping:
+                parent = self._datasets[old_parent]
+                if dataset.type == "snapshot":
+                    if old_parent == new_parent:
+                        resort.add(new_parent)
+                    else:
+                        del parent.snapshots[old]
+                        self._datasets[new_parent].snapshots[new] = None
+                        resort.add(new_parent)
+                else:
+                    parent.children.discard(old)
+                    self._datasets[new_parent].children.add(new)
+                    self._charge(parent, -dataset.used)
+                    self._charge(self._datasets[new_parent], dataset.used)
+
+            if dataset.origin is not None and dataset.origin not in names:
+                origin = self._datasets[dataset.origin]
+                origin.clones = [mapping.get(c, c) for c in origin.clones]
+
+            for clone in dataset.clones:
+                self._datasets[clone].origin = new
+
+        # Snapshot names are keys, renamed ones are put back in creation order
+        for name in resort:
+            parent = self._datasets[name]
+            parent.snapshots = {mapping.get(s, s): None for s in sorted(
+                parent.snapshots, key=lambda s: self._datasets[mapping.get(s, s)].createtxg)}
+
+    def _create_parents(self, name: str):
+        """
+        Create missing ancestors of name as filesystems, raises _Failure
+        """
+        missing = []
+        parent = _parent_name(name)
+
+        while parent is not None and parent not in self._datasets:
+            missing.append(parent)
+            parent = _parent_name(parent)
+
+        if parent is None:
+            raise _Failure(f"cannot create '{name}': no such pool '{name.split('/')[0]}'")
+
+        for ancestor in reversed(missing):
+            self._check_parent(name, ancestor)
+            dataset = self._new_dataset(ancestor, "filesystem")
+            self._insert(dataset)
+            dataset.mounted = self._mountable(dataset)
+
+    def _check_parent(self, name: str, created: str = None):
+        parent = self._datasets.get(_parent_name(created or name))
+
+        if parent is None:
+            raise _Failure(f"cannot create '{name}': parent does not exist")
+
+        if parent.type != "filesystem":
+            raise _Failure(f"cannot create '{name}': parent is not a filesystem")
+
+    """
+    Property values
+    """
+
+    def _parent(self, dataset: _Dataset) -> Optional[_Dataset]:
+        parent = _parent_name(dataset.name)
+        return self._datasets[parent] if parent is not None else None
+
+    def _value(self, dataset: _Dataset, prop: str) -> Tuple[object, str]:
+        """
+        Value and source of a canonical property name, value is None if
+        the property is not set or does not apply to the dataset
+        """
+        if _user_property(prop):
+            current = dataset
+            while current is not None:
+                if prop in current.properties:
+                    source = "local" if current is dataset else f"inherited from {current.name}"
+                    return current.properties[prop], source
+                current = self._parent(current)
+            return None, "-"
+
+        definition = ZFS_PROPERTIES[prop]
+
+        if dataset.type[0] not in definition.types:
+            return None, "-"
+
+        if definition.access == "readonly":
+            return self._readonly(dataset, prop), "-"
+
+        if prop in dataset.properties:
+            return dataset.properties[prop], "-" if definition.access == "setonce" else "local"
+
+        if definition.access == "setonce":
+            return definition.default, "-"
+
+        if definition.inherit:
+            current = self._parent(dataset)
+            while current is not None:
+                if prop in current.properties:
+                    value = current.properties[prop]
+                    if prop == "mountpoint" and value not in ("none", "legacy"):
+                        value = value.rstrip("/") + dataset.name[len(current.name):]
+                    return value, f"inherited from {current.name}"
+                current = self._parent(current)
+
+        if prop == "mountpoint":
+            return f"/{dataset.name}", "default"
+
+        return definition.default, "default"
+
+    def _used_by(self, dataset: _Dataset) -> int:
+        return dataset.used
+
+    def _own_used(self, dataset: _Dataset) -> int:
+        """
+        Space used by dataset without its descendants
+        """
+        if dataset.type == "snapshot":
+            return 0
+        return dataset.referenced + self._refreservation_used(dataset)
+
+    def _refreservation_used(self, dataset: _Dataset) -> int:
+        return max(0, dataset.properties.get("refreservation", 0) - dataset.referenced)
+
+    def _available(self, dataset: _Dataset) -> int:
+        pool = self._pools[dataset.name.split("/")[0]]
+        available = max(0, pool.size - self._used_by(self._datasets[pool.name]))
+
+        current = dataset
+        while current is not None:
+            quota = current.properties.get("quota", 0)
+            if quota:
+                available = min(available, max(0, quota - self._used_by(current)))
+            current = self._parent(current)
+
+        return available
+
+    def _readonly(self, dataset: _Dataset, prop: str):
+        if prop == "type":
+            return dataset.type
+        if prop == "creation":
+            return dataset.creation
+        if prop in ("used", "logicalused"):
+            return self._used_by(dataset)
+        if prop == "available":
+            return self._available(dataset)
+        if prop in ("referenced", "logicalreferenced", "written", "usedbydataset"):
+            return dataset.referenced
+        if prop in ("compressratio", "refcompressratio"):
+            return 1.0
+        if prop == "mounted":
+            return "yes" if dataset.mounted else "no"
+        if prop == "origin":
+            return dataset.origin
+        if prop == "createtxg":
+            return dataset.createtxg
+        if prop == "guid":
+            return dataset.guid
+        if prop == "usedbysnapshots":
+            return 0
+        if prop == "usedbychildren":
+            return dataset.used - self._own_used(dataset)
+        if prop == "usedbyrefreservation":
+            return self._refreservation_used(dataset)
+        if prop == "clones":
+            return ",".join(dataset.clones)
+        if prop == "defer_destroy":
+            return "on" if dataset.deferred else "off"
+        if prop == "userrefs":
+            return 0
+        return None
+
+    def _format_value(self, dataset: _Dataset, prop: str, parsable: bool) -> str:
+        value, _ = self._value(dataset, prop)
+
+        if _user_property(prop):
+            return value if value is not None else "-"
+
+        return _format(ZFS_PROPERTIES[prop], prop, value, parsable)
+
+    def _properties(self, assignments: Iterable[str], dataset_type: str,
+                    creating: bool) -> dict:
+        """
+        Parse property=value assignments for a dataset type, raises
+        _Invalid if one cannot be set
+        """
+        properties = {}
+
+        for assignment in assignments:
+            prop, equals, value = assignment.partition("=")
+
+            if not equals:
+                raise _usage("missing '=' for property=value argument")
+
+            if not _valid_property(prop):
+                raise _Invalid(f"invalid property '{prop}'")
+
+            prop = _canonical(prop)
+
+            if not _user_property(prop):
+                definition = ZFS_PROPERTIES[prop]
+
+                if definition.access == "readonly" or \
+                        (definition.access == "setonce" and not creating):
+                    raise _Invalid(f"'{prop}' is readonly")
+
+                if dataset_type[0] not in definition.types:
+                    if dataset_type == "snapshot":
+                        raise _Invalid("this property can not be modified for snapshots")
+                    raise _Invalid(f"'{prop}' does not apply to datasets of this type")
+
+            properties[prop] = _parse_value(prop, value)
+
+        return properties
+
+    def _mountable(self, dataset: _Dataset) -> bool:
+        return dataset.type == "filesystem" and \
+            self._value(dataset, "canmount")[0] == "on" and \
+            self._value(dataset, "mountpoint")[0] not in ("none", "legacy")
+
+    def _remount(self, dataset: _Dataset):
+        """
+        Unmount filesystems below dataset which can no longer be mounted
+        """
+        for current in self._walk(dataset, snapshots=False):
+            if current.mounted and (
+                    self._value(current, "mountpoint")[0] in ("none", "legacy") or
+                    self._value(current, "canmount")[0] == "off"):
+                current.mounted = False
+
+    """
+    Listing
+    """
+
+    def _select(self, targets: List[str], types: Iterable[str], recursive: bool,
+                depth: Optional[int], named_types: Iterable[str] = None
+                ) -> Tuple[List[_Dataset], List[str]]:
+        """
+        Datasets of types named by targets, or below them if recursive, in
+        default order, with an error message for each target not found.
+        Without targets every pool is listed recursively.
+        """
+        named_types = named_types if named_types is not None else types
+        selected = {}
+        errors = []
+        snapshots = "snapshot" in types
+
+        if not targets:
+            for pool in self._pools:
+                for dataset in self._walk(self._datasets[pool], depth, snapshots):
+                    if dataset.type in types:
+                        selected[dataset.name] = dataset
+
+        for target in targets:
+            dataset = self._datasets.get(target)
+
+            if dataset is None:
+                errors.append(f"cannot open '{target}': dataset does not exist")
+            elif recursive:
+                for current in self._walk(dataset, depth, snapshots):
+                    if current.type in types:
+                        selected[current.name] = current
+            elif dataset.type in named_types:
+                selected[dataset.name] = dataset
+            else:
+                errors.append(f"cannot open '{target}': operation not applicable to datasets "
+                              f"of this type")
+
+        return sorted(selected.values(), key=_default_order), errors
+
+    def _sort(self, datasets: List[_Dataset], keys: List[Tuple[str, bool]]) -> List[_Dataset]:
+        for prop, descending in reversed(keys):
+            def key(dataset, prop=prop):
+                if prop == "name":
+                    return 1, dataset.name
+                value = self._value(dataset, prop)[0]
+                return (0, 0) if value is None else (1, value)
+
+            datasets.sort(key=key, reverse=descending)
+
+        return datasets
+
+    @staticmethod
+    def _parse_types(value: Optional[str], default: Iterable[str]) -> frozenset:
+        if value is None:
+            return frozenset(default)
+
+        types = set()
+        for name in value.split(","):
+            if name == "all":
+                types.update(_ALL_TYPES)
+            elif name in _TYPES:
+                types.add(_TYPES[name])
+            else:
+                raise _usage(f"invalid type '{name}'")
+
+        return frozenset(types)
+
+    @staticmethod
+    def _parse_depth(options: dict) -> Tuple[bool, Optional[int]]:
+        if "-d" not in options:
+            return "-r" in options, None
+
+        try:
+            depth = int(options["-d"])
+        except ValueError:
+            depth = -1
+
+        if depth < 0:
+            raise _usage(f"invalid depth '{options['-d']}'")
+
+        return True, depth
+
+    @staticmethod
+    def _json_document(command: str, collection: str, entries: dict) -> str:
+        return json.dumps({"output_version": {"command": command,
+                                              "vers_major": 0, "vers_minor": 1},
+                           collection: entries}) + "\n"
+
+    def _json_entry(self, dataset: _Dataset, json_int: bool) -> dict:
+        pool = dataset.name.split("/")[0].split("@")[0]
+        entry = {"name": dataset.name,
+                 "type": dataset.type.upper(),
+                 "pool": pool,
+                 "createtxg": dataset.createtxg if json_int else str(dataset.createtxg)}
+
+        if dataset.type == "snapshot":
+            entry["dataset"], entry["snapshot_name"] = dataset.name.split("@", 1)
+
+        return entry
+
+    def _json_property(self, dataset: _Dataset, prop: str, parsable: bool,
+                       json_int: bool) -> dict:
+        value, source = self._value(dataset, prop)
+
+        if _user_property(prop):
+            value = value if value is not None else "-"
+        else:
+            value = _json_value(ZFS_PROPERTIES[prop], prop, value, parsable, json_int)
+
+        return {"value": value, "source": _json_source(source)}
+
+    """
+    zfs commands
+    """
+
+    def _zfs_version(self, args: List[str]) -> str:
+        return f"zfs-{self.version}-1\nzfs-kmod-{self.version}-1\n"
+
+    def _zfs_list(self, args: List[str]) -> str:
+        options, targets = _options(args, "rHpd:o:t:s:S:j", ["json", "json-int"])
+
+        recursive, depth = self._parse_depth(options)
+        parsable = "-p" in options or "--json-int" in options
+        columns = ",".join(options["-o"]).split(",") if "-o" in options else \
+            ["name", "used", "available", "referenced", "mountpoint"]
+
+        for column in columns:
+            if column != "name" and not _valid_property(column):
+                raise _usage(f"invalid property '{column}'")
+
+        sort_keys = [(p, o == "-S") for o in ("-s", "-S") for p in options.get(o, [])]
+        for prop, _ in sort_keys:
+            if prop != "name" and not _valid_property(prop):
+                raise _usage(f"invalid property '{prop}' for -s or -S")
+        sort_keys = [(_canonical(p), d) for p, d in sort_keys]
+
+        types = self._parse_types(options.get("-t"), ["filesystem", "volume"])
+        named_types = types if "-t" in options else types | {"snapshot"}
+
+        # Snapshots of a filesystem are listed by 'zfs list -t snapshot filesystem'
+        if types == {"snapshot"} and targets and not recursive:
+            recursive, depth = True, 1
+
+        datasets, errors = self._select(targets, types, recursive, depth, named_types)
+        datasets = self._sort(datasets, sort_keys)
+        canonical = [_canonical(c) for c in columns]
+
+        if "-j" in options or "--json" in options:
+            entries = collections.OrderedDict()
+            for dataset in datasets:
+                entry = self._json_entry(dataset, "--json-int" in options)
+                entry["properties"] = collections.OrderedDict(
+                    (prop, self._json_property(dataset, prop, parsable, "--json-int" in options))
+                    for prop in canonical if prop != "name")
+                entries[dataset.name] = entry
+            stdout = self._json_document("zfs list", "datasets", entries)
+        else:
+            rows = [[dataset.name if prop == "name" else
+                     self._format_value(dataset, prop, parsable) for prop in canonical]
+                    for dataset in datasets]
+            right = [i for i, prop in enumerate(canonical)
+                     if prop in ZFS_PROPERTIES and ZFS_PROPERTIES[prop].kind in ("size", "number")]
+            header = [_LIST_HEADERS.get(prop, column.upper())
+                      for column, prop in zip(columns, canonical)]
+            stdout = _table(header, rows, "-H" in options, right)
+
+        if errors:
+            raise _Failure("\n".join(errors), stdout=stdout)
+
+        return stdout
+
+    def _all_properties(self, dataset: _Dataset) -> List[str]:
+        """
+        Properties shown by 'zfs get all' for dataset, native then user
+        """
+        native = [prop for prop, definition in ZFS_PROPERTIES.items()
+                  if dataset.type[0] in definition.types]
+
+        user = set()
+        current = dataset
+        while current is not None:
+            user.update(p for p in current.properties if _user_property(p))
+            current = self._parent(current)
+
+        return native + sorted(user)
+
+    def _zfs_get(self, args: List[str]) -> str:
+        options, args = _options(args, "rHpd:o:t:s:j", ["json", "json-int"])
+
+        if not args:
+            raise _usage("missing property argument")
+
+        property_list, targets = args[0], args[1:]
+        properties = None if property_list == "all" else property_list.split(",")
+
+        for prop in properties or []:
+            if not _valid_property(prop):
+                raise _usage(f"bad property list: invalid property '{prop}'")
+
+        columns = ["name", "property", "value", "source"]
+        if "-o" in options:
+            columns = ",".join(options["-o"]).split(",")
+            if "all" in columns:
+                columns = list(_GET_COLUMNS)
+            for column in columns:
+                if column not in _GET_COLUMNS:
+                    raise _usage(f"invalid column name '{column}'")
+
+        sources = None
+        if "-s" in options:
+            sources = set(",".join(options["-s"]).split(","))
+            for source in sources:
+                if source not in _SOURCES:
+                    raise _usage(f"invalid source '{source}'")
+
+        recursive, depth = self._parse_depth(options)
+        parsable = "-p" in options or "--json-int" in options
+        json_int = "--json-int" in options
+        types = self._parse_types(options.get("-t"), _ALL_TYPES)
+
+        datasets, errors = self._select(targets, types, recursive, depth)
+
+        entries = collections.OrderedDict()
+        rows = []
+        for dataset in datasets:
+            entry_properties = collections.OrderedDict()
+
+            for prop in (properties if properties is not None
+                         else self._all_properties(dataset)):
+                prop = _canonical(prop)
+                value, source = self._value(dataset, prop)
+
+                if properties is None and value is None:
+                    continue
+
+                if sources is not None and _source_type(source) not in sources:
+                    continue
+
+                if "-j" in options or "--json" in options:
+                    entry_properties[prop] = self._json_property(dataset, prop, parsable,
+                                                                 json_int)
+                else:
+                    fields = {"name": dataset.name,
+                              "property": prop,
+                              "value": self._format_value(dataset, prop, parsable),
+                              "received": "-",
+                              "source": source}
+                    rows.append([fields[column] for column in columns])
+
+            if entry_properties:
+                entry = self._json_entry(dataset, json_int)
+                entry["properties"] = entry_properties
+                entries[dataset.name] = entry
+
+        if "-j" in options or "--json" in options:
+            stdout = self._json_document("zfs get", "datasets", entries)
+        else:
+            stdout = _table([c.upper() for c in columns], rows, "-H" in options)
+
+        if errors:
+            raise _Failure("\n".join(errors), stdout=stdout)
+
+        return stdout
+
+    def _zfs_create(self, args: List[str]) -> str:
+        options, args = _options(args, "po:V:b:su")
+
+        if len(args) != 1:
+            raise _usage("missing filesystem argument" if not args else "too many arguments")
+
+        name = args[0]
+        dataset_type = "volume" if "-V" in options else "filesystem"
+
+        error = _name_error(name)
+        if error is not None:
+            raise _Failure(f"cannot create '{name}': {error}")
+
+        if dataset_type == "filesystem" and ("-b" in options or "-s" in options):
+            raise _usage("'-s' and '-b' can only be used when creating a volume")
+
+        try:
+            properties = self._properties(options.get("-o", []), dataset_type, creating=True)
+
+            if dataset_type == "volume":
+                if "-b" in options:
+                    properties["volblocksize"] = _parse_value("volblocksize", options["-b"])
+
+                size = _parse_value("volsize", options["-V"])
+                if size % properties.get("volblocksize", 16384):
+                    raise _Invalid("volume size must be a multiple of volume block size")
+
+                properties["volsize"] = size
+                if "-s" not in options:
+                    properties.setdefault("refreservation", size)
+        except _Invalid as e:
+            raise _Failure(f"cannot create '{name}': {e}")
+
+        if "/" not in name:
+            raise _Failure(f"cannot create '{name}': missing dataset name")
+
+        existing = self._datasets.get(name)
+        if existing is not None:
+            if "-p" in options and existing.type == dataset_type:
+                return ""
+            raise _Failure(f"cannot create '{name}': dataset already exists")
+
+        if name.split("/")[0] not in self._pools:
+            raise _Failure(f"cannot create '{name}': no such pool '{name.split('/')[0]}'")
+
+        if "-p" in options:
+            self._create_parents(name)
+        self._check_parent(name)
+
+        dataset = self._new_dataset(name, dataset_type)
+        dataset.properties.update(properties)
+        self._insert(dataset)
+        dataset.mounted = "-u" not in options and self._mountable(dataset)
+
+        return ""
+
+    def _zfs_snapshot(self, args: List[str]) -> str:
+        options, targets = _options(args, "ro:")
+
+        if not targets:
+            raise _usage("missing snapshot argument")
+
+        try:
+            properties = self._properties(options.get("-o", []), "snapshot", creating=True)
+        except _Invalid as e:
+            raise _Failure(f"cannot create snapshot '{targets[0]}': {e}")
+
+        snapshots = collections.OrderedDict()
+        # zfs_ioc_snapshot fails with EXDEV if a dataset is snapshotted twice
+        snapshotted = set()
+        repeated = False
+        for target in targets:
+            error = _name_error(target, snapshot=True)
+            if error is not None:
+                raise _Failure(f"cannot create snapshot '{target}': {error}")
+
+            dataset_name, snapname = target.split("@", 1)
+            dataset = self._open(dataset_name, ["filesystem", "volume"])
+
+            datasets = self._walk(dataset, snapshots=False) if "-r" in options else [dataset]
+            for current in datasets:
+                repeated = repeated or current.name in snapshotted
+                snapshotted.add(current.name)
+                snapshots[f"{current.name}@{snapname}"] = current
+
+        if len({target.split("/")[0].split("@")[0] for target in targets}) > 1:
+            raise _Failure("cannot create snapshots : snapshots must be in the same pool")
+
+        if repeated:
+            raise _Failure("cannot create snapshots : multiple snapshots of same fs not allowed")
+
+        for name in snapshots:
+            if name in self._datasets:
+                raise _Failure(f"cannot create snapshot '{name}': dataset already exists")
+
+        # Snapshots of one command are taken in a single transaction group
+        self._txg += 1
+        for name, dataset in snapshots.items():
+            snapshot = self._new_dataset(name, "snapshot", createtxg=self._txg,
+                                         referenced=dataset.referenced)
+            snapshot.properties.update(properties)
+            self._insert(snapshot)
+
+        return ""
+
+    def _zfs_clone(self, args: List[str]) -> str:
+        options, args = _options(args, "po:")
+
+        if len(args) != 2:
+            raise _usage("missing source or target dataset" if len(args) < 2
+                         else "too many arguments")
+
+        source, target = args
+        snapshot = self._open(source, ["snapshot"])
+        origin = self._datasets[_parent_name(source)]
+
+        error = _name_error(target)
+        if error is not None:
+            raise _Failure(f"cannot create '{target}': {error}")
+
+        try:
+            properties = self._properties(options.get("-o", []), origin.type, creating=True)
+        except _Invalid as e:
+            raise _Failure(f"cannot create '{target}': {e}")
+
+        if target.split("/")[0] != source.split("/")[0].split("@")[0]:
+            raise _Failure(f"cannot create '{target}': source and target pools differ")
+
+        if target in self._datasets:
+            raise _Failure(f"cannot create '{target}': dataset already exists")
+
+        if "-p" in options:
+            self._create_parents(target)
+        self._check_parent(target)
+
+        clone = self._new_dataset(target, origin.type, referenced=snapshot.referenced)
+        for prop in ("volsize", "volblocksize"):
+            if prop in origin.properties:
+                clone.properties[prop] = origin.properties[prop]
+        clone.properties.update(properties)
+        clone.origin = source
+        snapshot.clones = list(snapshot.clones) + [target]
+        self._insert(clone)
+        clone.mounted = self._mountable(clone)
+
+        return ""
+
+    def _zfs_promote(self, args: List[str]) -> str:
+        if len(args) != 1:
+            raise _usage("missing clone filesystem argument" if not args
+                         else "too many arguments")
+
+        clone = self._open(args[0], ["filesystem", "volume"])
+
+        if clone.origin is None:
+            raise _Failure(f"cannot promote '{clone.name}': not a cloned filesystem")
+
+        snapshot = self._datasets[clone.origin]
+        origin = self._datasets[_parent_name(snapshot.name)]
+
+        moved = [name for name in origin.snapshots
+                 if self._datasets[name].createtxg <= snapshot.createtxg]
+        mapping = {name: f"{clone.name}@{name.split('@', 1)[1]}" for name in moved}
+
+        for old, new in mapping.items():
+            if new in self._datasets:
+                raise _Failure(f"cannot promote '{clone.name}': snapshot name "
+                               f"'{old.split('@', 1)[1]}' from origin conflicts with "
+                               f"'{new}' from target")
+
+        self._rename(mapping)
+
+        # The clone takes the place of its origin, which becomes its clone
+        snapshot.clones[snapshot.clones.index(clone.name)] = origin.name
+        clone.origin = origin.origin
+        if clone.origin is not None:
+            ancestor = self._datasets[clone.origin]
+            ancestor.clones[ancestor.clones.index(origin.name)] = clone.name
+        origin.origin = snapshot.name
+
+        return ""
+
+    def _match_snapshots(self, dataset: _Dataset, spec: str) -> List[_Dataset]:
+        """
+        Snapshots of dataset named by a list such as 'a,b%d', where b%d is
+        b to d inclusive, oldest first
+        """
+        snapshots = list(dataset.snapshots)
+        names = [name.split("@", 1)[1] for name in snapshots]
+        index = {name: i for i, name in enumerate(names)}
+        selected = set()
+
+        for element in spec.split(","):
+            if "%" in element:
+                first, _, last = element.partition("%")
+                start = index.get(first) if first else 0
+                end = index.get(last) if last else len(names) - 1
+                if start is not None and end is not None:
+                    selected.update(range(start, end + 1))
+            elif element in index:
+                selected.add(index[element])
+
+        return [self._datasets[snapshots[i]] for i in sorted(selected)]
+
+    def _zfs_destroy(self, args: List[str]) -> str:
+        options, args = _options(args, "rRfnpvd")
+
+        if len(args) != 1:
+            raise _usage("missing dataset argument" if not args else "too many arguments")
+
+        target = args[0]
+        recursive = "-r" in options or "-R" in options
+        clones = "-R" in options
+        deferred = []
+
+        if "@" in target:
+            dataset_name, _, spec = target.partition("@")
+            dataset = self._datasets.get(dataset_name)
+            if dataset is None or dataset.type == "snapshot":
+                raise _Failure("could not find any snapshots to destroy; check snapshot names.")
+
+            datasets = self._walk(dataset, snapshots=False) if "-r" in options else [dataset]
+            snapshots = [s for current in datasets for s in self._match_snapshots(current, spec)]
+
+            if not snapshots:
+                raise _Failure("could not find any snapshots to destroy; check snapshot names.")
+
+            if not clones:
+                for snapshot in snapshots:
+                    if snapshot.clones and "-d" in options:
+                        deferred.append(snapshot)
+                    elif snapshot.clones:
+                        raise _Failure(f"cannot destroy snapshot {snapshot.name}: snapshot has "
+                                       f"dependent clones\nuse '-R' to destroy the following "
+                                       f"datasets:\n" + "\n".join(snapshot.clones))
+                snapshots = [s for s in snapshots if s not in deferred]
+
+            destroyed = self._dependents(snapshots, clones)
+        else:
+            dataset = self._open(target, ["filesystem", "volume"])
+            destroyed = self._dependents([dataset], clones)
+
+            if "/" not in target and not recursive:
+                raise _Failure(f"cannot destroy '{target}': operation does not apply to pools\n"
+                               f"use 'zfs destroy -r {target}' to destroy all datasets in the "
+                               f"pool\nuse 'zpool destroy {target}' to destroy the pool itself")
+
+            if len(destroyed) > 1 and not recursive:
+                raise _Failure(f"cannot destroy '{target}': filesystem has children\n"
+                               f"use '-r' to destroy the following datasets:\n" +
+                               "\n".join(d.name for d in destroyed if d is not dataset))
+
+            names = {d.name for d in destroyed}
+            blocked = [c for d in destroyed for c in d.clones if c not in names]
+            if blocked:
+                raise _Failure(f"cannot destroy '{target}': filesystem has dependent clones\n"
+                               f"use '-R' to destroy the following datasets:\n" +
+                               "\n".join(blocked))
+
+            # The root filesystem of a pool is never destroyed
+            if "/" not in target:
+                destroyed = destroyed[:-1]
+
+        reclaim = sum(d.referenced + self._refreservation_used(d)
+                      for d in destroyed if d.type != "snapshot")
+
+        output = []
+        if "-v" in options or "-p" in options:
+            verb = "would" if "-n" in options else "will"
+            for dataset in destroyed:
+                output.append(f"destroy\t{dataset.name}\n" if "-p" in options
+                              else f"{verb} destroy {dataset.name}\n")
+            output.append(f"reclaim\t{reclaim}\n" if "-p" in options
+                          else f"{verb} reclaim {_nicenum(reclaim)}\n")
+
+        if "-n" not in options:
+            for snapshot in deferred:
+                snapshot.deferred = True
+            self._destroy(destroyed)
+
+        return "".join(output)
+
+    def _zfs_rollback(self, args: List[str]) -> str:
+        options, args = _options(args, "rRf")
+
+        if len(args) != 1:
+            raise _usage("missing dataset argument" if not args else "too many arguments")
+
+        snapshot = self._open(args[0], ["snapshot"])
+        dataset = self._datasets[_parent_name(snapshot.name)]
+
+        newer = [self._datasets[name] for name in dataset.snapshots
+                 if self._datasets[name].createtxg > snapshot.createtxg]
+
+        if newer and "-r" not in options and "-R" not in options:
+            raise _Failure(f"cannot rollback to '{snapshot.name}': more recent snapshots or "
+                           f"bookmarks exist\nuse '-r' to force deletion of the following "
+                           f"snapshots and bookmarks:\n" + "\n".join(s.name for s in newer))
+
+        destroyed = self._dependents(newer, "-R" in options)
+
+        blocked = [c for s in newer for c in s.clones if "-R" not in options]
+        if blocked:
+            raise _Failure(f"cannot rollback to '{snapshot.name}': clones of previous "
+                           f"snapshots exist\nuse '-R' to force deletion of the following "
+                           f"clones and dependents:\n" + "\n".join(blocked))
+
+        self._destroy(destroyed)
+
+        before = self._own_used(dataset)
+        dataset.referenced = snapshot.referenced
+        self._charge(dataset, self._own_used(dataset) - before)
+
+        return ""
+
+    def _zfs_rename(self, args: List[str]) -> str:
+        options, args = _options(args, "fpur")
+
+        if len(args) != 2:
+            raise _usage("missing source or target dataset" if len(args) < 2
+                         else "too many arguments")
+
+        source, target = args
+        dataset = self._open(source)
+
+        if dataset.type == "snapshot":
+            dataset_name, _, old = source.partition("@")
+            if target.startswith("@"):
+                target = dataset_name + target
+
+            target_dataset, _, new = target.partition("@")
+            if target_dataset != dataset_name:
+                raise _Failure(f"cannot rename to '{target}': snapshots must be part of "
+                               f"same dataset")
+
+            error = _name_error(target, snapshot=True)
+            if error is not None:
+                raise _Failure(f"cannot rename to '{target}': {error}")
+
+            parent = self._datasets[dataset_name]
+            datasets = self._walk(parent, snapshots=False) if "-r" in options else [parent]
+            mapping = {f"{d.name}@{old}": f"{d.name}@{new}" for d in datasets
+                       if f"{d.name}@{old}" in self._datasets}
+        else:
+            if "-r" in options:
+                raise _usage("-r can only be used on snapshots")
+
+            error = _name_error(target)
+            if error is not None:
+                raise _Failure(f"cannot rename to '{target}': {error}")
+
+            if "/" not in source:
+                raise _Failure(f"cannot rename '{source}': operation not applicable to pools")
+
+            if target.split("/")[0] != source.split("/")[0]:
+                raise _Failure(f"cannot rename to '{target}': datasets must be within same pool")
+
+            if target.startswith(source + "/"):
+                raise _Failure(f"cannot rename to '{target}': New dataset name cannot be a "
+                               f"descendant of current dataset name")
+
+            mapping = {d.name: target + d.name[len(source):]
+                       for d in self._dependents([dataset], clones=False)}
+
+        for new in mapping.values():
+            if new in self._datasets:
+                raise _Failure(f"cannot rename to '{target}': dataset already exists")
+
+        if dataset.type != "snapshot":
+            if "-p" in options:
+                self._create_parents(target)
+            if _parent_name(target) not in self._datasets:
+                raise _Failure(f"cannot rename to '{target}': parent does not exist")
+            if self._datasets[_parent_name(target)].type != "filesystem":
+                raise _Failure(f"cannot rename to '{target}': parent is not a filesystem")
+
+        self._rename(mapping)
+
+        return ""
+
+    def _zfs_set(self, args: List[str]) -> str:
+        options, args = _options(args, "u")
+
+        count = 0
+        while count < len(args) and "=" in args[count]:
+            count += 1
+        assignments, targets = args[:count], args[count:]
+
+        if not assignments:
+            raise _usage("missing property=value argument(s)")
+
+        if not targets:
+            raise _usage("missing dataset name(s)")
+
+        errors = []
+        for target in targets:
+            dataset = self._datasets.get(target)
+            if dataset is None:
+                errors.append(f"cannot open '{target}': dataset does not exist")
+                continue
+
+            try:
+                properties = self._properties(assignments, dataset.type, creating=False)
+            except _Invalid as e:
+                errors.append(f"cannot set property for '{target}': {e}")
+                continue
+
+            # A reservation equal to the volume size follows it
+            if "volsize" in properties and \
+                    dataset.properties.get("refreservation") == dataset.properties["volsize"]:
+                properties.setdefault("refreservation", properties["volsize"])
+
+            before = self._own_used(dataset)
+            dataset.properties.update(properties)
+            self._charge(dataset, self._own_used(dataset) - before)
+
+            if "mountpoint" in properties or "canmount" in properties:
+                self._remount(dataset)
+
+        if errors:
+            raise _Failure("\n".join(errors))
+
+        return ""
+
+    def _zfs_inherit(self, args: List[str]) -> str:
+        options, args = _options(args, "rS")
+
+        if len(args) < 2:
+            raise _usage("missing property argument" if not args else "missing dataset argument")
+
+        prop, targets = args[0], args[1:]
+
+        if not _valid_property(prop):
+            raise _usage(f"invalid property '{prop}'")
+
+        prop = _canonical(prop)
+
+        if not _user_property(prop):
+            definition = ZFS_PROPERTIES[prop]
+
+            if definition.access != "set":
+                raise _Failure(f"'{prop}' property is read-only")
+
+            if not definition.inherit:
+                raise _Failure(f"'{prop}' property cannot be inherited\n"
+                               f"use 'zfs set {prop}=none' to clear")
+
+        for target in targets:
+            dataset = self._open(target)
+
+            datasets = self._walk(dataset) if "-r" in options else [dataset]
+            for current in datasets:
+                current.properties.pop(prop, None)
+
+            if prop == "mountpoint":
+                self._remount(dataset)
+
+        return ""
+
+    def _zfs_upgrade(self, args: List[str]) -> str:
+        options, targets = _options(args, "arvV:")
+
+        if not targets and "-a" not in options:
+            if "-v" in options:
+                return _UPGRADE_VERSIONS
+
+            outdated = [d.name for d in sorted(self._datasets.values(), key=_default_order)
+                        if d.type == "filesystem" and self._value(d, "version")[0] < 5]
+
+            if not outdated:
+                return "This system is currently running ZFS filesystem version 5.\n\n" \
+                       "All filesystems are formatted with the current version.\n"
+
+            return "This system is currently running ZFS filesystem version 5.\n\n" \
+                   "The following filesystems are out of date, and can be upgraded.  After " \
+                   "being\nupgraded, these filesystems (and any 'zfs send' streams " \
+                   "generated from\nsubsequent snapshots) will no longer be accessible by " \
+                   "older software versions.\n\n\nVER  FILESYSTEM\n---  ------------\n" + \
+                   "".join(f" {self._value(self._datasets[n], 'version')[0]}   {n}\n"
+                           for n in outdated)
+
+        try:
+            version = int(options.get("-V", 5))
+        except ValueError:
+            version = 0
+
+        if not 1 <= version <= 5:
+            raise _Failure(f"invalid version '{options['-V']}'")
+
+        if "-a" in options:
+            datasets = [d for d in self._datasets.values() if d.type == "filesystem"]
+        else:
+            datasets = []
+            for target in targets:
+                dataset = self._open(target, ["filesystem"])
+                datasets.extend(d for d in (self._walk(dataset, snapshots=False)
+                                            if "-r" in options else [dataset])
+                                if d.type == "filesystem")
+
+        upgraded = 0
+        current = 0
+        for dataset in datasets:
+            existing = self._value(dataset, "version")[0]
+            if existing > version:
+                raise _Failure(f"cannot downgrade '{dataset.name}'; use 'zfs upgrade -v' to "
+                               f"list supported versions")
+            if existing == version:
+                current += 1
+            else:
+                dataset.properties["version"] = version
+                upgraded += 1
+
+        output = f"{upgraded} filesystems upgraded\n"
+        if current:
+            output += f"{current} filesystems already at this version\n"
+
+        return output
+
+    def _zfs_mount(self, args: List[str]) -> str:
+        options, args = _options(args, "vOo:afl")
+
+        if "-a" in options:
+            for dataset in self._datasets.values():
+                if not dataset.mounted and self._mountable(dataset):
+                    dataset.mounted = True
+            return ""
+
+        if not args:
+            mounted = sorted((d for d in self._datasets.values() if d.mounted),
+                             key=_default_order)
+            return "".join(f"{d.name:<30}  {self._value(d, 'mountpoint')[0]}\n"
+                           for d in mounted)
+
+        if len(args) > 1:
+            raise _usage("too many arguments")
+
+        dataset = self._open(args[0], ["filesystem"])
+        mountpoint = self._value(dataset, "mountpoint")[0]
+
+        if self._value(dataset, "canmount")[0] == "off":
+            raise _Failure(f"cannot mount '{dataset.name}': 'canmount' property is set to 'off'")
+
+        if mountpoint == "legacy":
+            raise _Failure(f"cannot mount '{dataset.name}': legacy mountpoint\n"
+                           f"use mount(8) to mount this filesystem")
+
+        if mountpoint == "none":
+            raise _Failure(f"cannot mount '{dataset.name}': no mountpoint set")
+
+        if dataset.mounted:
+            raise _Failure(f"cannot mount '{dataset.name}': filesystem already mounted")
+
+        dataset.mounted = True
+
+        return ""
+
+    def _zfs_unmount(self, args: List[str]) -> str:
+        options, args = _options(args, "fau")
+
+        if "-a" in options:
+            for dataset in self._datasets.values():
+                dataset.mounted = False
+            return ""
+
+        if len(args) != 1:
+            raise _usage("missing filesystem argument" if not args else "too many arguments")
+
+        target = args[0]
+
+        if target.startswith("/"):
+            dataset = next((d for d in self._datasets.values()
+                            if d.mounted and self._value(d, "mountpoint")[0] == target), None)
+            if dataset is None:
+                raise _Failure(f"cannot unmount '{target}': not a mountpoint")
+        else:
+            dataset = self._open(target, ["filesystem"])
+
+        if not dataset.mounted:
+            raise _Failure(f"cannot unmount '{target}': not currently mounted")
+
+        dataset.mounted = False
+
+        return ""
+
+    """
+    zpool commands
+    """
+
+    def _pool_value(self, pool: _Pool, prop: str) -> Tuple[object, str]:
+        definition = ZPOOL_PROPERTIES[prop]
+
+        if definition.access == "readonly":
+            allocated = self._used_by(self._datasets[pool.name])
+            values = {
+                "size": pool.size, "capacity": allocated * 100 // pool.size,
+                "health": "ONLINE", "guid": pool.guid, "dedupratio": 1.0,
+                "free": pool.size - allocated, "allocated": allocated, "readonly": "off",
+                "freeing": 0, "fragmentation": 0, "leaked": 0, "load_guid": pool.guid ^ 1,
+            }
+            return values.get(prop), "-"
+
+        if prop in pool.properties:
+            return pool.properties[prop], "local"
+
+        return definition.default, "default"
+
+    def _zpool_get(self, args: List[str]) -> str:
+        options, args = _options(args, "Hpo:j", ["json", "json-int"])
+
+        if not args:
+            raise _usage("missing property argument")
+
+        properties = list(ZPOOL_PROPERTIES) if args[0] == "all" else args[0].split(",")
+        for prop in properties:
+            if prop not in ZPOOL_PROPERTIES:
+                raise _usage(f"bad property list: invalid property '{prop}'")
+
+        columns = ["name", "property", "value", "source"]
+        if "-o" in options:
+            columns = ",".join(options["-o"]).split(",")
+            if "all" in columns:
+                columns = ["name", "property", "value", "source"]
+            for column in columns:
+                if column not in ("name", "property", "value", "source"):
+                    raise _usage(f"invalid column name '{column}'")
+
+        pools = []
+        for name in args[1:] or list(self._pools):
+            if name not in self._pools:
+                raise _Failure(f"cannot open '{name}': no such pool")
+            pools.append(self._pools[name])
+
+        parsable = "-p" in options or "--json-int" in options
+        json_int = "--json-int" in options
+
+        if "-j" in options or "--json" in options:
+            entries = collections.OrderedDict()
+            for pool in pools:
+                entry = {"name": pool.name, "type": "POOL", "state": "ONLINE",
+                         "pool_guid": pool.guid if json_int else str(pool.guid),
+                         "properties": collections.OrderedDict()}
+                for prop in properties:
+                    value, source = self._pool_value(pool, prop)
+                    entry["properties"][prop] = {
+                        "value": _json_value(ZPOOL_PROPERTIES[prop], prop, value, parsable,
+                                             json_int),
+                        "source": _json_source(source)}
+                entries[pool.name] = entry
+            return self._json_document("zpool get", "pools", entries)
+
+        rows = []
+        for pool in pools:
+            for prop in properties:
+                value, source = self._pool_value(pool, prop)
+                fields = {"name": pool.name, "property": prop, "source": source,
+                          "value": _format(ZPOOL_PROPERTIES[prop], prop, value, parsable)}
+                rows.append([fields[column] for column in columns])
+
+        return _table([c.upper() for c in columns], rows, "-H" in options)
+
+    def _zpool_set(self, args: List[str]) -> str:
+        options, args = _options(args, "")
+
+        if len(args) != 2:
+            raise _usage("missing property=value argument" if not args
+                         else "missing pool name" if len(args) < 2 else "too many pool names")
+
+        assignment, name = args
+        prop, equals, value = assignment.partition("=")
+
+        if not equals:
+            raise _usage("missing '=' for property=value argument")
+
+        if name not in self._pools:
+            raise _Failure(f"cannot open '{name}': no such pool")
+
+        pool = self._pools[name]
+
+        if prop not in ZPOOL_PROPERTIES:
+            raise _Failure(f"cannot set property for '{name}': invalid property '{prop}'")
+
+        definition = ZPOOL_PROPERTIES[prop]
+
+        if definition.access != "set":
+            raise _Failure(f"cannot set property for '{name}': property '{prop}' is readonly")
+
+        if isinstance(definition.kind, tuple) and value not in definition.kind:
+            raise _Failure(f"cannot set property for '{name}': property '{prop}' must be one "
+                           f"of '{' | '.join(definition.kind)}'")
+
+        if prop == "bootfs" and value:
+            dataset = self._datasets.get(value)
+            if dataset is None or dataset.type != "filesystem" or \
+                    value.split("/")[0] != name:
+                raise _Failure(f"cannot set property for '{name}': '{value}' is an invalid "
+                               f"name")
+
+        if prop == "comment" and len(value) > 32:
+            raise _Failure(f"cannot set property for '{name}': comment is too long")
+
+        if value == "" and prop in ("bootfs", "comment", "cachefile"):
+            pool.properties.pop(prop, None)
+        else:
+            pool.properties[prop] = value
+
+        return ""
@@ -1,24 +1,70 @@
-import platform
+"""
+Platform specific functions, bound to the implementation for the running
+system on first use rather than at import
+"""
+
+import importlib
+import sys
+
+_system_module = None
 
 
 def check_valid_system():
     valid_platforms = ['linux', 'freebsd']
-    current_system = platform.system().lower()
+    current_system = sys.platform.rstrip("0123456789")
 
     return current_system if current_system in valid_platforms else None
 
 
-system = check_valid_system()
-
-if system == "linux":
-    import pyzfscmds.system.linux
-    mountpoint_dataset = pyzfscmds.system.linux.mountpoint_dataset
-    zfs_module_loaded = pyzfscmds.system.linux.zfs_module_loaded
-    dataset_mountpoint = pyzfscmds.system.linux.dataset_mountpoint
-elif system == "freebsd":
-    import pyzfscmds.system.freebsd
-    mountpoint_dataset = pyzfscmds.system.freebsd.mountpoint_dataset
-    zfs_module_loaded = pyzfscmds.system.freebsd.zfs_module_loaded
-    dataset_mountpoint = pyzfscmds.system.freebsd.dataset_mountpoint
-else:
-    raise SystemError("System not supported by pyzfscmds")
+def _system():
+    """
+    Module for the running system, raises SystemError if unsupported
+    """
+    global _system_module
+
+    if _system_module is None:
+        system = check_valid_system()
+
+        if system is None:
+            raise SystemError("System not supported by pyzfscmds")
+
+        _system_module = importlib.import_module(f"pyzfscmds.system.{system}")
+
+    return _system_module
+
+
+def __getattr__(name: str):
+    """
+    system, the name of the running system such as 'linux', is resolved on
+    first access. Raises SystemError if the system is unsupported.
+    """
+    if name == "system":
+        return _system().__name__.rsplit(".", 1)[-1]
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def mountpoint_dataset(mountpoint: str):
+    """
+    Check if dataset is a 'zfs' mount.
+    return dataset, or None if not found
+    """
+    return _system().mountpoint_dataset(mountpoint)
+
+
+def dataset_mountpoint(dataset: str):
+    """
+    Get dataset mountpoint, or None if not found
+    """
+    return _system().dataset_mountpoint(dataset)
+
+
+def dataset_mountpoints(datasets: list) -> dict:
+    """
+    Get the mountpoint of every dataset, or None if not found
+    """
+    return _system().dataset_mountpoints(datasets)
+
+
+def zfs_module_loaded():
+    return _system().zfs_module_loaded()
@@ -1,5 +1,6 @@
 import subprocess
-import re
+
+from typing import Dict, Iterable, List, Optional, Tuple
 
 
 def _mount_list():
@@ -12,49 +13,62 @@ def _mount_list():
     return mount.splitlines()
 
 
-def mountpoint_dataset(mountpoint: str):
+def parse_mounts(lines: Iterable[str]) -> Tuple[Dict[str, str], Dict[str, str]]:
     """
-    Check if dataset at mountpoint is a 'zfs' mount.
-    return dataset, or None if not found
+    Parse 'mount -p' lines into dicts of zfs dataset to mountpoint and
+    mountpoint to dataset. The first mount of a dataset or mountpoint wins.
     """
-    try:
-        mount_list = _mount_list()
-    except subprocess.CalledProcessError:
-        raise RuntimeError(f"Failed to get mount data")
+    datasets = {}
+    mountpoints = {}
 
-    target = re.compile(r'\b\w+\s+' + mountpoint + r'\s+zfs\b')
+    for line in lines:
+        fields = line.split()
 
-    dataset = next((ds for ds in mount_list if target.search(ds)), None)
+        # Type, options, dump and pass close each line, anything between
+        # the device and them is a mountpoint which may contain spaces
+        if len(fields) < 6 or fields[-4] != "zfs":
+            continue
 
-    return dataset.split()[0] if dataset is not None else None
+        dataset = fields[0]
+        mountpoint = " ".join(fields[1:-4])
 
+        datasets.setdefault(dataset, mountpoint)
+        mountpoints.setdefault(mountpoint, dataset)
+
+    return datasets, mountpoints
 
-def dataset_mountpoint(dataset: str):
-    """
-    Get dataset mountpoint, or None if not found
-    """
 
+def _mounts() -> Tuple[Dict[str, str], Dict[str, str]]:
     try:
         mount_list = _mount_list()
     except subprocess.CalledProcessError:
         raise RuntimeError(f"Failed to get mount data")
 
-    target = re.compile(r'\b' + dataset + r'\s+/.*\s+zfs\b')
+    return parse_mounts(mount_list)
 
-    mount = next((ds for ds in mount_list if target.search(ds)), None)
 
-    if mount is None:
-        return None
+def mountpoint_dataset(mountpoint: str):
+    """
+    Check if dataset at mountpoint is a 'zfs' mount.
+    return dataset, or None if not found
+    """
+    return _mounts()[1].get(mountpoint)
+
 
-    split_match = mount.split()
+def dataset_mountpoint(dataset: str):
+    """
+    Get dataset mountpoint, or None if not found
+    """
+    return _mounts()[0].get(dataset)
 
-    if split_match[3] == "zfs":
-        # User used a mountpoint with spaces, zfs is at index 3
-        mp = " ".join([split_match[1], split_match[2]])
-    else:
-        mp = split_match[1]
 
-    return mp
+def dataset_mountpoints(datasets: List[str]) -> Dict[str, Optional[str]]:
+    """
+    Get the mountpoint of every dataset, or None if not found, from a
+    single 'mount -p'
+    """
+    mounted = _mounts()[0]
+    return {dataset: mounted.get(dataset) for dataset in datasets}
 
 
 def zfs_module_loaded():
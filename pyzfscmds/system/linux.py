@@ -1,46 +1,131 @@
 import re
+import select
+import sys
+import threading
 
+from typing import Dict, Iterable, List, Optional, Tuple
 
-def mountpoint_dataset(mountpoint: str):
+MOUNTS = "/proc/self/mounts"
+
+_escape = re.compile(r'\\([0-7]{3})')
+
+
+def _unescape(field: str) -> str:
     """
-    Check if dataset is a 'zfs' mount.
-    return dataset, or None if not found
+    Decode the octal escapes the kernel uses for space, tab, newline and
+    backslash in mount table fields
     """
+    if "\\" not in field:
+        return field
 
-    target = re.compile(r'^.*\s+' + mountpoint + r'\s+zfs\b')
+    return _escape.sub(lambda m: chr(int(m.group(1), 8)), field)
 
-    with open("/proc/mounts") as f:
-        mount = next((ds for ds in f.read().splitlines() if target.search(ds)), None)
 
-    return None if mount is None else mount.split()[0]
+def parse_mounts(lines: Iterable[str]) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    Parse /proc/mounts lines into dicts of zfs dataset to mountpoint and
+    mountpoint to dataset. The first mount of a dataset or mountpoint wins.
+    """
+    datasets = {}
+    mountpoints = {}
 
+    for line in lines:
+        fields = line.split()
 
-def dataset_mountpoint(dataset: str):
+        if len(fields) < 3 or fields[2] != "zfs":
+            continue
+
+        dataset = _unescape(fields[0])
+        mountpoint = _unescape(fields[1])
+
+        datasets.setdefault(dataset, mountpoint)
+        mountpoints.setdefault(mountpoint, dataset)
+
+    return datasets, mountpoints
+
+
+class MountTable:
     """
-    Get dataset mountpoint, or None if not found
+    Parsed zfs mounts, kept open and only parsed again after the kernel
+    signals a change to the mount table with POLLPRI.
     """
 
-    target = re.compile(r'^' + dataset + r'\s/.*\szfs\b')
+    def __init__(self, path: str = MOUNTS):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+        self._poll = None
+        self._parsed = ({}, {})
+
+    def _stale(self) -> bool:
+        if self._file is None:
+            self._file = open(self.path, encoding=sys.getfilesystemencoding(),
+                              errors="surrogateescape")
+            self._poll = select.poll()
+            self._poll.register(self._file, select.POLLPRI | select.POLLERR)
+            return True
+
+        return bool(self._poll.poll(0))
+
+    def refresh(self):
+        """
+        Parse the mount table now, reading it also clears a pending change
+        """
+        with self._lock:
+            if self._file is None:
+                self._stale()
+
+            self._parse()
+
+    def _parse(self):
+        """
+        Read the open mount table, the caller holds the lock
+        """
+        self._file.seek(0)
+        self._parsed = parse_mounts(self._file.read().splitlines())
 
-    with open("/proc/mounts") as f:
-        mount = next((ds for ds in f.read().splitlines() if target.search(ds)), None)
+    def _tables(self) -> Tuple[Dict[str, str], Dict[str, str]]:
+        # Poll and parse under one lock, a change signalled in between is not lost
+        with self._lock:
+            if self._stale():
+                self._parse()
 
-    if mount is None:
-        return None
+            return self._parsed
 
-    split_match = mount.split()
+    def dataset_mountpoint(self, dataset: str) -> Optional[str]:
+        return self._tables()[0].get(dataset)
 
-    if split_match[3] == "zfs":
-        # User used a mountpoint with spaces, zfs is at index 3
-        mountpoint = " ".join([split_match[1], split_match[2]])
-    else:
-        # Space is in ASCII code, decode it
-        if "\\" in split_match[1]:
-            mountpoint = bytes(split_match[1], 'ascii').decode('unicode_escape')
-        else:
-            mountpoint = split_match[1]
+    def mountpoint_dataset(self, mountpoint: str) -> Optional[str]:
+        return self._tables()[1].get(mountpoint)
 
-    return mountpoint
+    def dataset_mountpoints(self, datasets: List[str]) -> Dict[str, Optional[str]]:
+        mounted = self._tables()[0]
+        return {dataset: mounted.get(dataset) for dataset in datasets}
+
+
+_mount_table = MountTable()
+
+
+def mountpoint_dataset(mountpoint: str):
+    """
+    Check if dataset is a 'zfs' mount.
+    return dataset, or None if not found
+    """
+    return _mount_table.mountpoint_dataset(mountpoint)
+
+
+def dataset_mountpoint(dataset: str):
+    """
+    Get dataset mountpoint, or None if not found
+    """
+    return _mount_table.dataset_mountpoint(dataset)
+
+
+def dataset_mountpoints(datasets: List[str]) -> Dict[str, Optional[str]]:
+    """
+    Get the mountpoint of every dataset, or None if not found
+    """
+    return _mount_table.dataset_mountpoints(datasets)
 
 
 def zfs_module_loaded():
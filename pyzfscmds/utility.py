@@ -1,6 +1,8 @@
 """ZFS library"""
 
-from typing import Optional
+import collections
+
+from typing import Dict, Iterable, List, Optional, Tuple
 
 import pyzfscmds.cmd
 
@@ -25,11 +27,12 @@ def is_clone(dataset: str) -> bool:
     try:
         origin = pyzfscmds.cmd.zfs_get(dataset,
                                        properties=["origin"],
-                                       columns=["value"])
+                                       columns=["value"],
+                                       parsed=True)
     except RuntimeError:
         raise
 
-    if origin.split()[0] == "-":
+    if origin[0].value == "-":
         return False
 
     return True
@@ -88,3 +91,53 @@ def dataset_exists(target: str, zfs_type: str = "filesystem") -> bool:
         return False
 
     return True
+
+
+def _listing_root(names: List[str]) -> Tuple[str, int]:
+    """
+    Deepest dataset containing every name and the depth needed to list
+    all of them from it, names must be in one pool.
+    """
+    paths = [name.split("@", 1)[0].split("#", 1)[0].split("/") for name in names]
+
+    root = paths[0]
+    for path in paths[1:]:
+        common = 0
+        while common < min(len(root), len(path)) and root[common] == path[common]:
+            common += 1
+        root = root[:common]
+
+    # A snapshot or bookmark is one level below its dataset
+    depth = max(len(path) - len(root) + (1 if "@" in name or "#" in name else 0)
+                for name, path in zip(names, paths))
+
+    return "/".join(root), depth
+
+
+def datasets_exist(names: Iterable[str], zfs_type: str = "filesystem") -> Dict[str, bool]:
+    """
+    Check which names exist as zfs_type, with one zfs list per pool rather
+    than one per name. Each pool is listed from the deepest dataset
+    containing all of its names, no deeper than needed.
+    """
+    names = list(names)
+
+    if any(name is None for name in names):
+        raise TypeError
+
+    pools = collections.OrderedDict()
+    for name in names:
+        pools.setdefault(pyzfscmds.cmd._pool_name(name), []).append(name)
+
+    existing = set()
+    for pool_names in pools.values():
+        root, depth = _listing_root(pool_names)
+
+        try:
+            existing.update(row[0] for row in pyzfscmds.cmd.zfs_list_iter(
+                root, depth=depth, columns=["name"], zfs_types=[zfs_type]))
+        except RuntimeError:
+            # The root does not exist, so nothing below it does either
+            continue
+
+    return {name: name in existing for name in names}
@@ -44,6 +44,7 @@ setup(
     extras_require={
         'test': tests_require,
         'dev': dev_require,
+        'numpy': ['numpy'],
     },
     zip_safe=False,
 )
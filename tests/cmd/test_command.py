@@ -0,0 +1,44 @@
+"""_Command execution tests"""
+
+import itertools
+import os
+import subprocess
+
+import pytest
+
+import pyzfscmds.cmd
+
+module_env = os.path.basename(__file__).upper().rsplit('.', 1)[0]
+if module_env in os.environ:
+    pytestmark = pytest.mark.skipif(
+        "false" in os.environ[module_env],
+        reason=f"Environment variable {module_env} specified test should be skipped.")
+
+
+def test_command_run_iter_rows():
+    command = pyzfscmds.cmd._Command("%s\t%s\n", main_command="printf",
+                                     targets=["pool/a", "10", "pool/b", "20"])
+
+    assert list(command.run_iter()) == [["pool/a", "10"], ["pool/b", "20"]]
+
+
+def test_command_run_iter_failure():
+    command = pyzfscmds.cmd._Command("", main_command="false")
+
+    with pytest.raises(subprocess.CalledProcessError):
+        list(command.run_iter())
+
+
+def test_command_run_iter_closed_early():
+    """Closing the generator early must not wait on the whole output"""
+    rows = pyzfscmds.cmd._Command("pool/dataset", main_command="yes").run_iter()
+
+    assert list(itertools.islice(rows, 3)) == [["pool/dataset"]] * 3
+
+    rows.close()
+
+
+def test_command_run_chunks():
+    command = pyzfscmds.cmd._Command("%s", main_command="printf", targets=["x" * 10])
+
+    assert list(command.run_chunks(size=4)) == ["xxxx", "xxxx", "xx"]
@@ -69,3 +69,74 @@ def test_zfs_destroy_dataset_fails(zpool, name):
 
     with pytest.raises((TypeError, RuntimeError)):
         pyzfscmds.cmd.zfs_destroy(f"{zpool}/{name}")
+
+
+@pytest.mark.parametrize("snapnames,expected", [
+    (["s1", "s2", "s3", "s5"], ["s1%s3", "s5"]),
+    (["s3", "s1", "s2"], ["s1%s3"]),
+    (["s1", "s2"], ["s1", "s2"]),
+    (["s1", "s2", "s3", "unknown"], ["s1%s3", "unknown"]),
+])
+def test_snapshot_ranges(snapnames, expected):
+    order = ["s0", "s1", "s2", "s3", "s4", "s5"]
+
+    assert pyzfscmds.cmd._snapshot_ranges(snapnames, order) == expected
+
+
+def test_snapshot_ranges_duplicate_order_fails():
+    with pytest.raises(RuntimeError):
+        pyzfscmds.cmd._snapshot_ranges(["s1", "s2", "s3"], ["s1", "s2", "s1", "s3"])
+
+
+@pytest.mark.parametrize("recursive", [{"recursive_descendents": True},
+                                       {"recursive_clones": True}])
+def test_zfs_destroy_snapshots_commands_recursive_no_ranges(recursive):
+    commands = pyzfscmds.cmd._zfs_destroy_snapshots_commands(
+        "zpool/dataset", ["s1", "s2", "s3"], snapshot_order=["s0", "s1", "s2", "s3"],
+        **recursive)
+
+    assert [c.targets for c in commands] == [["zpool/dataset@s1,s2,s3"]]
+
+
+def test_zfs_destroy_snapshots_commands_chunked():
+    snapnames = [f"zpool/dataset@snapshot-{i}" for i in range(50000)]
+
+    commands = pyzfscmds.cmd._zfs_destroy_snapshots_commands("zpool/dataset", snapnames,
+                                                             dry_run=True)
+
+    assert len(commands) > 1
+    for command in commands:
+        argument = command._prepare_call()[-1]
+        assert argument.startswith("zpool/dataset@snapshot-")
+        assert len(argument) < pyzfscmds.cmd.MAX_ARGUMENT_LENGTH
+    assert sum(c.targets[0].count(",") + 1 for c in commands) == len(snapnames)
+
+
+def test_zfs_destroy_snapshots_other_dataset_fails():
+    with pytest.raises(RuntimeError):
+        pyzfscmds.cmd._zfs_destroy_snapshots_commands("zpool/dataset", ["zpool/other@snap"])
+
+
+def test_zfs_destroy_snapshots_estimate_other_dataset_fails():
+    with pytest.raises(RuntimeError, match="is not of"):
+        pyzfscmds.cmd.zfs_destroy_snapshots_estimate("zpool/dataset", ["zpool/other@snap"])
+
+
+@require_zpool
+@require_unsafe
+@require_test_dataset
+def test_zfs_destroy_snapshots_successful(zpool, test_dataset):
+    dataset = "/".join([zpool, test_dataset])
+    snapnames = [f"pyzfscmds-{datetime.datetime.now().isoformat()}-{i}" for i in range(5)]
+
+    # One call per snapshot, zfs cannot snapshot a dataset twice in one call
+    for snapname in snapnames:
+        pyzfscmds.cmd.zfs_snapshot(dataset, snapname)
+
+    estimate = pyzfscmds.cmd.zfs_destroy_snapshots_estimate(dataset, snapnames)
+    assert len(estimate.destroyed) == len(snapnames)
+    assert set(estimate.used) == {f"{dataset}@{s}" for s in snapnames}
+
+    pyzfscmds.cmd.zfs_destroy_snapshots(dataset, snapnames)
+
+    assert not any(pyzfscmds.utility.is_snapshot(f"{dataset}@{s}") for s in snapnames)
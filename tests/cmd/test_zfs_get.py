@@ -90,3 +90,16 @@ def test_zfs_get_fails(zpool, test_dataset, recursive, depth, scripting,
                               zfs_types=zfs_types,
                               source=source,
                               properties=properties)
+
+
+@pytest.mark.parametrize("parsable", [True, False])
+@pytest.mark.parametrize("properties", [None, ["mountpoint", "canmount"]])
+@require_zpool
+@require_test_dataset
+def test_zfs_get_iter_matches_get(zpool, test_dataset, parsable, properties):
+    target = "/".join([zpool, test_dataset])
+
+    output = pyzfscmds.cmd.zfs_get(target, parsable=parsable, properties=properties)
+    rows = list(pyzfscmds.cmd.zfs_get_iter(target, parsable=parsable, properties=properties))
+
+    assert rows == [line.split("\t") for line in output.splitlines()]
@@ -86,3 +86,58 @@ def test_zfs_list_fails(zpool, test_dataset, recursive, depth, scripting, parsab
                                zfs_types=zfs_types,
                                sort_properties_ascending=sort_properties_ascending,
                                sort_properties_descending=sort_properties_descending)
+
+
+@pytest.mark.parametrize("recursive", [True, False])
+@pytest.mark.parametrize("parsable", [True, False])
+@pytest.mark.parametrize("columns", [None, ["name"], ["name", "used", "mountpoint"]])
+@require_zpool
+@require_test_dataset
+def test_zfs_list_iter_matches_list(zpool, test_dataset, recursive, parsable, columns):
+    target = "/".join([zpool, test_dataset])
+
+    listing = pyzfscmds.cmd.zfs_list(target, recursive=recursive,
+                                     parsable=parsable, columns=columns)
+    rows = list(pyzfscmds.cmd.zfs_list_iter(target, recursive=recursive,
+                                            parsable=parsable, columns=columns))
+
+    assert rows == [line.split("\t") for line in listing.splitlines()]
+
+
+@require_zpool
+def test_zfs_list_iter_fails(zpool):
+    with pytest.raises(RuntimeError):
+        list(pyzfscmds.cmd.zfs_list_iter(f"{zpool}/pyzfscmds/nonexistent"))
+
+
+@require_zpool
+@require_test_dataset
+def test_zfs_list_parsed(zpool, test_dataset):
+    target = "/".join([zpool, test_dataset])
+
+    record, = pyzfscmds.cmd.zfs_list(target, parsable=True, parsed=True,
+                                     columns=["name", "used", "creation", "createtxg"])
+
+    assert record.name == target
+    assert isinstance(record.used, int)
+    assert isinstance(record.createtxg, int)
+
+
+def test_zfs_list_json_command():
+    command = pyzfscmds.cmd._zfs_list_command("zpool", columns=["name", "used"],
+                                              parsable=True, json_output=True)
+
+    assert command._prepare_call() == ["zfs", "list", "-j", "--json-int",
+                                       "-o", "name,used", "zpool"]
+
+
+@require_zpool
+@require_test_dataset
+def test_zfs_list_json_matches_parsed(zpool, test_dataset):
+    target = "/".join([zpool, test_dataset])
+    columns = ["name", "type", "used", "avail", "mountpoint", "createtxg"]
+
+    assert pyzfscmds.cmd.zfs_list(target, recursive=True, columns=columns,
+                                  json_output=True) == \
+        pyzfscmds.cmd.zfs_list(target, recursive=True, columns=columns,
+                               parsable=True, parsed=True)
@@ -42,3 +42,14 @@ def test_zfs_set_successful(set_dataset, prop):
     assert prop[1] in pyzfscmds.cmd.zfs_get(set_dataset,
                                             columns=["value"],
                                             properties=[prop[0]])
+
+
+@require_zpool
+@require_test_dataset
+def test_zfs_set_multiple_diff_successful(set_dataset):
+    pyzfscmds.cmd.zfs_set_multiple([set_dataset], {"canmount": "noauto", "atime": "off"})
+    pyzfscmds.cmd.zfs_set_multiple([set_dataset], {"canmount": "noauto", "atime": "on"},
+                                   diff=True)
+
+    assert pyzfscmds.cmd.zfs_get(set_dataset, columns=["value"], properties=["atime"],
+                                 parsed=True)[0].value == "on"
@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+import pyzfscmds.cmd
+
+module_env = os.path.basename(__file__).upper().rsplit('.', 1)[0]
+if module_env in os.environ:
+    pytestmark = pytest.mark.skipif(
+        "false" in os.environ[module_env],
+        reason=f"Environment variable {module_env} specified test should be skipped.")
+
+"""zfs set command builder tests"""
+
+
+def test_zfs_set_multiple_commands():
+    commands = pyzfscmds.cmd._zfs_set_multiple_commands(
+        ["zpool/a", "zpool/b"], {"compression": "lz4", "atime": "off"})
+
+    assert [c._prepare_call() for c in commands] == [
+        ["zfs", "set", "compression=lz4", "atime=off", "zpool/a", "zpool/b"]]
+
+
+def test_zfs_set_multiple_commands_single_property():
+    commands = pyzfscmds.cmd._zfs_set_multiple_commands(
+        ["zpool/a"], {"compression": "lz4", "atime": "off"}, multi_property=False)
+
+    assert [c._prepare_call() for c in commands] == [
+        ["zfs", "set", "compression=lz4", "zpool/a"],
+        ["zfs", "set", "atime=off", "zpool/a"]]
+
+
+def test_zfs_set_multiple_commands_chunked():
+    targets = [f"zpool/{'x' * 200}{i}" for i in range(100000)]
+
+    commands = pyzfscmds.cmd._zfs_set_multiple_commands(targets, {"atime": "off"})
+
+    assert len(commands) > 1
+    assert sum(len(c.targets) - 1 for c in commands) == len(targets)
+
+
+@pytest.mark.parametrize("targets,properties", [
+    ([], {"atime": "off"}), (["zpool/a"], {})
+])
+def test_zfs_set_multiple_nothing_fails(targets, properties):
+    with pytest.raises(RuntimeError):
+        pyzfscmds.cmd._zfs_set_multiple_commands(targets, properties)
+
+
+def test_zfs_set_changes():
+    rows = [["zpool/a", "atime", "off"], ["zpool/a", "quota", "0"],
+            ["zpool/b", "atime", "on"], ["zpool/b", "quota", "0"],
+            ["zpool/c", "atime", "on"], ["zpool/c", "quota", "1024"]]
+
+    changes = pyzfscmds.cmd._zfs_set_changes(
+        ["zpool/a", "zpool/b", "zpool/c"], {"atime": "off", "quota": 0}, rows)
+
+    assert changes == {(("atime", "off"),): ["zpool/b"],
+                       (("atime", "off"), ("quota", 0)): ["zpool/c"]}
@@ -6,6 +6,7 @@ import os
 import pytest
 
 import pyzfscmds.cmd
+import pyzfscmds.utility
 
 module_env = os.path.basename(__file__).upper().rsplit('.', 1)[0]
 if module_env in os.environ:
@@ -65,3 +66,64 @@ def test_zfs_snapshot_successful(zpool, test_dataset, recursive, properties):
     """ Test will pass if snapshot successful"""
     pyzfscmds.cmd.zfs_snapshot("/".join([zpool, test_dataset]), snapname,
                                recursive=recursive, properties=properties)
+
+
+def test_zfs_snapshot_multiple_commands_per_pool():
+    commands = pyzfscmds.cmd._zfs_snapshot_multiple_commands(
+        ["zpool/a", "zpool/b", ("otherpool/c", "other")], snapname="snap")
+
+    assert [c._prepare_call() for c in commands] == [
+        ["zfs", "snapshot", "zpool/a@snap", "zpool/b@snap"],
+        ["zfs", "snapshot", "otherpool/c@other"]]
+
+
+def test_zfs_snapshot_multiple_commands_same_dataset():
+    commands = pyzfscmds.cmd._zfs_snapshot_multiple_commands(
+        [("zpool/a", "s1"), ("zpool/b", "s1"), ("zpool/a", "s2"), ("zpool/a", "s3")])
+
+    assert [c.targets for c in commands] == [
+        ["zpool/a@s1", "zpool/b@s1"], ["zpool/a@s2"], ["zpool/a@s3"]]
+
+
+def test_zfs_snapshot_multiple_commands_recursive_nested():
+    commands = pyzfscmds.cmd._zfs_snapshot_multiple_commands(
+        ["zpool/a", "zpool/a/b", "zpool/ab", "zpool/c/d", "zpool/c"], snapname="snap",
+        recursive=True)
+
+    assert [c.targets for c in commands] == [
+        ["zpool/a@snap", "zpool/ab@snap", "zpool/c/d@snap"],
+        ["zpool/a/b@snap", "zpool/c@snap"]]
+
+
+def test_zfs_snapshot_multiple_commands_chunked():
+    targets = [f"zpool/{'x' * 200}{i}" for i in range(100000)]
+
+    commands = pyzfscmds.cmd._zfs_snapshot_multiple_commands(targets, snapname="snap")
+
+    assert len(commands) > 1
+    assert sum(len(c.targets) for c in commands) == len(targets)
+    for command in commands:
+        size = sum(pyzfscmds.cmd._argument_size(a) for a in command._prepare_call())
+        assert size <= pyzfscmds.cmd._argument_space()
+
+
+def test_zfs_snapshot_multiple_name_fails():
+    with pytest.raises(TypeError):
+        pyzfscmds.cmd.zfs_snapshot_multiple(["zpool/a"])
+
+
+@require_zpool
+@require_test_dataset
+def test_zfs_snapshot_multiple_successful(zpool, test_dataset):
+    snapname = f"pyzfscmds-{datetime.datetime.now().isoformat()}"
+    dataset = "/".join([zpool, test_dataset])
+
+    # Two snapshots of one dataset cannot be created in one zfs call
+    commands = pyzfscmds.cmd._zfs_snapshot_multiple_commands(
+        [(dataset, f"{snapname}-a"), (dataset, f"{snapname}-b")])
+    assert [len(c.targets) for c in commands] == [1, 1]
+
+    pyzfscmds.cmd.zfs_snapshot_multiple([(dataset, f"{snapname}-a"), (dataset, f"{snapname}-b")])
+
+    assert pyzfscmds.utility.is_snapshot(f"{dataset}@{snapname}-a")
+    assert pyzfscmds.utility.is_snapshot(f"{dataset}@{snapname}-b")
@@ -28,3 +28,11 @@ def test_zpool_set_successful(zpool, prop):
 
     assert prop[1] in pyzfscmds.cmd.zpool_get(pool=zpool,
                                               properties=[prop[0]])
+
+
+@require_zpool
+def test_zpool_get_json_matches_parsed(zpool):
+    properties = ["size", "health", "bootfs"]
+
+    assert pyzfscmds.cmd.zpool_get(pool=zpool, properties=properties, json_output=True) == \
+        pyzfscmds.cmd.zpool_get(pool=zpool, properties=properties, parsable=True, parsed=True)
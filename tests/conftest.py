@@ -40,6 +40,30 @@ def pytest_addoption(parser):
     parser.addoption("--zfs-version", action="store", default='0.7.0',
                      help="Specify zfs version (linux).")
 
+    parser.addoption("--simulated", action="store_true",
+                     help="Run commands against a simulated pool instead of zfs.")
+
+
+def pytest_configure(config):
+    if config.getoption("--simulated"):
+        import pyzfscmds.backend
+        import pyzfscmds.simulate
+
+        # Default to the pool layout created for Travis
+        if not config.option.zpool:
+            config.option.zpool = "zpool"
+        if not config.option.test_dataset:
+            config.option.test_dataset = "pyzfscmds/tests"
+
+        # Commands tests run with other programs still need to run
+        backend = pyzfscmds.simulate.SimulatedBackend(
+            fallback=pyzfscmds.backend.SubprocessBackend())
+        backend.create_pool(config.option.zpool)
+        pyzfscmds.backend.set_backend(backend)
+
+        pyzfscmds.cmd.zfs_create_dataset(f"{config.option.zpool}/ROOT/default",
+                                         create_parent=True)
+
 
 def pytest_runtest_setup(item):
     if 'require_root_dataset' in item.keywords and not item.config.getoption("--root-dataset"):
@@ -0,0 +1,125 @@
+"""asyncio wrapper tests"""
+
+import asyncio
+import inspect
+import os
+import subprocess
+import threading
+import time
+
+import pytest
+
+import pyzfscmds.aio
+import pyzfscmds.backend
+import pyzfscmds.capabilities
+import pyzfscmds.cmd
+
+module_env = os.path.basename(__file__).upper().rsplit('.', 1)[0]
+if module_env in os.environ:
+    pytestmark = pytest.mark.skipif(
+        "false" in os.environ[module_env],
+        reason=f"Environment variable {module_env} specified test should be skipped.")
+
+require_zpool = pytest.mark.require_zpool
+require_test_dataset = pytest.mark.require_test_dataset
+
+
+def test_aio_wrapper_signature():
+    assert inspect.iscoroutinefunction(pyzfscmds.aio.zfs_snapshot)
+    assert inspect.signature(pyzfscmds.aio.zfs_snapshot) == inspect.signature(
+        pyzfscmds.cmd.zfs_snapshot)
+
+
+def test_aio_run_command():
+    command = pyzfscmds.cmd._Command("%s\t%s\n", main_command="printf", targets=["a", "1"])
+
+    assert asyncio.run(pyzfscmds.aio._run_command(command)) == "a\t1\n"
+
+
+def test_aio_run_command_output_modes():
+    def run(output):
+        command = pyzfscmds.cmd._Command("out", main_command="printf")
+        command.output = output
+        return asyncio.run(pyzfscmds.aio._run_command(command))
+
+    assert run(pyzfscmds.backend.OUTPUT_DISCARD) == ""
+    assert run(pyzfscmds.backend.OUTPUT_BYTES) == b"out"
+
+
+def test_aio_run_command_failure():
+    command = pyzfscmds.cmd._Command("", main_command="false")
+
+    with pytest.raises(subprocess.CalledProcessError):
+        asyncio.run(pyzfscmds.aio._run_command(command))
+
+
+def test_aio_run_iter():
+    command = pyzfscmds.cmd._Command("%s\t%s\n", main_command="printf",
+                                     targets=["a", "1", "b", "2"])
+
+    async def collect():
+        return [row async for row in pyzfscmds.aio._run_iter(command)]
+
+    assert asyncio.run(collect()) == [["a", "1"], ["b", "2"]]
+
+
+def test_aio_json_rows():
+    output = '{"output_version": {}, "datasets": {"a": {"properties": {}}, "b": {}}}'
+    command = pyzfscmds.cmd._Command("%s", main_command="printf", targets=[output])
+
+    async def collect():
+        return [row async for row in pyzfscmds.aio._json_rows(
+            command, "datasets", lambda name, entry: [[name]])]
+
+    assert asyncio.run(collect()) == [["a"], ["b"]]
+
+
+def test_aio_cancel_kills_process():
+    command = pyzfscmds.cmd._Command("10", main_command="sleep")
+
+    async def cancel():
+        await asyncio.wait_for(pyzfscmds.aio._run_command(command), timeout=0.1)
+
+    start = time.monotonic()
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(cancel())
+
+    assert time.monotonic() - start < 5
+
+
+def test_aio_detect_off_event_loop(monkeypatch):
+    probes = []
+
+    def probe_version():
+        probes.append(threading.current_thread())
+        return "zfs-2.3.0-1"
+
+    monkeypatch.setattr(pyzfscmds.capabilities, "_probe_version", probe_version)
+    pyzfscmds.capabilities.clear()
+    try:
+        assert asyncio.run(pyzfscmds.aio._json_supported(True))
+        assert asyncio.run(pyzfscmds.aio._detect()).version == "2.3.0"
+    finally:
+        pyzfscmds.capabilities.clear()
+
+    assert len(probes) == 1
+    assert probes[0] is not threading.current_thread()
+
+
+def test_aio_validation_errors():
+    with pytest.raises(TypeError):
+        asyncio.run(pyzfscmds.aio.zfs_snapshot("zpool/dataset", None))
+
+
+def test_aio_destroy_snapshots_estimate_other_dataset_fails():
+    with pytest.raises(RuntimeError, match="is not of"):
+        asyncio.run(pyzfscmds.aio.zfs_destroy_snapshots_estimate("zpool/dataset",
+                                                                 ["zpool/other@snap"]))
+
+
+@require_zpool
+@require_test_dataset
+def test_aio_zfs_list_matches_list(zpool, test_dataset):
+    target = "/".join([zpool, test_dataset])
+
+    assert asyncio.run(pyzfscmds.aio.zfs_list(target)) == pyzfscmds.cmd.zfs_list(target)
@@ -0,0 +1,267 @@
+"""Execution backend tests"""
+
+import asyncio
+import os
+import subprocess
+
+import pytest
+
+import pyzfscmds.aio
+import pyzfscmds.backend
+import pyzfscmds.cmd
+
+module_env = os.path.basename(__file__).upper().rsplit('.', 1)[0]
+if module_env in os.environ:
+    pytestmark = pytest.mark.skipif(
+        "false" in os.environ[module_env],
+        reason=f"Environment variable {module_env} specified test should be skipped.")
+
+
+def printf_command(*values) -> pyzfscmds.cmd._Command:
+    return pyzfscmds.cmd._Command("%s\\n", [], targets=list(values), main_command="printf")
+
+
+@pytest.fixture
+def backend():
+    """Restore the process wide backend after a test replaces it"""
+    previous = pyzfscmds.backend.get_backend()
+    yield
+    pyzfscmds.backend.set_backend(previous)
+
+
+def test_subprocess_backend_run():
+    result = pyzfscmds.backend.SubprocessBackend().run(["printf", "%s", "out"])
+
+    assert (result.returncode, result.stdout) == (0, "out")
+
+
+def test_subprocess_backend_rusage():
+    result = pyzfscmds.backend.SubprocessBackend().run(["sh", "-c", "exit 3"])
+
+    assert result.returncode == 3
+    assert result.rusage.ru_utime >= 0
+
+
+def test_subprocess_backend_environment():
+    command = pyzfscmds.cmd._Command("-c", [], targets=["echo $PYZFSCMDS_TEST"],
+                                     main_command="sh",
+                                     env_variables_override={"PYZFSCMDS_TEST": "set"})
+
+    assert command.run() == "set\n"
+
+
+def test_record_replay(tmp_path):
+    recording = pyzfscmds.backend.RecordingBackend()
+
+    command = printf_command("a", "b")
+    command.backend = recording
+    assert command.run() == "a\nb\n"
+
+    path = str(tmp_path / "records.json")
+    recording.save(path)
+
+    replay = pyzfscmds.backend.ReplayBackend.load(path)
+    command = printf_command("a", "b")
+    command.backend = replay
+
+    assert command.run() == "a\nb\n"
+    assert list(command.run_iter()) == [["a"], ["b"]]
+
+
+def test_replay_order():
+    argv = ["zfs", "list"]
+    replay = pyzfscmds.backend.ReplayBackend([
+        subprocess.CompletedProcess(argv, 0, "first\n", ""),
+        subprocess.CompletedProcess(argv, 1, "", "second\n")])
+
+    assert replay.run(argv).stdout == "first\n"
+    assert replay.run(argv).stderr == "second\n"
+    # The last result repeats
+    assert replay.run(argv).returncode == 1
+
+
+def test_replay_unrecorded_fails():
+    replay = pyzfscmds.backend.ReplayBackend([])
+
+    with pytest.raises(RuntimeError):
+        replay.run(["zfs", "list"])
+
+
+def test_replay_failure_raises(backend):
+    argv = ["zfs", "destroy", "zpool/a"]
+    pyzfscmds.backend.set_backend(pyzfscmds.backend.ReplayBackend([
+        subprocess.CompletedProcess(argv, 1, "", "cannot open 'zpool/a'\n")]))
+
+    with pytest.raises(RuntimeError):
+        pyzfscmds.cmd.zfs_destroy("zpool/a")
+
+
+def test_set_backend(backend):
+    replay = pyzfscmds.backend.ReplayBackend([])
+
+    previous = pyzfscmds.backend.set_backend(replay)
+
+    assert pyzfscmds.backend.get_backend() is replay
+    assert pyzfscmds.backend.set_backend(previous) is replay
+
+
+def test_replay_async(backend):
+    argv = ["zfs", "list", "-H", "-o", "name", "zpool"]
+    pyzfscmds.backend.set_backend(pyzfscmds.backend.ReplayBackend([
+        subprocess.CompletedProcess(argv, 0, "zpool\n", "")]))
+
+    async def rows():
+        command = pyzfscmds.cmd._zfs_list_command("zpool", columns=["name"])
+        return [row async for row in pyzfscmds.aio._run_iter(command)]
+
+    assert asyncio.run(rows()) == [["zpool"]]
+
+
+posix_spawn = pytest.mark.skipif(not hasattr(os, "posix_spawn"),
+                                 reason="os.posix_spawn is not available")
+
+
+@posix_spawn
+def test_posix_spawn_backend_run():
+    backend = pyzfscmds.backend.PosixSpawnBackend()
+
+    result = backend.run(["sh", "-c", "printf out; printf err >&2; exit 3"])
+
+    assert (result.returncode, result.stdout, result.stderr) == (3, "out", "err")
+    assert result.rusage.ru_utime >= 0
+
+
+@posix_spawn
+def test_posix_spawn_backend_missing_program():
+    with pytest.raises(FileNotFoundError):
+        pyzfscmds.backend.PosixSpawnBackend().run(["pyzfscmds-missing-program"])
+
+
+@posix_spawn
+def test_posix_spawn_backend_environment():
+    backend = pyzfscmds.backend.PosixSpawnBackend(
+        dict(os.environ, PYZFSCMDS_BASE="base"))
+    command = pyzfscmds.cmd._Command("-c", [], targets=["echo $PYZFSCMDS_BASE $PYZFSCMDS_TEST"],
+                                     main_command="sh",
+                                     env_variables_override={"PYZFSCMDS_TEST": "set"})
+    command.backend = backend
+
+    assert command.run() == "base set\n"
+    # Built once per set of overrides
+    assert backend.environment({"PYZFSCMDS_TEST": "set"}) is command._prepare_env()
+
+
+@posix_spawn
+def test_posix_spawn_backend_stream():
+    backend = pyzfscmds.backend.PosixSpawnBackend()
+
+    command = printf_command("a", "b")
+    command.backend = backend
+    assert list(command.run_iter()) == [["a"], ["b"]]
+
+    command = pyzfscmds.cmd._Command("-c", [], targets=["echo failed >&2; exit 2"],
+                                     main_command="sh")
+    command.backend = backend
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        list(command.run_iter())
+    assert error.value.stderr == "failed\n"
+
+
+@posix_spawn
+def test_posix_spawn_backend_stream_closed():
+    rows = pyzfscmds.backend.PosixSpawnBackend().stream(["yes"], None, lambda stdout: stdout)
+
+    assert next(rows) == "y\n"
+    rows.close()
+
+
+@pytest.mark.parametrize("backend_type", [
+    pyzfscmds.backend.SubprocessBackend,
+    pytest.param(pyzfscmds.backend.PosixSpawnBackend, marks=posix_spawn),
+])
+def test_run_output(backend_type):
+    backend = backend_type()
+    argv = ["sh", "-c", "printf out; printf err >&2"]
+
+    discarded = backend.run_output(argv, None, pyzfscmds.backend.OUTPUT_DISCARD)
+    raw = backend.run_output(argv, None, pyzfscmds.backend.OUTPUT_BYTES)
+    text = backend.run_output(argv, None, pyzfscmds.backend.OUTPUT_TEXT)
+
+    assert (discarded.stdout, discarded.stderr) == (None, "err")
+    assert (raw.stdout, raw.stderr) == (b"out", "err")
+    assert (text.stdout, text.stderr) == ("out", "err")
+    assert (discarded.output_bytes, raw.output_bytes, text.output_bytes) == (None, 3, 3)
+
+
+@pytest.mark.parametrize("backend_type", [
+    pyzfscmds.backend.SubprocessBackend,
+    pytest.param(pyzfscmds.backend.PosixSpawnBackend, marks=posix_spawn),
+])
+def test_run_output_async(backend_type):
+    backend = backend_type()
+    argv = ["sh", "-c", "printf out; printf err >&2"]
+
+    def run(output):
+        return asyncio.run(backend.run_output_async(argv, None, output))
+
+    discarded = run(pyzfscmds.backend.OUTPUT_DISCARD)
+    raw = run(pyzfscmds.backend.OUTPUT_BYTES)
+
+    assert (discarded.stdout, discarded.stderr, discarded.output_bytes) == (None, "err", None)
+    assert (raw.stdout, raw.stderr, raw.output_bytes) == (b"out", "err", 3)
+
+
+@pytest.mark.parametrize("backend_type", [
+    pyzfscmds.backend.SubprocessBackend,
+    pytest.param(pyzfscmds.backend.PosixSpawnBackend, marks=posix_spawn),
+])
+def test_output_bytes_counted_raw(backend_type):
+    argv = ["printf", r"caf\303\251"]
+
+    assert backend_type().run(argv).output_bytes == 5
+    assert asyncio.run(backend_type().run_async(argv)).output_bytes == 5
+
+
+def test_run_output_default():
+    argv = ["zfs", "snapshot", "zpool@snap"]
+    backend = pyzfscmds.backend.ReplayBackend([subprocess.CompletedProcess(argv, 0, "out", "")])
+
+    assert backend.run_output(argv, None, pyzfscmds.backend.OUTPUT_DISCARD).stdout is None
+    assert backend.run_output(argv, None, pyzfscmds.backend.OUTPUT_BYTES).stdout == b"out"
+
+
+def test_command_output_modes():
+    command = printf_command("a", "b")
+
+    command.output = pyzfscmds.backend.OUTPUT_BYTES
+    assert command.run() == b"a\nb\n"
+
+    command.output = pyzfscmds.backend.OUTPUT_DISCARD
+    assert command.run() == ""
+
+    command.output = pyzfscmds.backend.OUTPUT_STREAM
+    assert "".join(command.run()) == "a\nb\n"
+
+
+def test_command_discarded_failure():
+    command = pyzfscmds.cmd._Command("-c", [], targets=["echo out; echo failed >&2; exit 1"],
+                                     main_command="sh")
+    command.output = pyzfscmds.backend.OUTPUT_DISCARD
+
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        command.run()
+
+    assert (error.value.output, error.value.stderr) == ("", "failed\n")
+
+
+def test_wrapper_output_defaults():
+    discard = pyzfscmds.backend.OUTPUT_DISCARD
+
+    assert pyzfscmds.cmd._zfs_set_command("zpool", "atime=off").output == discard
+    assert pyzfscmds.cmd._zfs_snapshot_command("zpool", "snap").output == discard
+    assert pyzfscmds.cmd._zfs_mount_command("zpool").output == discard
+    assert pyzfscmds.cmd._zfs_destroy_command("zpool/a").output == discard
+    assert pyzfscmds.cmd._zfs_destroy_command("zpool/a", dry_run=True,
+                                              verbose=True).output != discard
+    assert pyzfscmds.cmd._zfs_mount_command().output != discard
+    assert pyzfscmds.cmd._zfs_list_command("zpool").output == pyzfscmds.backend.OUTPUT_TEXT
@@ -0,0 +1,84 @@
+"""Batch executor tests"""
+
+import os
+import threading
+import time
+
+import pytest
+
+import pyzfscmds.batch
+import pyzfscmds.cmd
+
+module_env = os.path.basename(__file__).upper().rsplit('.', 1)[0]
+if module_env in os.environ:
+    pytestmark = pytest.mark.skipif(
+        "false" in os.environ[module_env],
+        reason=f"Environment variable {module_env} specified test should be skipped.")
+
+require_zpool = pytest.mark.require_zpool
+require_test_dataset = pytest.mark.require_test_dataset
+
+
+def test_batch_results_in_order():
+    operations = [pyzfscmds.cmd._Command(f"{i}\n", main_command="printf") for i in range(20)]
+
+    result = pyzfscmds.batch.run_batch(operations, max_workers=4)
+
+    assert result.outputs == [f"{i}\n" for i in range(20)]
+    assert result.failed == 0
+    assert result.throughput > 0
+
+
+def test_batch_failure_does_not_abort():
+    operations = [pyzfscmds.cmd._Command("", main_command="true"),
+                  pyzfscmds.cmd._Command("", main_command="false"),
+                  pyzfscmds.cmd._Command("", main_command="true")]
+
+    result = pyzfscmds.batch.run_batch(operations)
+
+    assert isinstance(result[1].error, RuntimeError)
+    assert result.succeeded == 2
+
+    with pytest.raises(RuntimeError):
+        result.raise_on_error()
+
+
+def test_batch_fail_fast():
+    def fail():
+        raise RuntimeError("failed")
+
+    operations = [fail] + [lambda: "ok"] * 10
+
+    result = pyzfscmds.batch.run_batch(operations, max_workers=1, fail_fast=True)
+
+    assert all(isinstance(e, RuntimeError) for e in result.errors)
+    assert isinstance(result[-1].error, pyzfscmds.batch.BatchCancelled)
+
+
+def test_batch_pool_limit():
+    lock = threading.Lock()
+    running = {"now": 0, "max": 0}
+
+    def operation():
+        with lock:
+            running["now"] += 1
+            running["max"] = max(running["max"], running["now"])
+        time.sleep(0.01)
+        with lock:
+            running["now"] -= 1
+        return "ok"
+
+    pyzfscmds.batch.run_batch([operation] * 20, max_workers=8, max_in_flight_per_pool=2)
+
+    assert running["max"] <= 2
+
+
+@require_zpool
+@require_test_dataset
+def test_batch_snapshots(zpool, test_dataset):
+    dataset = "/".join([zpool, test_dataset])
+    snapname = f"pyzfscmds-batch-{time.time()}"
+    operations = [pyzfscmds.cmd._zfs_snapshot_command(dataset, f"{snapname}-{i}")
+                  for i in range(5)]
+
+    assert pyzfscmds.batch.run_batch(operations).failed == 0
@@ -0,0 +1,176 @@
+"""zfs list/get cache tests"""
+
+import asyncio
+import itertools
+import os
+import subprocess
+import time
+
+import pytest
+
+import pyzfscmds.aio
+import pyzfscmds.backend
+import pyzfscmds.cache
+import pyzfscmds.cmd
+import pyzfscmds.simulate
+
+module_env = os.path.basename(__file__).upper().rsplit('.', 1)[0]
+if module_env in os.environ:
+    pytestmark = pytest.mark.skipif(
+        "false" in os.environ[module_env],
+        reason=f"Environment variable {module_env} specified test should be skipped.")
+
+
+@pytest.fixture
+def cache():
+    yield pyzfscmds.cache.enable(ttl=60, maxsize=8)
+    pyzfscmds.cache.disable()
+
+
+@pytest.fixture
+def clone(cache):
+    """A simulated pool p with a clone p/c of p/a@s"""
+    backend = pyzfscmds.simulate.SimulatedBackend()
+    backend.create_pool("p")
+    previous = pyzfscmds.backend.set_backend(backend)
+
+    pyzfscmds.cmd.zfs_create_dataset("p/a")
+    pyzfscmds.cmd.zfs_snapshot("p/a", "s")
+    pyzfscmds.cmd.zfs_clone("p/a@s", "p/c")
+    yield backend
+    pyzfscmds.backend.set_backend(previous)
+
+
+@pytest.mark.parametrize("first,second,expected", [
+    ("zpool/ROOT", "zpool/ROOT", True),
+    ("zpool/ROOT", "zpool/ROOT/default", True),
+    ("zpool/ROOT/default@snap", "zpool/ROOT", True),
+    ("zpool/ROOT", "zpool/ROOTS", False),
+    ("zpool/ROOT/a", "zpool/ROOT/b", False),
+    ("zpool/ROOT/a", pyzfscmds.cache.EVERYTHING, True),
+])
+def test_cache_related(first, second, expected):
+    assert pyzfscmds.cache.related(first, second) is expected
+    assert pyzfscmds.cache.related(second, first) is expected
+
+
+def test_cache_lru_eviction(cache):
+    for i in range(10):
+        cache.put((i,), ["zpool"], str(i))
+
+    assert len(cache) == 8
+    assert cache.get((0,)) is None
+    assert cache.get((9,)) == "9"
+
+
+def test_cache_ttl_expiry():
+    cache = pyzfscmds.cache.CommandCache(ttl=0.01)
+    cache.put(("key",), ["zpool"], "value")
+
+    time.sleep(0.02)
+
+    assert cache.get(("key",)) is None
+
+
+def test_cache_invalidate_subtree(cache):
+    cache.put(("parent",), ["zpool/ROOT"], "parent")
+    cache.put(("child",), ["zpool/ROOT/default"], "child")
+    cache.put(("sibling",), ["zpool/data"], "sibling")
+    cache.put(("all",), [], "all")
+
+    cache.invalidate(["zpool/ROOT/default@snap"])
+
+    assert cache.get(("parent",)) is None
+    assert cache.get(("child",)) is None
+    assert cache.get(("all",)) is None
+    assert cache.get(("sibling",)) == "sibling"
+
+
+def test_command_run_cached(cache):
+    def read():
+        command = pyzfscmds.cmd._Command("+%s%N", main_command="date")
+        command.cache_datasets = ["zpool/ROOT"]
+        return command.run()
+
+    first = read()
+    assert read() == first
+
+    write = pyzfscmds.cmd._Command("", main_command="true")
+    write.invalidates = ["zpool/ROOT/default"]
+    write.run()
+
+    assert read() != first
+
+
+def test_cache_put_stale_generation(cache):
+    generation = cache.generation
+    cache.invalidate(["zpool/data"])
+
+    cache.put(("key",), ["zpool/ROOT"], "value", generation)
+
+    assert cache.get(("key",)) is None
+
+
+class _InterleavedBackend(pyzfscmds.backend.Backend):
+    """
+    Answers reads with a new value each time, running a write which
+    invalidates the cache while the first read is in flight
+    """
+
+    def __init__(self):
+        self.values = itertools.count()
+        self.interleaved = False
+
+    def run(self, argv, env=None):
+        if argv[0] == "read" and not self.interleaved:
+            self.interleaved = True
+            write = pyzfscmds.cmd._Command("write", main_command="write")
+            write.invalidates = ["zpool/ROOT/default"]
+            write.backend = self
+            write.run()
+
+        return subprocess.CompletedProcess(argv, 0, str(next(self.values)), "")
+
+
+def _read_command(backend) -> pyzfscmds.cmd._Command:
+    command = pyzfscmds.cmd._Command("", main_command="read")
+    command.cache_datasets = ["zpool/ROOT"]
+    command.backend = backend
+    return command
+
+
+def test_command_run_interleaved_write(cache):
+    backend = _InterleavedBackend()
+
+    first = _read_command(backend).run()
+
+    # The first read overlapped the write, its output was not stored
+    assert _read_command(backend).run() != first
+
+
+def test_aio_run_interleaved_write(cache):
+    backend = _InterleavedBackend()
+
+    async def read():
+        return await pyzfscmds.aio._run(_read_command(backend))
+
+    first = asyncio.run(read())
+
+    assert asyncio.run(read()) != first
+
+
+def test_cache_rename_invalidates_clone_origin(clone):
+    assert "p/a@s" in pyzfscmds.cmd.zfs_get("p/c", properties=["origin"])
+
+    pyzfscmds.cmd.zfs_rename("p/a", "p/b")
+
+    assert "p/b@s" in pyzfscmds.cmd.zfs_get("p/c", properties=["origin"])
+
+
+def test_cache_destroy_invalidates_origin_clones(clone):
+    pyzfscmds.cmd.zfs_rename("p/a", "p/b")
+    assert "p/c" in pyzfscmds.cmd.zfs_get("p/b@s", properties=["clones"])
+
+    pyzfscmds.cmd.zfs_destroy("p/c")
+
+    assert "p/c" not in pyzfscmds.cmd.zfs_get("p/b@s", properties=["clones"])
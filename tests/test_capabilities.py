@@ -0,0 +1,96 @@
+"""zfs capability detection tests"""
+
+import os
+
+import pytest
+
+import pyzfscmds.capabilities
+
+module_env = os.path.basename(__file__).upper().rsplit('.', 1)[0]
+if module_env in os.environ:
+    pytestmark = pytest.mark.skipif(
+        "false" in os.environ[module_env],
+        reason=f"Environment variable {module_env} specified test should be skipped.")
+
+require_zpool = pytest.mark.require_zpool
+
+
+@pytest.fixture
+def probe(monkeypatch):
+    """Replace probing with a fixed version, counting probes"""
+    probes = []
+
+    def probe_version():
+        probes.append(1)
+        return "zfs-2.1.5-1"
+
+    monkeypatch.setattr(pyzfscmds.capabilities, "_probe_version", probe_version)
+    pyzfscmds.capabilities.clear()
+    yield probes
+    pyzfscmds.capabilities.clear()
+
+
+@pytest.mark.parametrize("version,parsed", [
+    ("zfs-2.1.5-1ubuntu6~22.04.1", (2, 1, 5)),
+    ("zfs-kmod-0.8.3-1", (0, 8, 3)),
+    ("0.7.0", (0, 7, 0)),
+    ("2.2", (2, 2, 0)),
+    ("unknown", None)
+])
+def test_version_tuple(version, parsed):
+    assert pyzfscmds.capabilities.version_tuple(version) == parsed
+
+
+def test_from_version():
+    old = pyzfscmds.capabilities.from_version("0.6.5.11")
+    assert not old.multi_property_set and not old.json
+
+    current = pyzfscmds.capabilities.from_version("zfs-2.3.0-1")
+    assert current.version == "2.3.0"
+    assert current.multi_property_set and current.wait and current.json
+
+    unknown = pyzfscmds.capabilities.from_version(None)
+    assert unknown.version is None and not any(unknown[1:])
+
+
+def test_detect_once(probe):
+    first = pyzfscmds.capabilities.detect()
+    second = pyzfscmds.capabilities.detect()
+
+    assert first is second
+    assert first.version == "2.1.5"
+    assert len(probe) == 1
+
+
+def test_detected_never_probes(probe):
+    assert pyzfscmds.capabilities.detected() is None
+    assert len(probe) == 0
+
+    detected = pyzfscmds.capabilities.detect()
+    assert pyzfscmds.capabilities.detected() is detected
+    assert len(probe) == 1
+
+
+def test_detect_disk_cache(probe, tmp_path):
+    cache_file = str(tmp_path / "cache" / "capabilities.json")
+
+    pyzfscmds.capabilities.detect(cache_file=cache_file)
+    pyzfscmds.capabilities.clear()
+    assert pyzfscmds.capabilities.detect(cache_file=cache_file).version == "2.1.5"
+    assert len(probe) == 1
+
+
+def test_detect_disk_cache_key(probe, tmp_path, monkeypatch):
+    cache_file = str(tmp_path / "capabilities.json")
+
+    pyzfscmds.capabilities.detect(cache_file=cache_file)
+    pyzfscmds.capabilities.clear()
+    monkeypatch.setattr(pyzfscmds.capabilities, "_cache_key", lambda: [["zfs", 1]])
+    pyzfscmds.capabilities.detect(cache_file=cache_file)
+    assert len(probe) == 2
+
+
+@require_zpool
+def test_detect_installed():
+    pyzfscmds.capabilities.clear()
+    assert pyzfscmds.capabilities.detect().version is not None
@@ -0,0 +1,75 @@
+"""zfs dataset catalog tests"""
+
+import os
+
+import pytest
+
+import pyzfscmds.catalog
+
+module_env = os.path.basename(__file__).upper().rsplit('.', 1)[0]
+if module_env in os.environ:
+    pytestmark = pytest.mark.skipif(
+        "false" in os.environ[module_env],
+        reason=f"Environment variable {module_env} specified test should be skipped.")
+
+require_zpool = pytest.mark.require_zpool
+require_test_dataset = pytest.mark.require_test_dataset
+
+catalog_rows = [
+    ["zpool", "filesystem", "-", "/zpool"],
+    ["zpool/ROOT", "filesystem", "-", "none"],
+    ["zpool/ROOT/default", "filesystem", "-", "/"],
+    ["zpool/ROOT/default@install", "snapshot", "-", "-"],
+    ["zpool/ROOT/clone", "filesystem", "zpool/ROOT/default@install", "/"],
+    ["zpool/swap", "volume", "-", "-"],
+]
+
+
+@pytest.fixture
+def catalog():
+    return pyzfscmds.catalog.Catalog(rows=[list(r) for r in catalog_rows])
+
+
+def test_catalog_dataset_exists(catalog):
+    assert catalog.dataset_exists("zpool/ROOT/default")
+    assert not catalog.dataset_exists("zpool/swap")
+    assert catalog.dataset_exists("zpool/swap", zfs_type="volume")
+    assert not catalog.dataset_exists("zpool/missing")
+
+
+def test_catalog_is_snapshot(catalog):
+    assert catalog.is_snapshot("zpool/ROOT/default@install")
+    assert not catalog.is_snapshot("zpool/ROOT/default")
+    assert not catalog.is_snapshot("zpool/ROOT/default@missing")
+
+
+def test_catalog_is_clone(catalog):
+    assert catalog.is_clone("zpool/ROOT/clone")
+    assert not catalog.is_clone("zpool/ROOT/default")
+
+    with pytest.raises(RuntimeError):
+        catalog.is_clone("zpool/missing")
+
+
+def test_catalog_tree(catalog):
+    assert catalog.dataset_parent("zpool/ROOT/default") == "zpool/ROOT"
+    assert catalog.dataset_parent("zpool/missing") is None
+    assert catalog.dataset_child_name("zpool/ROOT/default") == "default"
+    assert catalog.snapshot_parent_dataset("zpool/ROOT/default@install") == "zpool/ROOT/default"
+    assert catalog.children("zpool/ROOT") == ["zpool/ROOT/default", "zpool/ROOT/clone"]
+    assert catalog.snapshots("zpool/ROOT/default") == ["zpool/ROOT/default@install"]
+
+
+def test_catalog_refresh(catalog):
+    catalog.refresh(rows=[["zpool", "filesystem", "-", "/zpool"]])
+
+    assert len(catalog) == 1
+    assert "zpool/ROOT" not in catalog
+
+
+@require_zpool
+@require_test_dataset
+def test_catalog_load(zpool, test_dataset):
+    catalog = pyzfscmds.catalog.Catalog(zpool)
+
+    assert catalog.dataset_exists("/".join([zpool, test_dataset]))
@@ -0,0 +1,103 @@
+"""Fork server backend tests"""
+
+import os
+import subprocess
+import threading
+
+import pytest
+
+import pyzfscmds.backend
+import pyzfscmds.cmd
+import pyzfscmds.forkserver
+
+module_env = os.path.basename(__file__).upper().rsplit('.', 1)[0]
+if module_env in os.environ:
+    pytestmark = pytest.mark.skipif(
+        "false" in os.environ[module_env],
+        reason=f"Environment variable {module_env} specified test should be skipped.")
+
+
+@pytest.fixture
+def server():
+    backend = pyzfscmds.forkserver.ForkServerBackend()
+    yield backend
+    backend.close()
+
+
+def test_run(server):
+    result = server.run(["sh", "-c", "printf out; printf err >&2; exit 3"])
+
+    assert (result.returncode, result.stdout, result.stderr) == (3, "out", "err")
+    assert result.rusage.ru_utime >= 0
+
+
+def test_missing_program(server):
+    with pytest.raises(FileNotFoundError):
+        server.run(["pyzfscmds-missing-program"])
+
+
+def test_environment(server):
+    command = pyzfscmds.cmd._Command("-c", [], targets=["echo $PYZFSCMDS_TEST"],
+                                     main_command="sh",
+                                     env_variables_override={"PYZFSCMDS_TEST": "set"})
+    command.backend = server
+
+    assert command.run() == "set\n"
+
+
+def test_stream(server):
+    command = pyzfscmds.cmd._Command("%s\\n", [], targets=["a", "b"], main_command="printf")
+    command.backend = server
+    assert list(command.run_iter()) == [["a"], ["b"]]
+
+    command = pyzfscmds.cmd._Command("-c", [], targets=["echo failed >&2; exit 2"],
+                                     main_command="sh")
+    command.backend = server
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        list(command.run_iter())
+    assert error.value.stderr == "failed\n"
+
+
+def test_stream_closed_kills(server):
+    rows = server.stream(["yes"], None, lambda stdout: stdout)
+
+    assert next(rows) == "y\n"
+    rows.close()
+
+
+def test_restarted_after_exit(server):
+    server.run(["true"])
+    server._process.kill()
+    server._process.wait()
+
+    assert server.run(["echo", "again"]).stdout == "again\n"
+
+
+def test_threads(server):
+    failures = []
+
+    def worker(thread):
+        for call in range(20):
+            expected = f"{thread}.{call}"
+            result = server.run(["printf", "%s", expected])
+            if (result.returncode, result.stdout) != (0, expected):
+                failures.append(result)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(32)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert failures == []
+
+
+def test_run_output(server):
+    argv = ["sh", "-c", "printf out; printf err >&2"]
+
+    discarded = server.run_output(argv, None, pyzfscmds.backend.OUTPUT_DISCARD)
+    raw = server.run_output(argv, None, pyzfscmds.backend.OUTPUT_BYTES)
+
+    assert (discarded.stdout, discarded.stderr) == (None, "err")
+    assert (raw.stdout, raw.stderr) == (b"out", "err")
+    assert (discarded.output_bytes, raw.output_bytes) == (None, 3)
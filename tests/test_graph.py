@@ -0,0 +1,92 @@
+"""zfs clone graph tests"""
+
+import os
+
+import pytest
+
+import pyzfscmds.graph
+
+module_env = os.path.basename(__file__).upper().rsplit('.', 1)[0]
+if module_env in os.environ:
+    pytestmark = pytest.mark.skipif(
+        "false" in os.environ[module_env],
+        reason=f"Environment variable {module_env} specified test should be skipped.")
+
+require_zpool = pytest.mark.require_zpool
+require_test_dataset = pytest.mark.require_test_dataset
+
+graph_rows = [
+    ["zpool", "filesystem", "-", "-", "1"],
+    ["zpool/ROOT", "filesystem", "-", "-", "2"],
+    ["zpool/ROOT/default", "filesystem", "-", "-", "3"],
+    ["zpool/ROOT/default/var", "filesystem", "-", "-", "4"],
+    ["zpool/ROOT/default@old", "snapshot", "-", "zpool/ROOT/old", "10"],
+    ["zpool/ROOT/default@install", "snapshot", "-", "zpool/ROOT/clone", "5"],
+    ["zpool/ROOT/default/var@install", "snapshot", "-", "", "5"],
+    ["zpool/ROOT/clone", "filesystem", "zpool/ROOT/default@install", "-", "6"],
+    ["zpool/ROOT/clone@update", "snapshot", "-", "zpool/ROOT/nested", "7"],
+    ["zpool/ROOT/nested", "filesystem", "zpool/ROOT/clone@update", "-", "8"],
+    ["zpool/ROOT/old", "filesystem", "zpool/ROOT/default@old", "-", "11"],
+]
+
+
+@pytest.fixture
+def graph():
+    return pyzfscmds.graph.CloneGraph(rows=[list(r) for r in graph_rows])
+
+
+def test_graph_origin(graph):
+    assert graph.origin("zpool/ROOT/clone") == "zpool/ROOT/default@install"
+    assert graph.origin("zpool/ROOT/default") is None
+    assert graph.is_clone("zpool/ROOT/nested")
+    assert graph.clones("zpool/ROOT/default@install") == ["zpool/ROOT/clone"]
+    assert graph.snapshots("zpool/ROOT/default") == ["zpool/ROOT/default@install",
+                                                     "zpool/ROOT/default@old"]
+
+    with pytest.raises(RuntimeError):
+        graph.origin("zpool/missing")
+
+
+def test_graph_dependents(graph):
+    dependents = graph.dependents("zpool/ROOT/default@install")
+
+    assert dependents == ["zpool/ROOT/nested", "zpool/ROOT/clone@update", "zpool/ROOT/clone"]
+
+
+def test_graph_dependents_order(graph):
+    dependents = graph.dependents("zpool/ROOT/default")
+
+    assert set(dependents) == {name for name, *_ in graph_rows
+                               if name.startswith("zpool/ROOT/")
+                               and name != "zpool/ROOT/default"}
+    for name in dependents:
+        if "@" not in name and graph.is_clone(name):
+            assert dependents.index(name) < dependents.index(graph.origin(name))
+
+
+def test_graph_descendants(graph):
+    assert graph.descendants("zpool/ROOT/default") == [
+        "zpool/ROOT/default/var@install", "zpool/ROOT/default/var",
+        "zpool/ROOT/default@install", "zpool/ROOT/default@old"]
+
+
+def test_graph_ancestors(graph):
+    assert graph.ancestors("zpool/ROOT/nested") == ["zpool/ROOT/clone@update",
+                                                    "zpool/ROOT/default@install"]
+    assert graph.ancestors("zpool/ROOT/default") == []
+
+
+def test_graph_promote(graph):
+    assert graph.promote_effect("zpool/ROOT/old") == ["zpool/ROOT/default@install",
+                                                      "zpool/ROOT/default@old"]
+    assert graph.promote_order("zpool/ROOT/default") == ["zpool/ROOT/old"]
+
+    with pytest.raises(RuntimeError):
+        graph.promote_effect("zpool/ROOT/default")
+
+
+@require_zpool
+def test_graph_loads(zpool):
+    graph = pyzfscmds.graph.CloneGraph(zpool)
+
+    assert zpool in graph
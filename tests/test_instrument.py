@@ -0,0 +1,188 @@
+"""Command instrumentation tests"""
+
+import asyncio
+import locale
+import os
+
+import pytest
+
+import pyzfscmds.aio
+import pyzfscmds.backend
+import pyzfscmds.cache
+import pyzfscmds.cmd
+import pyzfscmds.instrument
+import pyzfscmds.simulate
+
+module_env = os.path.basename(__file__).upper().rsplit('.', 1)[0]
+if module_env in os.environ:
+    pytestmark = pytest.mark.skipif(
+        "false" in os.environ[module_env],
+        reason=f"Environment variable {module_env} specified test should be skipped.")
+
+
+class Recorder(pyzfscmds.instrument.Hooks):
+
+    def __init__(self):
+        self.calls = []
+
+    def pre_exec(self, argv):
+        self.calls.append(("pre_exec", argv))
+
+    def post_exec(self, event):
+        self.calls.append(("post_exec", event))
+
+    def error(self, event):
+        self.calls.append(("error", event))
+
+
+@pytest.fixture
+def simulated():
+    backend = pyzfscmds.simulate.SimulatedBackend(
+        fallback=pyzfscmds.backend.SubprocessBackend())
+    backend.create_pool("tank")
+
+    previous = pyzfscmds.backend.set_backend(backend)
+    yield backend
+    pyzfscmds.backend.set_backend(previous)
+
+
+@pytest.fixture
+def hooks(simulated):
+    recorder = Recorder()
+    pyzfscmds.instrument.add_hooks(recorder)
+    yield recorder
+    pyzfscmds.instrument.remove_hooks(recorder)
+
+
+def test_no_hooks():
+    assert pyzfscmds.instrument.get_hooks() == ()
+    assert pyzfscmds.instrument.start(["zfs", "list"]) is None
+
+
+def test_hooks_post_exec(hooks):
+    output = pyzfscmds.cmd.zfs_list("tank", columns=["name"])
+
+    argv = ["zfs", "list", "-H", "-o", "name", "tank"]
+    assert [(name, value if name == "pre_exec" else value.argv) for name, value in hooks.calls] \
+        == [("pre_exec", argv), ("post_exec", argv)]
+
+    event = hooks.calls[1][1]
+    assert (event.returncode, event.output_bytes, event.error) == (0, len(output), None)
+    assert event.wall_time >= 0
+
+
+def test_hooks_error(hooks):
+    with pytest.raises(RuntimeError):
+        pyzfscmds.cmd.zfs_list("tank/missing")
+
+    name, event = hooks.calls[-1]
+    assert (name, event.returncode, event.error) == ("error", 1, None)
+
+
+def test_hooks_error_raised(hooks):
+    with pytest.raises(OSError):
+        pyzfscmds.cmd._Command("run", [], main_command="/nonexistent/pyzfscmds").run()
+
+    name, event = hooks.calls[-1]
+    assert name == "error"
+    assert isinstance(event.error, OSError)
+    assert event.returncode is None
+
+
+def test_hooks_cpu_time(hooks):
+    pyzfscmds.cmd._Command("-c", [], targets=["true"], main_command="sh").run()
+
+    assert hooks.calls[-1][1].cpu_time >= 0
+
+
+def test_hooks_output_bytes(hooks):
+    output = "caf\u00e9\n"
+    pyzfscmds.cmd._Command("%s", main_command="printf", targets=[output]).run()
+
+    encoded = output.encode(locale.getpreferredencoding(False))
+    assert hooks.calls[-1][1].output_bytes == len(encoded)
+
+
+def test_hooks_removed(hooks):
+    pyzfscmds.instrument.remove_hooks(hooks)
+    pyzfscmds.cmd.zfs_list("tank")
+
+    assert hooks.calls == []
+
+
+def test_hooks_cached(hooks):
+    pyzfscmds.cache.enable()
+    try:
+        pyzfscmds.cmd.zfs_list("tank")
+        pyzfscmds.cmd.zfs_list("tank")
+    finally:
+        pyzfscmds.cache.disable()
+
+    assert [name for name, _ in hooks.calls] == ["pre_exec", "post_exec"]
+
+
+def test_hooks_stream(hooks):
+    rows = list(pyzfscmds.cmd.zfs_list_iter("tank", columns=["name"]))
+
+    name, event = hooks.calls[-1]
+    assert rows == [["tank"]]
+    assert (name, event.returncode, event.output_bytes) == ("post_exec", 0, None)
+
+
+def test_hooks_stream_closed(hooks, simulated):
+    pyzfscmds.cmd.zfs_create_dataset("tank/a")
+
+    rows = pyzfscmds.cmd.zfs_list_iter("tank", recursive=True, columns=["name"])
+    next(rows)
+    rows.close()
+
+    name, event = hooks.calls[-1]
+    assert (name, event.returncode, event.error) == ("post_exec", None, None)
+
+
+def test_hooks_stream_error(hooks):
+    with pytest.raises(RuntimeError):
+        list(pyzfscmds.cmd.zfs_list_iter("tank/missing"))
+
+    name, event = hooks.calls[-1]
+    assert (name, event.returncode) == ("error", 1)
+
+
+def test_hooks_async(hooks):
+    asyncio.run(pyzfscmds.aio.zfs_list("tank"))
+
+    assert [name for name, _ in hooks.calls] == ["pre_exec", "post_exec"]
+
+
+def test_command_stats(simulated):
+    stats = pyzfscmds.instrument.CommandStats(buckets=[0.5, 1.0], slowest=2)
+    pyzfscmds.instrument.add_hooks(stats)
+    try:
+        pyzfscmds.cmd.zfs_create_dataset("tank/a")
+        pyzfscmds.cmd.zfs_list("tank")
+        pyzfscmds.cmd.zfs_list("tank/a")
+        with pytest.raises(RuntimeError):
+            pyzfscmds.cmd.zfs_list("tank/missing")
+    finally:
+        pyzfscmds.instrument.remove_hooks(stats)
+
+    summary = stats.summary()
+    listed = summary["zfs list"]
+
+    assert set(summary) == {"zfs create", "zfs list"}
+    assert (listed.calls, listed.errors) == (3, 1)
+    assert listed.buckets == [(0.5, 3), (1.0, 3), (float("inf"), 3)]
+    assert listed.max_wall_time <= stats.quantile("zfs list", 0.99) <= 0.5
+    assert stats.quantile("zfs destroy", 0.5) is None
+    assert len(stats.slowest()) == 2
+    assert "zfs list" in stats.report()
+
+    stats.reset()
+    assert stats.summary() == {}
+
+
+@pytest.mark.parametrize("argv,expected", [
+    (["zfs", "list", "-H"], "zfs list"), (["/sbin/zpool", "get"], "zpool get"), (["zfs"], "zfs"),
+])
+def test_subcommand(argv, expected):
+    assert pyzfscmds.instrument.subcommand(argv) == expected
@@ -0,0 +1,114 @@
+"""Prometheus metrics tests"""
+
+import os
+
+import pytest
+
+import pyzfscmds.backend
+import pyzfscmds.cmd
+import pyzfscmds.instrument
+import pyzfscmds.metrics
+import pyzfscmds.simulate
+
+module_env = os.path.basename(__file__).upper().rsplit('.', 1)[0]
+if module_env in os.environ:
+    pytestmark = pytest.mark.skipif(
+        "false" in os.environ[module_env],
+        reason=f"Environment variable {module_env} specified test should be skipped.")
+
+
+@pytest.fixture
+def stats():
+    """Commands run during the test, against simulated pools 'tank' and 'data'"""
+    backend = pyzfscmds.simulate.SimulatedBackend()
+    backend.create_pool("tank")
+    backend.create_pool("data")
+    previous = pyzfscmds.backend.set_backend(backend)
+
+    stats = pyzfscmds.instrument.CommandStats()
+    pyzfscmds.instrument.add_hooks(stats)
+    yield stats
+    pyzfscmds.instrument.remove_hooks(stats)
+
+    pyzfscmds.backend.set_backend(previous)
+
+
+def commands(stats) -> int:
+    return sum(summary.calls for summary in stats.summary().values())
+
+
+def test_render():
+    samples = [pyzfscmds.metrics.Sample("zfs_pool_capacity_ratio", (("pool", "tank"),), 0.57),
+               pyzfscmds.metrics.Sample("zfs_pool_capacity_ratio", (("pool", "a\"b\\"),), 1.0),
+               pyzfscmds.metrics.Sample("custom", (("dataset", "x\ny"),), 3)]
+
+    assert pyzfscmds.metrics.render(samples) == (
+        '# HELP zfs_pool_capacity_ratio Fraction of the pool allocated.\n'
+        '# TYPE zfs_pool_capacity_ratio gauge\n'
+        'zfs_pool_capacity_ratio{pool="tank"} 0.57\n'
+        'zfs_pool_capacity_ratio{pool="a\\"b\\\\"} 1\n'
+        '# TYPE custom gauge\n'
+        'custom{dataset="x\\ny"} 3\n')
+
+
+def test_collect(stats):
+    pyzfscmds.cmd.zfs_create_dataset("tank/a")
+    pyzfscmds.cmd.zfs_create_zvol("tank/vol", 16, size_suffix="M")
+
+    samples = {(s.name, s.labels): s.value for s in pyzfscmds.metrics.MetricsCollector().collect()}
+
+    assert samples[("zfs_pool_size_bytes", (("pool", "tank"),))] == 1 << 40
+    assert samples[("zfs_pool_health", (("pool", "data"), ("state", "ONLINE")))] == 1
+    assert samples[("zfs_pool_health", (("pool", "data"), ("state", "FAULTED")))] == 0
+    assert samples[("zfs_dataset_used_bytes",
+                    (("pool", "tank"), ("dataset", "tank/vol"), ("type", "volume")))] == 16 << 20
+    assert ("zfs_dataset_written_bytes",
+            (("pool", "data"), ("dataset", "data"), ("type", "filesystem"))) in samples
+
+
+def test_collect_bounded_commands(stats):
+    for i in range(50):
+        pyzfscmds.cmd.zfs_create_dataset(f"tank/d{i}")
+    stats.reset()
+
+    collector = pyzfscmds.metrics.MetricsCollector()
+    names = {s.labels[1][1] for s in collector.collect() if s.name == "zfs_dataset_used_bytes"}
+
+    assert len(names) == 52
+    assert set(stats.summary()) == {"zpool get", "zfs get"}
+    assert commands(stats) == 2
+
+
+def test_collect_interval(stats):
+    collector = pyzfscmds.metrics.MetricsCollector(interval=3600)
+    first = collector.render()
+
+    pyzfscmds.cmd.zfs_create_dataset("tank/a")
+    assert collector.render() == first
+    assert commands(stats) == 3
+
+    collector.clear()
+    assert "tank/a" in collector.render()
+
+    collector = pyzfscmds.metrics.MetricsCollector(interval=0)
+    collector.collect()
+    collector.collect()
+    assert commands(stats) == 9
+
+
+def test_collect_pools(stats):
+    collector = pyzfscmds.metrics.MetricsCollector(pools=["data"], datasets=False)
+
+    assert {s.labels[0] for s in collector.collect()} == {("pool", "data")}
+    assert commands(stats) == 1
+
+
+def test_write(stats, tmp_path):
+    path = str(tmp_path / "zfs.prom")
+    collector = pyzfscmds.metrics.MetricsCollector()
+
+    collector.write(path)
+
+    with open(path) as f:
+        assert f.read() == collector.render()
+    assert os.listdir(str(tmp_path)) == ["zfs.prom"]
@@ -0,0 +1,193 @@
+"""zfs output parser tests"""
+
+import os
+
+import pytest
+
+import pyzfscmds.parse
+
+module_env = os.path.basename(__file__).upper().rsplit('.', 1)[0]
+if module_env in os.environ:
+    pytestmark = pytest.mark.skipif(
+        "false" in os.environ[module_env],
+        reason=f"Environment variable {module_env} specified test should be skipped.")
+
+"""
+Tests for function: pyzfscmds.parse.parse_list_rows()
+"""
+
+
+def test_parse_list_rows_default_columns():
+    rows = [["zpool/ROOT", "1.5G", "10G", "96K", "none"]]
+
+    record, = pyzfscmds.parse.parse_list_rows(rows)
+
+    assert record.name == "zpool/ROOT"
+    assert record.used == "1.5G"
+    assert record.mountpoint == "none"
+
+
+def test_parse_list_rows_parsable():
+    rows = [["zpool/ROOT@snap", "4096", "-", "98304", "1528416000", "42"]]
+    columns = ["name", "used", "avail", "refer", "creation", "createtxg"]
+
+    record, = pyzfscmds.parse.parse_list_rows(rows, columns=columns, parsable=True)
+
+    assert record == ("zpool/ROOT@snap", 4096, None, 98304, 1528416000, 42)
+    assert record.createtxg == 42
+
+
+def test_parse_list_rows_user_property():
+    rows = [["zpool/ROOT", "on"]]
+
+    record, = pyzfscmds.parse.parse_list_rows(rows, columns=["name", "com.sun:auto-snapshot"])
+
+    assert record[1] == "on"
+
+
+def test_parse_list_rows_all_fails():
+    with pytest.raises(RuntimeError):
+        list(pyzfscmds.parse.parse_list_rows([], columns=["all"]))
+
+
+"""
+Tests for function: pyzfscmds.parse.parse_get_rows()
+"""
+
+
+@pytest.mark.parametrize("parsable,value", [(True, 98304), (False, "98304")])
+def test_parse_get_rows(parsable, value):
+    rows = [["zpool/ROOT", "referenced", "98304", "-"],
+            ["zpool/ROOT", "mountpoint", "none", "local"]]
+
+    records = list(pyzfscmds.parse.parse_get_rows(rows, parsable=parsable))
+
+    assert records[0].value == value
+    assert records[1] == pyzfscmds.parse.GetRecord("zpool/ROOT", "mountpoint", "none", "local")
+
+
+def test_parse_get_rows_value_column():
+    record, = pyzfscmds.parse.parse_get_rows([["-"]], columns=["value"], parsable=True)
+
+    assert record.value == "-"
+
+
+"""
+Tests for functions: pyzfscmds.parse.columnar_list_rows(), columnar_get_rows()
+"""
+
+
+def test_columnar_list_rows():
+    rows = [["zpool/ROOT@a", "4096", "-", "1528416000"],
+            ["zpool/ROOT@b", "8192", "-", "1528417000"]]
+    columns = ["name", "used", "avail", "creation"]
+
+    result = pyzfscmds.parse.columnar_list_rows(rows, columns=columns, parsable=True)
+
+    assert result.names == ["zpool/ROOT@a", "zpool/ROOT@b"]
+    assert result["used"].typecode == "q"
+    assert sum(result["used"]) == 12288
+    assert list(result["avail"]) == [pyzfscmds.parse.MISSING] * 2
+
+
+def test_columnar_list_rows_requires_name():
+    with pytest.raises(RuntimeError):
+        pyzfscmds.parse.columnar_list_rows([], columns=["used"])
+
+
+def test_columnar_get_rows_pivot():
+    rows = [["zpool/a", "used", "4096", "-"],
+            ["zpool/a", "mountpoint", "/a", "local"],
+            ["zpool/a@s", "used", "0", "-"],
+            ["zpool/b", "used", "8192", "-"],
+            ["zpool/b", "mountpoint", "/b", "default"]]
+
+    result = pyzfscmds.parse.columnar_get_rows(rows, parsable=True)
+
+    assert len(result) == 3
+    assert list(result["used"]) == [4096, 0, 8192]
+    assert result["mountpoint"] == ["/a", None, "/b"]
+
+
+def test_columnar_to_numpy():
+    numpy = pytest.importorskip("numpy")
+    result = pyzfscmds.parse.columnar_list_rows([["zpool/a", "4096"], ["zpool/b", "1"]],
+                                                columns=["name", "used"], parsable=True)
+
+    assert result.to_numpy("used").sum() == 4097
+    assert result.to_numpy()["used"].dtype == numpy.int64
+
+
+def test_parse_destroy_dry_run():
+    output = "destroy\tzpool/ROOT@a\ndestroy\tzpool/ROOT@b\nreclaim\t8192\n"
+
+    estimate = pyzfscmds.parse.parse_destroy_dry_run(output)
+
+    assert estimate.destroyed == ["zpool/ROOT@a", "zpool/ROOT@b"]
+    assert estimate.reclaim == 8192
+
+
+json_list_output = """{"output_version": {"command": "zfs list", "vers_major": 0, "vers_minor": 1},
+ "datasets": {
+  "zpool/a": {"name": "zpool/a", "type": "FILESYSTEM", "pool": "zpool", "createtxg": 1,
+   "properties": {"used": {"value": 4096, "source": {"type": "NONE", "data": "-"}},
+                  "available": {"value": 8192, "source": {"type": "NONE", "data": "-"}},
+                  "mountpoint": {"value": "/a b", "source": {"type": "LOCAL", "data": "-"}},
+                  "quota": {"value": 0, "source": {"type": "DEFAULT", "data": "-"}}}},
+  "zpool/a/b": {"name": "zpool/a/b", "type": "FILESYSTEM", "pool": "zpool", "createtxg": 7,
+   "properties": {"used": {"value": 1, "source": {"type": "NONE", "data": "-"}},
+                  "available": {"value": 8192, "source": {"type": "NONE", "data": "-"}},
+                  "mountpoint": {"value": "/a b/b",
+                                 "source": {"type": "INHERITED", "data": "zpool/a"}},
+                  "quota": {"value": 1024, "source": {"type": "LOCAL", "data": "-"}}}}
+ }
+}
+"""
+
+
+@pytest.mark.parametrize("size", [1, 7, 64, 100000])
+def test_json_collection_parser_chunked(size):
+    parser = pyzfscmds.parse.JSONCollectionParser("datasets")
+
+    entries = []
+    for i in range(0, len(json_list_output), size):
+        entries.extend(parser.feed(json_list_output[i:i + size]))
+    entries.extend(parser.close())
+
+    assert [name for name, _ in entries] == ["zpool/a", "zpool/a/b"]
+    assert entries[1][1]["createtxg"] == 7
+
+
+def test_json_collection_parser_incomplete():
+    parser = pyzfscmds.parse.JSONCollectionParser("datasets")
+    parser.feed(json_list_output[:200])
+
+    with pytest.raises(RuntimeError):
+        parser.close()
+
+
+def test_json_list_rows_match_text():
+    columns = ["name", "type", "used", "avail", "mountpoint", "createtxg"]
+    text = [["zpool/a", "filesystem", "4096", "8192", "/a b", "1"],
+            ["zpool/a/b", "filesystem", "1", "8192", "/a b/b", "7"]]
+
+    rows = list(pyzfscmds.parse.json_rows(
+        [json_list_output], "datasets",
+        lambda name, entry: [pyzfscmds.parse.json_list_row(name, entry, columns)]))
+
+    assert rows == text
+    assert list(pyzfscmds.parse.parse_list_rows(rows, columns, parsable=True)) == \
+        list(pyzfscmds.parse.parse_list_rows(text, columns, parsable=True))
+
+
+def test_json_get_rows_match_text():
+    columns = list(pyzfscmds.parse.GET_DEFAULT_COLUMNS)
+
+    rows = list(pyzfscmds.parse.json_rows(
+        [json_list_output], "datasets",
+        lambda name, entry: pyzfscmds.parse.json_get_rows(name, entry, columns)))
+
+    assert rows[2] == ["zpool/a", "mountpoint", "/a b", "local"]
+    assert rows[3] == ["zpool/a", "quota", "0", "default"]
+    assert rows[6] == ["zpool/a/b", "mountpoint", "/a b/b", "inherited from zpool/a"]
+    assert pyzfscmds.parse.parse_get_rows(rows, columns, parsable=True).__next__().value == 4096
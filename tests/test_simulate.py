@@ -0,0 +1,323 @@
+"""Simulated zfs backend tests"""
+
+import json
+import os
+
+import pytest
+
+import pyzfscmds.backend
+import pyzfscmds.cmd
+import pyzfscmds.graph
+import pyzfscmds.simulate
+
+module_env = os.path.basename(__file__).upper().rsplit('.', 1)[0]
+if module_env in os.environ:
+    pytestmark = pytest.mark.skipif(
+        "false" in os.environ[module_env],
+        reason=f"Environment variable {module_env} specified test should be skipped.")
+
+
+@pytest.fixture
+def simulated():
+    """A simulated pool 'tank' used by every command during the test"""
+    backend = pyzfscmds.simulate.SimulatedBackend()
+    backend.create_pool("tank")
+
+    previous = pyzfscmds.backend.set_backend(backend)
+    yield backend
+    pyzfscmds.backend.set_backend(previous)
+
+
+def names(target="tank", zfs_types=None):
+    return [r[0] for r in pyzfscmds.cmd.zfs_list_iter(target, recursive=True, columns=["name"],
+                                                      zfs_types=zfs_types)]
+
+
+@pytest.mark.parametrize("value,expected", [
+    (0, "0B"), (512, "512B"), (1024, "1K"), (1536, "1.50K"), (98304, "96K"),
+    (10 * 1024 ** 3 + 1, "10.0G"), (1 << 40, "1T"),
+])
+def test_nicenum(value, expected):
+    assert pyzfscmds.simulate._nicenum(value) == expected
+
+
+@pytest.mark.parametrize("value,expected", [
+    ("512", 512), ("4K", 4096), ("4KB", 4096), ("1.5M", 1572864), ("-5K", None), ("x", None),
+])
+def test_parse_size(value, expected):
+    assert pyzfscmds.simulate._parse_size(value) == expected
+
+
+def test_simulated_version(simulated):
+    result = simulated.run(["zfs", "version"])
+
+    assert result.stdout.startswith(f"zfs-{simulated.version}")
+
+
+def test_simulated_list_order(simulated):
+    pyzfscmds.cmd.zfs_create_dataset("tank/a/b", create_parent=True)
+    pyzfscmds.cmd.zfs_create_dataset("tank/a-x")
+    pyzfscmds.cmd.zfs_snapshot("tank/a", "s1")
+    pyzfscmds.cmd.zfs_snapshot("tank/a", "s0")
+
+    # Names are compared as strings, snapshots follow their dataset oldest first
+    assert names(zfs_types=["all"]) == ["tank", "tank/a", "tank/a@s1", "tank/a@s0",
+                                        "tank/a-x", "tank/a/b"]
+    assert names() == ["tank", "tank/a", "tank/a-x", "tank/a/b"]
+    assert names("tank/a", zfs_types=["snapshot"]) == ["tank/a@s1", "tank/a@s0"]
+
+
+def test_simulated_list_table(simulated):
+    output = pyzfscmds.cmd.zfs_list("tank", scripting=False, columns=["name", "used"])
+
+    assert output.splitlines() == ["NAME  USED", "tank   96K"]
+
+
+def test_simulated_list_missing_fails(simulated):
+    with pytest.raises(RuntimeError):
+        pyzfscmds.cmd.zfs_list("tank/missing")
+
+
+def test_simulated_inheritance(simulated):
+    pyzfscmds.cmd.zfs_create_dataset("tank/a", properties=["mountpoint=/mnt", "user:tag=x",
+                                                           "compression=lz4"])
+    pyzfscmds.cmd.zfs_create_dataset("tank/a/b")
+
+    rows = pyzfscmds.cmd.zfs_get("tank/a/b", properties=["mountpoint", "compression",
+                                                         "user:tag", "atime"], parsed=True)
+
+    assert [(r.property, r.value, r.source) for r in rows] == [
+        ("mountpoint", "/mnt/b", "inherited from tank/a"),
+        ("compression", "lz4", "inherited from tank/a"),
+        ("user:tag", "x", "inherited from tank/a"),
+        ("atime", "on", "default")]
+
+    pyzfscmds.cmd.zfs_inherit("compression", "tank/a")
+
+    assert pyzfscmds.cmd.zfs_get("tank/a/b", properties=["compression"], columns=["value"]) == \
+        "off\n"
+
+
+def test_simulated_set_invalid_fails(simulated):
+    with pytest.raises(RuntimeError):
+        pyzfscmds.cmd.zfs_set("tank", "compression=fast")
+
+    with pytest.raises(RuntimeError):
+        pyzfscmds.cmd.zfs_set("tank", "used=1")
+
+
+def test_simulated_sizes(simulated):
+    pyzfscmds.cmd.zfs_create_zvol("tank/vol", 1, size_suffix="G")
+    pyzfscmds.cmd.zfs_create_zvol("tank/sparse", 1, size_suffix="G", sparse=True)
+
+    used = {r.name: r.used for r in pyzfscmds.cmd.zfs_list(
+        "tank", recursive=True, parsable=True, parsed=True, columns=["name", "used"])}
+
+    assert used["tank/vol"] == 1024 ** 3
+    assert used["tank/sparse"] == 57344
+    assert used["tank"] == 98304 + used["tank/vol"] + used["tank/sparse"]
+
+
+def test_simulated_used_consistent(simulated):
+    pyzfscmds.cmd.zfs_create_dataset("tank/a/b/c", create_parent=True)
+    pyzfscmds.cmd.zfs_create_zvol("tank/a/vol", 64, size_suffix="M")
+    pyzfscmds.cmd.zfs_snapshot("tank/a", "s", recursive=True)
+    pyzfscmds.cmd.zfs_clone("tank/a/b@s", "tank/x/clone", create_parent=True)
+    pyzfscmds.cmd.zfs_rename("tank/a/b", "tank/x/b")
+    pyzfscmds.cmd.zfs_promote("tank/x/clone")
+    pyzfscmds.cmd.zfs_set("tank/x/b", "refreservation=1M")
+    pyzfscmds.cmd.zfs_set("tank/a/vol", "volsize=128M")
+    pyzfscmds.cmd.zfs_rollback("tank/a/vol@s")
+    pyzfscmds.cmd.zfs_destroy("tank/x/b", recursive_children=True)
+
+    def used(dataset):
+        if dataset.type == "snapshot":
+            return 0
+        return simulated._own_used(dataset) + \
+            sum(used(simulated._datasets[c]) for c in dataset.children)
+
+    for dataset in simulated._datasets.values():
+        assert dataset.used == used(dataset), dataset.name
+
+
+def test_simulated_rename_snapshot_order(simulated):
+    pyzfscmds.cmd.zfs_create_dataset("tank/a")
+    for name in ("s0", "s1", "s2"):
+        pyzfscmds.cmd.zfs_snapshot("tank/a", name)
+
+    pyzfscmds.cmd.zfs_rename("tank/a@s1", "tank/a@renamed")
+
+    assert names("tank/a", zfs_types=["snapshot"]) == \
+        ["tank/a@s0", "tank/a@renamed", "tank/a@s2"]
+
+
+def test_simulated_destroy_children_fails(simulated):
+    pyzfscmds.cmd.zfs_create_dataset("tank/a/b", create_parent=True)
+
+    with pytest.raises(RuntimeError):
+        pyzfscmds.cmd.zfs_destroy("tank/a")
+
+    pyzfscmds.cmd.zfs_destroy("tank/a", recursive_children=True)
+
+    assert names() == ["tank"]
+
+
+def test_simulated_destroy_snapshot_ranges(simulated):
+    pyzfscmds.cmd.zfs_create_dataset("tank/a")
+    for i in range(6):
+        pyzfscmds.cmd.zfs_snapshot("tank/a", f"s{i}")
+
+    estimate = pyzfscmds.cmd.zfs_destroy_snapshots_estimate("tank/a", ["s1", "s2", "s3", "s5"])
+    assert estimate.destroyed == ["tank/a@s1", "tank/a@s2", "tank/a@s3", "tank/a@s5"]
+
+    pyzfscmds.cmd.zfs_destroy_snapshots("tank/a", ["s1", "s2", "s3", "s5"])
+
+    assert names("tank/a", zfs_types=["snapshot"]) == ["tank/a@s0", "tank/a@s4"]
+
+
+@pytest.mark.parametrize("targets,recursive", [
+    (["tank/a@s1", "tank/a@s2"], False),
+    (["tank/a@s1", "tank/a/b@s1"], True),
+])
+def test_simulated_snapshot_same_dataset_fails(simulated, targets, recursive):
+    pyzfscmds.cmd.zfs_create_dataset("tank/a/b", create_parent=True)
+
+    backend = pyzfscmds.backend.get_backend()
+    result = backend.run(["zfs", "snapshot"] + (["-r"] if recursive else []) + targets)
+
+    assert result.returncode != 0
+    assert "multiple snapshots of same fs not allowed" in result.stderr
+    assert names(zfs_types=["snapshot"]) == []
+
+
+def test_simulated_destroy_snapshots_recursive(simulated):
+    pyzfscmds.cmd.zfs_create_dataset("tank/fs/child", create_parent=True)
+    pyzfscmds.cmd.zfs_snapshot("tank/fs", "a", recursive=True)
+    pyzfscmds.cmd.zfs_snapshot("tank/fs/child", "childonly")
+    pyzfscmds.cmd.zfs_snapshot("tank/fs", "b", recursive=True)
+    pyzfscmds.cmd.zfs_snapshot("tank/fs", "c", recursive=True)
+
+    pyzfscmds.cmd.zfs_destroy_snapshots("tank/fs", ["a", "b", "c"], recursive_descendents=True)
+
+    assert names("tank/fs", zfs_types=["snapshot"]) == \
+        ["tank/fs/child@childonly"]
+
+
+def test_simulated_destroy_snapshots_wrong_order_fails(simulated):
+    pyzfscmds.cmd.zfs_create_dataset("tank/a")
+    for i in range(4):
+        pyzfscmds.cmd.zfs_snapshot("tank/a", f"s{i}")
+
+    with pytest.raises(RuntimeError):
+        pyzfscmds.cmd.zfs_destroy_snapshots("tank/a", ["s0", "s1", "s3"],
+                                            snapshot_order=["s0", "s1", "s3"])
+
+    assert len(names("tank/a", zfs_types=["snapshot"])) == 4
+
+
+def test_simulated_clone_promote(simulated):
+    pyzfscmds.cmd.zfs_create_dataset("tank/a")
+    pyzfscmds.cmd.zfs_snapshot("tank/a", "s0")
+    pyzfscmds.cmd.zfs_snapshot("tank/a", "s1")
+    pyzfscmds.cmd.zfs_snapshot("tank/a", "s2")
+    pyzfscmds.cmd.zfs_clone("tank/a@s1", "tank/c")
+
+    with pytest.raises(RuntimeError):
+        pyzfscmds.cmd.zfs_destroy("tank/a", recursive_children=True)
+
+    graph = pyzfscmds.graph.CloneGraph("tank")
+    assert graph.promote_order("tank/a") == ["tank/c"]
+
+    pyzfscmds.cmd.zfs_promote("tank/c")
+
+    graph = pyzfscmds.graph.CloneGraph("tank")
+    assert graph.origin("tank/c") is None
+    assert graph.origin("tank/a") == "tank/c@s1"
+    assert graph.snapshots("tank/c") == ["tank/c@s0", "tank/c@s1"]
+    assert graph.snapshots("tank/a") == ["tank/a@s2"]
+
+    pyzfscmds.cmd.zfs_destroy("tank/a", recursive_children=True)
+
+    assert names(zfs_types=["all"]) == ["tank", "tank/c", "tank/c@s0", "tank/c@s1"]
+
+
+def test_simulated_destroy_dependents(simulated):
+    pyzfscmds.cmd.zfs_create_dataset("tank/a")
+    pyzfscmds.cmd.zfs_snapshot("tank/a", "s")
+    pyzfscmds.cmd.zfs_clone("tank/a@s", "tank/c")
+
+    pyzfscmds.cmd.zfs_destroy("tank/a", recursive_dependents=True)
+
+    assert names(zfs_types=["all"]) == ["tank"]
+
+
+def test_simulated_rename(simulated):
+    pyzfscmds.cmd.zfs_create_dataset("tank/a/b", create_parent=True)
+    pyzfscmds.cmd.zfs_snapshot("tank/a/b", "s")
+    pyzfscmds.cmd.zfs_clone("tank/a/b@s", "tank/c")
+
+    pyzfscmds.cmd.zfs_rename("tank/a", "tank/x/y", create_parents=True)
+
+    assert names(zfs_types=["all"]) == ["tank", "tank/c", "tank/x", "tank/x/y", "tank/x/y/b",
+                                        "tank/x/y/b@s"]
+    assert pyzfscmds.cmd.zfs_get("tank/c", properties=["origin"], columns=["value"]) == \
+        "tank/x/y/b@s\n"
+
+
+def test_simulated_rollback(simulated):
+    pyzfscmds.cmd.zfs_create_dataset("tank/a")
+    pyzfscmds.cmd.zfs_snapshot("tank/a", "s0")
+    pyzfscmds.cmd.zfs_snapshot("tank/a", "s1")
+
+    with pytest.raises(RuntimeError):
+        pyzfscmds.cmd.zfs_rollback("tank/a@s0")
+
+    pyzfscmds.cmd.zfs_rollback("tank/a@s0", destroy_between=True)
+
+    assert names("tank/a", zfs_types=["snapshot"]) == ["tank/a@s0"]
+
+
+def test_simulated_mount(simulated):
+    pyzfscmds.cmd.zfs_create_dataset("tank/a", properties=["canmount=noauto"])
+
+    assert "tank/a" not in pyzfscmds.cmd.zfs_mount_list()
+
+    pyzfscmds.cmd.zfs_mount("tank/a")
+    assert "/tank/a" in pyzfscmds.cmd.zfs_mount_list()
+
+    with pytest.raises(RuntimeError):
+        pyzfscmds.cmd.zfs_mount("tank/a")
+
+    pyzfscmds.cmd.zfs_unmount("/tank/a")
+    assert "tank/a" not in pyzfscmds.cmd.zfs_mount_list()
+
+
+def test_simulated_json_list(simulated):
+    pyzfscmds.cmd.zfs_create_dataset("tank/a")
+    pyzfscmds.cmd.zfs_snapshot("tank/a", "s")
+
+    output = simulated.run(["zfs", "list", "-j", "--json-int", "-t", "all", "-o", "name,used",
+                            "tank/a@s"]).stdout
+    entry = json.loads(output)["datasets"]["tank/a@s"]
+
+    assert (entry["type"], entry["dataset"], entry["snapshot_name"]) == \
+        ("SNAPSHOT", "tank/a", "s")
+    assert entry["properties"]["used"] == {"value": 0, "source": {"type": "NONE", "data": "-"}}
+
+
+def test_simulated_zpool_get(simulated):
+    pyzfscmds.cmd.zpool_set("tank", "comment=simulated")
+
+    rows = pyzfscmds.cmd.zpool_get("tank", properties=["comment", "size"], parsable=True,
+                                   parsed=True)
+
+    assert [(r.property, r.value, r.source) for r in rows] == [
+        ("comment", "simulated", "local"), ("size", str(1 << 40), "-")]
+
+
+def test_simulated_fallback():
+    backend = pyzfscmds.simulate.SimulatedBackend(
+        fallback=pyzfscmds.backend.SubprocessBackend())
+
+    assert backend.run(["printf", "out"]).stdout == "out"
+    assert pyzfscmds.simulate.SimulatedBackend().run(["printf", "out"]).returncode == 127
@@ -1,7 +1,11 @@
 import os
+import subprocess
+import sys
 
 import pytest
 
+import pyzfscmds.system.agnostic
+
 module_env = os.path.basename(__file__).upper().rsplit('.', 1)[0]
 if module_env in os.environ:
     pytestmark = pytest.mark.skipif(
@@ -10,8 +14,38 @@ if module_env in os.environ:
 
 require_root_dataset = pytest.mark.require_root_dataset
 require_zpool_root_mountpoint = pytest.mark.require_zpool_root_mountpoint
+require_linux = pytest.mark.require_linux
 
 """zfs agnostic tests"""
 
 # def test_mount():
 #     pyzfscmds.system.a
+
+
+def test_import_is_lazy():
+    loaded = subprocess.check_output(
+        [sys.executable, "-c",
+         "import sys, pyzfscmds.cmd, pyzfscmds.logger; print(' '.join(sys.modules))"],
+        universal_newlines=True).split()
+
+    assert "pyzfscmds.system.linux" not in loaded
+    assert "pyzfscmds.system.freebsd" not in loaded
+    assert "logging.config" not in loaded
+    assert "tempfile" not in loaded
+    assert "json" not in loaded
+    assert "shutil" not in loaded
+    assert "pyzfscmds.instrument" not in loaded
+    assert "pyzfscmds.capabilities" not in loaded
+
+
+@require_linux
+def test_agnostic_binding():
+    assert pyzfscmds.system.agnostic._system() is pyzfscmds.system.linux
+
+
+@require_linux
+def test_agnostic_system_name():
+    assert pyzfscmds.system.agnostic.system == "linux"
+
+    with pytest.raises(AttributeError):
+        pyzfscmds.system.agnostic.missing
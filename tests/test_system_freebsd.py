@@ -39,3 +39,28 @@ def test_freebsd_dataset_mountpoint_failure():
 @require_zpool_root_mountpoint
 def test_freebsd_dataset_mountpoint(zpool_root_mountpoint, root_dataset):
     assert zpool_root_mountpoint == zfsfreebsd.dataset_mountpoint(root_dataset)
+
+
+mounts = [
+    "zpool/ROOT/default\t/\tzfs\trw,noatime\t0 0",
+    "devfs\t/dev\tdevfs\trw\t0 0",
+    "zpool/home\t/home\tzfs\trw\t0 0",
+    "zpool/spaces\t/mnt/with space\tzfs\trw\t0 0",
+]
+
+
+def test_freebsd_parse_mounts():
+    datasets, mountpoints = zfsfreebsd.parse_mounts(mounts)
+
+    assert datasets == {
+        "zpool/ROOT/default": "/",
+        "zpool/home": "/home",
+        "zpool/spaces": "/mnt/with space",
+    }
+    assert mountpoints["/home"] == "zpool/home"
+    assert "/dev" not in mountpoints
+
+
+@require_freebsd
+def test_freebsd_dataset_mountpoints():
+    assert zfsfreebsd.dataset_mountpoints(["garbage/dataset"]) == {"garbage/dataset": None}
@@ -41,3 +41,73 @@ def test_system_startup_check():
 @require_zpool_root_mountpoint
 def test_mount(root_dataset, zpool_root_mountpoint):
     assert zpool_root_mountpoint == pyzfscmds.system.linux.dataset_mountpoint(root_dataset)
+
+
+mounts = [
+    "zpool/ROOT/default / zfs rw,relatime,xattr,noacl 0 0",
+    "proc /proc proc rw,nosuid,nodev,noexec,relatime 0 0",
+    "zpool/home /home zfs rw,relatime,xattr,noacl 0 0",
+    "zpool/with\\040space /mnt/with\\040space zfs rw 0 0",
+    "zpool/back\\134slash /mnt/tab\\011here zfs rw 0 0",
+    "tmpfs /mnt/zfs tmpfs rw 0 0",
+]
+
+
+def test_parse_mounts():
+    datasets, mountpoints = zfslinux.parse_mounts(mounts)
+
+    assert datasets == {
+        "zpool/ROOT/default": "/",
+        "zpool/home": "/home",
+        "zpool/with space": "/mnt/with space",
+        "zpool/back\\slash": "/mnt/tab\there",
+    }
+    assert mountpoints["/mnt/with space"] == "zpool/with space"
+    assert "/mnt/zfs" not in mountpoints
+
+
+def test_mount_table(tmp_path):
+    path = tmp_path / "mounts"
+    path.write_text("\n".join(mounts[:2]) + "\n")
+
+    table = zfslinux.MountTable(str(path))
+    assert table.dataset_mountpoint("zpool/ROOT/default") == "/"
+    assert table.dataset_mountpoint("zpool/home") is None
+
+    path.write_text("\n".join(mounts) + "\n")
+    table.refresh()
+    assert table.mountpoint_dataset("/home") == "zpool/home"
+    assert table.dataset_mountpoints(["zpool/home", "zpool/missing"]) == {
+        "zpool/home": "/home", "zpool/missing": None}
+
+
+def test_mount_table_single_lock(tmp_path):
+    path = tmp_path / "mounts"
+    path.write_text("\n".join(mounts) + "\n")
+    table = zfslinux.MountTable(str(path))
+
+    acquired = []
+
+    class CountingLock:
+        def __init__(self, lock):
+            self.lock = lock
+
+        def __enter__(self):
+            acquired.append(1)
+            return self.lock.__enter__()
+
+        def __exit__(self, *exc_info):
+            return self.lock.__exit__(*exc_info)
+
+    table._lock = CountingLock(table._lock)
+
+    assert table.dataset_mountpoint("zpool/home") == "/home"
+    assert len(acquired) == 1
+
+
+@require_linux
+def test_mount_table_system():
+    table = zfslinux.MountTable()
+
+    assert table.mountpoint_dataset("/garbage/mountpoint") is None
+    assert not table._stale()
@@ -129,3 +129,30 @@ def test_snapshot_parent_dataset(zpool, test_dataset):
     pyzfscmds.cmd.zfs_snapshot(dataset, snapname)
 
     assert zfs_utility.snapshot_parent_dataset(snapshot_dataset) == dataset
+
+
+"""
+Tests for function: pyzfscmds.utility.datasets_exist()
+"""
+
+
+@pytest.mark.parametrize("names,root,depth", [
+    (["zpool/a"], "zpool/a", 0),
+    (["zpool/a/b", "zpool/a/c"], "zpool/a", 1),
+    (["zpool/a/b@snap", "zpool/a/c/d"], "zpool/a", 2),
+    (["zpool@snap", "zpool/ROOT/default"], "zpool", 2),
+    (["zpool/a#mark"], "zpool/a", 1),
+    (["zpool/ab", "zpool/a/b"], "zpool", 2)
+])
+def test_datasets_exist_listing_root(names, root, depth):
+    assert zfs_utility._listing_root(names) == (root, depth)
+
+
+@require_zpool
+@require_test_dataset
+def test_datasets_exist(zpool, test_dataset):
+    dataset = f"{zpool}/{test_dataset}"
+    missing = f"{dataset}/pyzfscmds-missing-{datetime.datetime.now().isoformat()}"
+
+    assert zfs_utility.datasets_exist([dataset, missing, "pyzfscmds-missing-pool/a"]) == {
+        dataset: True, missing: False, "pyzfscmds-missing-pool/a": False}